@@ -0,0 +1,264 @@
+from array import array
+from collections import deque
+import heapq
+import math
+import threading
+
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+RETENTION = {"minute": 24 * 3600, "hour": 31 * 86400, "day": 366 * 86400}
+BATTERY_RETENTION = {"minute": 6 * 3600, "hour": 7 * 86400, "day": 366 * 86400}
+LEVELS = ("day", "hour", "minute")   # от крупного разрешения к мелкому
+PERIODS = {"hour": 3600, "day": 86400, "week": 7 * 86400, "month": 30 * 86400, "year": 365 * 86400}
+
+
+class _Buckets:
+    """Корзины одного устройства в одном разрешении: values[i] — корзина номер base + i."""
+
+    __slots__ = ("base", "values", "complete")
+
+    def __init__(self, number, empty):
+        self.base = number
+        self.values = array("d", (empty,))
+        self.complete = None   # номер корзины, с которой данные полные (более ранние обрезаны); None — все
+
+    def covers(self, number):
+        return self.complete is None or number >= self.complete
+
+    def get(self, number):
+        index = number - self.base
+        return self.values[index] if 0 <= index < len(self.values) else 0.0
+
+    def sum(self, first, last):
+        """Сумма корзин с номерами [first, last)."""
+        start, stop = max(first - self.base, 0), min(last - self.base, len(self.values))
+        return sum(self.values[start:stop]) if stop > start else 0.0
+
+
+class RollupSeries:
+    """Временной ряд одной метрики, сразу свёрнутый по минутам, часам и дням.
+
+    Каждое значение раскладывается по корзинам всех разрешений при записи. Корзины устройства —
+    массив чисел подряд по времени (не больше срока хранения), поэтому запрос за неделю складывает
+    целые дни, а неполные дни по краям диапазона — часами и минутами.
+    gauge=True — корзина хранит последнее значение (заряд), а не сумму; пустая корзина — NaN.
+    """
+
+    def __init__(self, retention=RETENTION, gauge=False):
+        self.retention = retention
+        self.gauge = gauge
+        self.empty = math.nan if gauge else 0.0
+        self.capacity = {resolution: retention[resolution] // size for resolution, size in RESOLUTIONS.items()}
+        self.devices = {}   # устройство -> {разрешение: _Buckets}
+
+    def add(self, device, moment, value):
+        for resolution, size in RESOLUTIONS.items():
+            slot = self.__slot(device, resolution, int(moment // size))
+            if slot is not None:
+                slot[0].values[slot[1]] += value
+
+    def set(self, device, moment, value):
+        """Значение gauge-ряда на момент moment."""
+        for resolution, size in RESOLUTIONS.items():
+            slot = self.__slot(device, resolution, int(moment // size))
+            if slot is not None:
+                slot[0].values[slot[1]] = value
+
+    def add_interval(self, device, start, end, rate):
+        """Распределяет rate * длительность по корзинам, которые пересекает интервал [start, end)."""
+        for resolution, size in RESOLUTIONS.items():
+            moment = start
+            while moment < end:
+                number = int(moment // size)
+                part_end = min(end, (number + 1) * size)
+                slot = self.__slot(device, resolution, number)
+                if slot is not None:
+                    slot[0].values[slot[1]] += (part_end - moment) * rate
+                moment = part_end
+
+    def totals(self, since, until, devices=None):
+        if devices is None:
+            items = self.devices.items()
+        else:
+            items = [(device, self.devices[device]) for device in devices if device in self.devices]
+        # Разбиение диапазона одно на все устройства: мелкие корзины — там, где они ещё в сроке хранения
+        plan = self.__plan(since, until, lambda resolution, number: (
+            number >= until // RESOLUTIONS[resolution] - self.capacity[resolution]))
+        lowest = {}
+        for resolution, first, _, _ in plan:
+            lowest[resolution] = min(first, lowest.get(resolution, first))
+        totals = {}
+        for device, buckets in items:
+            parts = plan
+            if not all(buckets[resolution].covers(number) for resolution, number in lowest.items()):
+                parts = self.__plan(since, until, lambda resolution, number: buckets[resolution].covers(number))
+            value = sum(buckets[resolution].sum(first, last) * share for resolution, first, last, share in parts)
+            if value:
+                totals[device] = value
+        return totals
+
+    def series(self, device, resolution, since):
+        buckets = self.devices.get(device, {}).get(resolution)
+        if buckets is None:
+            return []
+        size = RESOLUTIONS[resolution]
+        first = max(0, math.ceil(since / size) - buckets.base)
+        return [((buckets.base + index) * size, value) for index, value in enumerate(buckets.values[first:], first)
+                if value == value and (value or self.gauge)]
+
+    def prune(self, now):
+        # Массивы обрезаются при записи, здесь убираем устройства без записей за весь срок хранения дней
+        # (он самый долгий)
+        oldest = (now - self.retention["day"]) // RESOLUTIONS["day"]
+        for device in [device for device, buckets in self.devices.items()
+                       if buckets["day"].base + len(buckets["day"].values) <= oldest]:
+            del self.devices[device]
+
+    def __slot(self, device, resolution, number):
+        """(корзины, индекс) корзины number; None — корзина уже вне срока хранения."""
+        buckets = self.devices.setdefault(device, {})
+        part = buckets.get(resolution)
+        if part is None:
+            part = buckets[resolution] = _Buckets(number, self.empty)
+            return part, 0
+        values = part.values
+        index = number - part.base
+        capacity = self.capacity[resolution]
+        if index > len(values) + capacity:
+            # Устройство долго молчало: всё записанное уже вне срока хранения
+            part.values = array("d", (self.empty,))
+            part.base = part.complete = number
+            return part, 0
+        if index >= len(values):
+            values.extend(array("d", (self.empty,)) * (index - len(values) + 1))
+            if len(values) > capacity + capacity // 4:
+                # Обрезаем пачкой, а не по корзине на запись; остаётся весь срок хранения до текущей корзины
+                drop = len(values) - capacity - 1
+                del values[:drop]
+                part.base += drop
+                part.complete = part.base
+                index -= drop
+        elif index < 0:
+            if not part.covers(number):
+                return None
+            values[0:0] = array("d", (self.empty,)) * -index
+            part.base = number
+            index = 0
+        return part, index
+
+    def __plan(self, since, until, covers, level=0, parts=None):
+        """Разбиение [since, until) на [(разрешение, первая корзина, после последней, доля)]: целые корзины
+        уровня level, края — корзинами следующего уровня, если covers(разрешение, номер) говорит, что они
+        есть, иначе долей корзины пропорционально времени."""
+        parts = [] if parts is None else parts
+        resolution = LEVELS[level]
+        size = RESOLUTIONS[resolution]
+        first, last = math.ceil(since / size), math.floor(until / size)
+        if first <= last:
+            if first < last:
+                parts.append((resolution, first, last, 1.0))
+            edges = ((since, first * size), (last * size, until))
+        else:
+            edges = ((since, until),)
+        finer = LEVELS[level + 1] if level + 1 < len(LEVELS) else None
+        for start, end in edges:
+            if start >= end:
+                continue
+            if finer is not None and covers(finer, math.floor(start / RESOLUTIONS[finer])):
+                self.__plan(start, end, covers, level + 1, parts)
+            else:
+                number = math.floor(start / size)
+                parts.append((resolution, number, number + 1, (end - start) / size))
+        return parts
+
+
+class MetricsStore:
+    """Энергия, время работы, заряд батарей и движение по каждому устройству."""
+
+    def __init__(self, clock, intervals_per_device=100):
+        self.clock = clock
+        self.energy = RollupSeries()      # Wh
+        self.runtime = RollupSeries()     # секунды во включённом состоянии
+        self.motion = RollupSeries()      # число срабатываний
+        self.battery = RollupSeries(BATTERY_RETENTION, gauge=True)  # заряд на момент замера, только при изменении
+        self.intervals = {}               # устройство -> последние интервалы (начало, конец) работы
+        self.intervals_per_device = intervals_per_device
+        self.__on_since = {}
+        self.__draw = {}                  # устройство -> фактическая мощность, если она не равна номинальной
+        self.__last_battery = {}
+        self.__lock = threading.Lock()
+
+    def status_changed(self, device, status):
+        now = self.clock()
+        with self.__lock:
+            if status == "On":
+                if device not in self.__on_since:
+                    self.__on_since[device] = now
+                    self.__draw.pop(device, None)   # как PowerMeter: номинал до первого замера мощности
+            else:
+                start = self.__on_since.pop(device, None)
+                if start is not None:
+                    self.__close(device, start, now)
+                    self.intervals.setdefault(device, deque(maxlen=self.intervals_per_device)).append((start, now))
+                self.__draw.pop(device, None)
+
+    def set_draw(self, draws):
+        """Фактическая мощность (устройство, ватты): энергия до этого момента считается по прежней."""
+        now = self.clock()
+        with self.__lock:
+            for device, watts in draws:
+                start = self.__on_since.get(device)
+                if start is not None:
+                    self.__close(device, start, now)
+                    self.__on_since[device] = now
+                    self.__draw[device] = watts
+
+    def motion_detected(self, device):
+        with self.__lock:
+            self.motion.add(device, self.clock(), 1)
+
+    def sample(self, devices):
+        """Периодический замер: закрывает открытые интервалы работы и записывает заряд батарей."""
+        now = self.clock()
+        with self.__lock:
+            for device, start in self.__on_since.items():
+                self.__close(device, start, now)
+                self.__on_since[device] = now
+            # Заряд записываем только у тех устройств, у которых он изменился с прошлого замера
+            for device in devices:
+                level = device._battery_level
+                if self.__last_battery.get(device) != level:
+                    self.__last_battery[device] = level
+                    self.battery.set(device, now, level)
+            for series in (self.energy, self.runtime, self.motion, self.battery):
+                series.prune(now)
+
+    def top(self, metric, period, devices=None, limit=10):
+        """Самые большие значения метрики (energy, runtime, motion) за последние period секунд."""
+        now = self.clock()
+        with self.__lock:
+            totals = getattr(self, metric).totals(now - period, now, devices)
+            if metric in ("energy", "runtime"):
+                # Добавляем ещё не записанную часть текущих интервалов работы
+                for device, start in self.__on_since.items():
+                    if devices is None or device in devices:
+                        seconds = now - max(start, now - period)
+                        value = seconds * self.__watts(device) / 3600 if metric == "energy" else seconds
+                        totals[device] = totals.get(device, 0) + value
+        return heapq.nlargest(limit, totals.items(), key=lambda item: item[1])
+
+    def battery_history(self, device, resolution="minute", period=3600):
+        with self.__lock:
+            return self.battery.series(device, resolution, self.clock() - period)
+
+    def forget(self, device):
+        self.status_changed(device, "Off")
+        with self.__lock:
+            self.__last_battery.pop(device, None)
+
+    def __close(self, device, start, end):
+        if end > start:
+            self.energy.add_interval(device, start, end, self.__watts(device) / 3600)
+            self.runtime.add_interval(device, start, end, 1)
+
+    def __watts(self, device):
+        return self.__draw.get(device, device.power_consumption)
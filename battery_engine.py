@@ -0,0 +1,129 @@
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # numpy не обязателен: без него SmartHome обновляет батареи по одному устройству
+    np = None
+
+
+class BatteryEvents:
+    """Устройства, пересёкшие пороги заряда за один тик."""
+
+    def __init__(self, fully_charged, low_battery, turned_off):
+        self.fully_charged = fully_charged
+        self.low_battery = low_battery
+        self.turned_off = turned_off
+
+    def __len__(self):
+        return len(self.fully_charged) + len(self.low_battery) + len(self.turned_off)
+
+
+class BatteryEngine:
+    """Хранит заряд, зарядку, статус и мощность устройств в массивах numpy и обновляет их за один тик."""
+
+    available = np is not None
+
+    LOW_BATTERY_LEVEL = 15
+    DRAIN_PER_TICK = 0.2
+    CHARGE_PER_TICK = 1
+
+    def __init__(self, capacity=1024):
+        if np is None:
+            raise RuntimeError("BatteryEngine requires numpy")
+        self.lock = threading.RLock()
+        self.level = np.full(capacity, 100.0)
+        self.charging = np.zeros(capacity, dtype=bool)
+        self.on = np.zeros(capacity, dtype=bool)
+        self.low_notified = np.zeros(capacity, dtype=bool)
+        self.power = np.zeros(capacity, dtype=np.int64)
+        self.active = np.zeros(capacity, dtype=bool)
+        self.devices = [None] * capacity
+        self.__free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def register(self, device):
+        with self.lock:
+            if not self.__free:
+                self.__grow()
+            slot = self.__free.pop()
+            # Пока устройство не подключено, значения берутся из его собственных полей
+            self.level[slot] = device._battery_level
+            self.charging[slot] = device._is_charging
+            self.on[slot] = device._status == "On"
+            self.low_notified[slot] = device._low_battery_notified
+            self.power[slot] = device.power_consumption
+            self.active[slot] = True
+            self.devices[slot] = device
+            device._battery_slot = slot
+            device._battery_engine = self
+        return slot
+
+    def unregister(self, device):
+        with self.lock:
+            slot = device._battery_slot
+            level = device._battery_level
+            is_charging = device._is_charging
+            status = device._status
+            low_notified = device._low_battery_notified
+
+            device._battery_engine = None
+            device._battery_slot = None
+            device._battery_level = level
+            device._is_charging = is_charging
+            device._status = status
+            device._low_battery_notified = low_notified
+
+            self.active[slot] = False
+            self.on[slot] = False
+            self.charging[slot] = False
+            self.devices[slot] = None
+            self.__free.append(slot)
+
+    def set(self, column, slot, value):
+        with self.lock:
+            getattr(self, column)[slot] = value
+
+    def active_power(self):
+        with self.lock:
+            return int(self.power[self.active & self.on].sum())
+
+    def tick(self):
+        """Один шаг update_battery() для всех устройств сразу. Возвращает BatteryEvents."""
+        with self.lock:
+            level = self.level
+            charge = self.active & self.charging & (level < 100)
+            drain = self.active & ~charge & self.on
+
+            level[charge] += self.CHARGE_PER_TICK
+            full = charge & (level >= 100)
+            level[full] = 100
+            self.charging[full] = False
+            self.low_notified[full] = False
+
+            level[drain] -= self.DRAIN_PER_TICK
+            empty = drain & (level <= 0)
+            level[empty] = 0
+            low = drain & ~empty & (level < self.LOW_BATTERY_LEVEL)
+            new_low = low & ~self.low_notified
+            self.low_notified[new_low] = True
+            self.low_notified[drain & ~empty & ~low] = False
+            # Выключение (turn_off) и сброс флага для empty делает само устройство
+
+            devices = self.devices
+            return BatteryEvents(
+                fully_charged=[devices[i] for i in np.flatnonzero(full)],
+                low_battery=[devices[i] for i in np.flatnonzero(new_low)],
+                turned_off=[devices[i] for i in np.flatnonzero(empty)],
+            )
+
+    def __grow(self):
+        old = len(self.level)
+        new = old * 2
+        self.level = np.concatenate([self.level, np.full(new - old, 100.0)])
+        for column in ("charging", "on", "low_notified", "power", "active"):
+            array = getattr(self, column)
+            setattr(self, column, np.concatenate([array, np.zeros(new - old, dtype=array.dtype)]))
+        self.devices.extend([None] * (new - old))
+        self.__free.extend(range(new - 1, old - 1, -1))
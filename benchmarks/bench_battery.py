@@ -0,0 +1,65 @@
+"""Тик батарей: BatteryEngine против update_battery() по одному устройству."""
+import random
+
+from common import *
+from battery_engine import BatteryEngine
+
+DEVICES = 100_000
+TICKS = 20
+
+
+def prepare(devices, seed):
+    rng = random.Random(seed)
+    for device in devices:
+        roll = rng.random()
+        if roll < 0.5:
+            device._status = "On"
+            device._battery_level = rng.choice((100, 15.4, 0.3, 50))
+        elif roll < 0.7:
+            device._is_charging = True
+            device._battery_level = rng.choice((98.5, 10, 99.9))
+
+
+def state(devices):
+    return [(d._battery_level, d._status, d._is_charging, d._low_battery_notified) for d in devices]
+
+
+def main():
+    if not BatteryEngine.available:
+        print("numpy is not installed, nothing to compare")
+        return
+
+    # Проверка: векторный движок даёт тот же результат, что и update_battery()
+    reference = make_devices(2_000)
+    batched = make_devices(2_000)
+    prepare(reference, seed=7)
+    prepare(batched, seed=7)
+    engine = BatteryEngine()
+    for device in batched:
+        engine.register(device)
+    for _ in range(300):
+        for device in reference:
+            device.update_battery()
+        events = engine.tick()
+        for device in events.turned_off:
+            device.battery_empty()
+    assert state(reference) == state(batched), "BatteryEngine diverged from update_battery()"
+    print("BatteryEngine matches update_battery() after 300 ticks")
+
+    devices = make_devices(DEVICES)
+    prepare(devices, seed=1)
+    per_object = timeit(lambda: [d.update_battery() for d in devices], repeat=TICKS)
+
+    devices = make_devices(DEVICES)
+    prepare(devices, seed=1)
+    engine = BatteryEngine()
+    for device in devices:
+        engine.register(device)
+    vectorized = timeit(engine.tick, repeat=TICKS)
+
+    print(f"{DEVICES} devices, one tick: update_battery() {per_object * 1e3:.1f} ms, "
+          f"BatteryEngine {vectorized * 1e3:.2f} ms ({per_object / vectorized:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
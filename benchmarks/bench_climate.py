@@ -0,0 +1,81 @@
+"""Тик модели климата: время шага для тысяч комнат против бюджета ClimateModel.budget.
+
+    python benchmarks/bench_climate.py [комнат,через,запятую]
+
+step — только векторный шаг модели, tick — шаг вместе с передачей изменившейся мощности в PowerMeter
+и MetricsStore (то, что делает фоновый цикл дома). Комнаты разогреваются с 20°C при 0°C на улице, поэтому в первых
+тиках мощность меняется почти у всех термостатов, а дальше — только у немногих.
+
+Бюджет должен выдерживать каждый тик, включая первые, поэтому вердикт — по самому долгому тику:
+OVER BUDGET, если хоть один тик дольше бюджета. В конце печатается, до скольких комнат бюджет выдержан.
+"""
+import random
+import statistics
+
+from common import *
+from climate import ClimateModel
+
+SIZES = [int(size) for size in sys.argv[1].split(",")] if len(sys.argv) > 1 else [1_000, 5_000, 10_000, 50_000]
+TICKS = 200
+SEED = 1
+
+
+def make_thermostats(count, rng):
+    thermostats = []
+    for i in range(count):
+        thermostat = Thermostat(f"Thermostat {i}", rng.choice((800, 1500, 2000)), "Wi-Fi")
+        thermostat._location = f"Room {i // 4}"
+        thermostat._floor = 1 + i % 4      # одна комната на термостат
+        thermostat._status = "On" if rng.random() < 0.9 else "Off"
+        thermostat.mode = rng.choice(MODES)
+        thermostat.temperature = rng.randrange(16, 27)
+        thermostats.append(thermostat)
+    return thermostats
+
+
+def main():
+    if not ClimateModel.available:
+        print("ClimateModel requires numpy.")
+        return
+    rng = random.Random(SEED)
+    print(f"{'rooms':>8} {'step p50, ms':>13} {'step max, ms':>13} {'tick p50, ms':>13} {'tick p99, ms':>13} "
+          f"{'tick max, ms':>13} {'changes/tick':>13} {'budget, ms':>11}")
+    supported = 0
+    for count in SIZES:
+        home = bench_home(simulated=True, speed=None)
+        with quiet():
+            home.add_devices(make_thermostats(count, rng))
+        model = home.climate
+        model.outdoor = 0.0
+
+        steps, ticks, changes = [], [], 0
+        for tick in range(TICKS):
+            now = float(tick)
+            started = time.perf_counter()
+            draws = model.step(now)
+            stepped = time.perf_counter()
+            home.power.set_draw(draws)
+            home.metrics.set_draw(draws)
+            finished = time.perf_counter()
+            steps.append(stepped - started)
+            ticks.append(finished - started)
+            changes += len(draws)
+        overruns = sum(tick > model.budget for tick in ticks)
+        if overruns:
+            verdict = f"OVER BUDGET ({overruns} of {TICKS} ticks)"
+        else:
+            verdict = "ok"
+            supported = max(supported, len(model))
+        p99 = sorted(ticks)[int(len(ticks) * 0.99)]
+        print(f"{len(model):>8} {statistics.median(steps) * 1e3:>13.3f} {max(steps) * 1e3:>13.3f} "
+              f"{statistics.median(ticks) * 1e3:>13.3f} {p99 * 1e3:>13.3f} {max(ticks) * 1e3:>13.3f} "
+              f"{changes / TICKS:>13.0f} {model.budget * 1e3:>11.1f}  {verdict}")
+        close_home(home)
+    if supported:
+        print(f"Every tick fits the {ClimateModel().budget * 1e3:.1f} ms budget up to {supported} rooms.")
+    else:
+        print("No measured size fits the budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Пропускная способность control_device: команд в секунду для типичной смеси команд."""
+import random
+
+from common import *
+
+COMMANDS = 20000
+
+
+def main():
+    rng = random.Random(1)
+    print(f"{'devices':>10} {'parse, us':>12} {'cold, cmd/s':>15} {'warm, cmd/s':>15} {'execute, cmd/s':>15}")
+    for count in (100, 10_000):
+        home, devices = build_home(count)
+        lines = []
+        for _ in range(COMMANDS):
+            device = devices[rng.randrange(count)]
+            name = device.device_name
+            if isinstance(device, Light):
+                lines.append(rng.choice((f"turn_on {name}", f"turn_off {name}", f"change_brightness {name} --60")))
+            elif isinstance(device, Thermostat):
+                lines.append(rng.choice((f"turn_on {name}", f"change_temperature {name} --22")))
+            else:
+                lines.append(rng.choice((f"start_recording {name}", f"show_battery {name}")))
+
+        # Разбор в обход кэша, затем поток команд с холодным и прогретым кэшем разбора и только выполнение
+        unique = timeit(lambda: [home.commands.parse.__wrapped__(line) for line in lines]) / COMMANDS
+        home.commands.parse.cache_clear()
+        with quiet():
+            cold = timeit(lambda: [home.control_device(line) for line in lines])
+            warm = timeit(lambda: [home.control_device(line) for line in lines])
+            parsed = [home.commands.parse(line) for line in lines]
+            execute = timeit(lambda: [home.execute(command) for command in parsed])
+        close_home(home)
+        print(f"{count:>10} {unique * 1e6:>12.2f} {COMMANDS / cold:>15.0f} {COMMANDS / warm:>15.0f} "
+              f"{COMMANDS / execute:>15.0f}")
+
+
+if __name__ == "__main__":
+    main()
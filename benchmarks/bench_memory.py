@@ -0,0 +1,66 @@
+"""Память на одно устройство: текущие классы со __slots__ против классов из истории git до перехода на них.
+
+Прежний smart_device.py берётся из коммита перед первым появлением __slots__ в этом файле
+(или из ревизии, указанной вторым аргументом) и загружается как отдельный модуль, поэтому
+сравнение идёт с настоящим классом Light, а не с его копией.
+"""
+import os
+import subprocess
+import sys
+import tracemalloc
+import types
+
+from common import *
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git(*args):
+    return subprocess.run(["git", *args], capture_output=True, text=True, check=True, cwd=ROOT).stdout
+
+
+def load_baseline(revision=None):
+    """Модуль smart_device из ревизии revision (по умолчанию — последней без __slots__) и сама ревизия."""
+    if revision is None:
+        introduced = git("log", "-S__slots__", "--format=%H", "--reverse", "--", "smart_device.py").split()
+        if not introduced:
+            raise RuntimeError("smart_device.py has no __slots__ in the git history")
+        revision = f"{introduced[0]}^"
+    module = types.ModuleType("baseline_smart_device")
+    exec(compile(git("show", f"{revision}:smart_device.py"), f"{revision}:smart_device.py", "exec"),
+         module.__dict__)
+    return module, git("log", "-1", "--format=%h %s", revision).strip()
+
+
+def measure(device_class, names, floor):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    devices = []
+    for index, name in enumerate(names):
+        device = device_class(name, 9, "Wi-Fi")
+        device._location = "Hall"
+        device._floor = floor(1 + index % 4)
+        devices.append(device)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # Список и имена общие для обоих вариантов, их не считаем
+    return (used - sys.getsizeof(devices)) / len(names)
+
+
+def main():
+    try:
+        baseline, revision = load_baseline(sys.argv[2] if len(sys.argv) > 2 else None)
+    except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+        print(f"Baseline classes are not available from git: {e}")
+        return
+    names = [f"Light {i}" for i in range(COUNT)]
+    legacy = measure(baseline.Light, names, baseline.format_floor)
+    compact = measure(Light, names, int)
+    print(f"Baseline: Light from {revision}")
+    print(f"{COUNT} Light devices: baseline {legacy:.0f} B/device, __slots__ {compact:.0f} B/device "
+          f"({(1 - compact / legacy) * 100:.0f}% less, {(legacy - compact) * COUNT / 2**20:.0f} MiB saved)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Время поиска устройства в control_device при росте числа устройств."""
+import random
+
+from common import *
+
+LOOKUPS = 2000
+
+
+def main():
+    rng = random.Random(1)
+    print(f"{'devices':>10} {'exact, us':>12} {'prefix, us':>12} {'shared prefix, us':>18} {'control_device, us':>20}")
+    for count in (100, 1_000, 10_000, 50_000):
+        home, devices = build_home(count)
+        names = [devices[rng.randrange(count)].device_name for _ in range(LOOKUPS)]
+        prefixes = [name.split()[1] for name in names]  # "Light 123" -> "123"
+        # Префиксы, под которыми лежат тысячи имён: "light", "light 1", "cam"
+        shared = [name.lower()[:rng.choice((3, 5, 7))] for name in names]
+
+        home.registry.find(prefixes[0])  # префиксное дерево строится при первом нечётком поиске
+        exact = timeit(lambda: [home.registry.find(name) for name in names]) / LOOKUPS
+        prefix = timeit(lambda: [home.registry.find(p) for p in prefixes]) / LOOKUPS
+        common = timeit(lambda: [home.registry.find(p) for p in shared]) / LOOKUPS
+        with quiet():
+            control = timeit(lambda: [home.control_device(f"show_battery {name}") for name in names]) / LOOKUPS
+        close_home(home)
+        print(f"{count:>10} {exact * 1e6:>12.2f} {prefix * 1e6:>12.2f} {common * 1e6:>18.2f} {control * 1e6:>20.2f}")
+
+
+if __name__ == "__main__":
+    main()
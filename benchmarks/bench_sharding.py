@@ -0,0 +1,56 @@
+"""Масштабирование HomeCluster: команды в секунду и время тика в зависимости от числа процессов-шардов.
+
+    python benchmarks/bench_sharding.py [дома] [устройств в доме]
+
+Рост ограничен числом ядер: при workers больше os.cpu_count() шарды делят одни и те же ядра.
+"""
+import random
+import tempfile
+
+from common import *
+from sharding import HomeCluster
+
+HOMES = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+DEVICES = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+COMMANDS = 50_000
+BATCH = 5_000        # команд в одном вызове control_many
+TICK = 60            # секунд модельного времени на замер тика
+
+
+def commands(rng, homes):
+    result = []
+    for _ in range(COMMANDS):
+        number = rng.randrange(DEVICES)
+        device_class = DEVICE_TYPES[number % len(DEVICE_TYPES)].__name__
+        action = rng.choice(("turn_on", "turn_off", "show_battery"))
+        result.append((rng.choice(homes), f"{action} {device_class} {number}"))
+    return result
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    counts = sorted({1, 2, 4, 8, cpus} - {count for count in (2, 4, 8) if count > max(cpus, 2)})
+    homes = [f"home-{number}" for number in range(HOMES)]
+    workload = commands(random.Random(1), homes)
+    print(f"{HOMES} homes x {DEVICES} devices, {COMMANDS} commands, {cpus} CPU(s)")
+    print(f"{'workers':>8} {'start, s':>10} {'cmd/s':>12} {'speedup':>8} {'tick, ms':>10}")
+    base = None
+    for workers in counts:
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            with HomeCluster(workers=workers, directory=directory) as cluster:
+                for home_id in homes:
+                    cluster.add_home(home_id, make_devices(DEVICES))
+                start = time.perf_counter() - started
+
+                elapsed = timeit(lambda: [cluster.control_many(workload[i:i + BATCH])
+                                          for i in range(0, COMMANDS, BATCH)])
+                throughput = COMMANDS / elapsed
+                tick = timeit(lambda: cluster.run_for(TICK))
+                cluster.notifications()
+        base = base or throughput
+        print(f"{workers:>8} {start:>10.2f} {throughput:>12.0f} {throughput / base:>7.2f}x {tick * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
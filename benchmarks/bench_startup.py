@@ -0,0 +1,76 @@
+"""Запуск дома из манифеста: ленивый инвентарь против создания всех устройств сразу.
+
+    python benchmarks/bench_startup.py [устройств]
+
+Замеряется время до готовности дома, затем первая команда к устройству из инвентаря,
+групповая команда, status_summary и снимок с восстановлением.
+"""
+import csv
+import tempfile
+
+from common import *
+
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+
+def write_manifest(filename, count):
+    with open(filename, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(("type", "name", "power", "connection", "location", "floor", "battery"))
+        for i in range(count):
+            device_class = DEVICE_TYPES[i % len(DEVICE_TYPES)]
+            writer.writerow((device_class.__name__, f"{device_class.__name__} {i}", 5 + i % 20, "Wi-Fi",
+                             ROOMS[i % len(ROOMS)], 1 + i % 4, 100 - i % 50))
+
+
+def new_home(directory):
+    return SmartHome(simulated=True, speed=None, snapshot_file=os.path.join(directory, "bench.snapshot"),
+                     journal_file=os.path.join(directory, "bench.journal"),
+                     log_file=os.path.join(directory, "bench.log"))
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = os.path.join(directory, "manifest.csv")
+        write_manifest(manifest, COUNT)
+        print(f"{COUNT} devices in the manifest")
+
+        started = time.perf_counter()
+        home = new_home(directory)
+        with quiet():
+            home.restore()
+            home.load_manifest(manifest)
+        print(f"lazy startup:            {time.perf_counter() - started:8.3f} s "
+              f"({len(home.registry)} objects, {len(home.inventory)} in inventory)")
+
+        with quiet():
+            first = timeit(lambda: home.control_device(f"show_battery Light {COUNT // 2}"))
+            again = timeit(lambda: home.control_device(f"show_battery Light {COUNT // 2}"))
+        print(f"first command (creates): {first * 1e6:8.1f} us, next: {again * 1e6:.1f} us")
+        with quiet():
+            group = timeit(lambda: home.control_device("turn_on --type Camera --room Garage --floor 2"))
+            summary = timeit(home.status_summary)
+            checkpoint = timeit(home.checkpoint)
+        print(f"group command:           {group * 1e3:8.1f} ms ({len(home.registry)} objects now)")
+        print(f"status_summary:          {summary * 1e3:8.1f} ms")
+        print(f"checkpoint:              {checkpoint * 1e3:8.1f} ms")
+        home.shutdown()
+
+        started = time.perf_counter()
+        home = new_home(directory)
+        with quiet():
+            home.restore()
+        print(f"restore:                 {time.perf_counter() - started:8.3f} s "
+              f"({len(home.registry)} objects, {len(home.inventory)} in inventory)")
+        home.shutdown()
+
+        started = time.perf_counter()
+        home = new_home(directory)
+        with quiet():
+            home.add_devices(make_devices(COUNT))
+        print(f"eager add_devices:       {time.perf_counter() - started:8.3f} s")
+        home.shutdown()
+
+
+if __name__ == "__main__":
+    main()
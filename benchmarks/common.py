@@ -0,0 +1,68 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smart_home import *
+
+DEVICE_TYPES = (Light, Thermostat, Camera)
+ROOMS = ("Hall", "Kitchen", "Bedroom", "Bathroom", "Office", "Garage")
+# Лог, снимок и журнал домов из замеров — во временном каталоге, а не в SmartHome.* рядом с кодом
+TEMP = tempfile.TemporaryDirectory(prefix="smarthome-bench-")
+
+
+def make_devices(count):
+    """Создаёт count устройств с уникальными именами и заданным расположением."""
+    devices = []
+    for i in range(count):
+        device_class = DEVICE_TYPES[i % len(DEVICE_TYPES)]
+        device = device_class(device_name=f"{device_class.__name__} {i}",
+                              power_consumption=5 + i % 20,
+                              network_connection="Wi-Fi")
+        device._location = ROOMS[i % len(ROOMS)]
+        device._floor = 1 + i % 4
+        devices.append(device)
+    return devices
+
+
+def bench_home(**options):
+    """SmartHome, который пишет свои файлы во временный каталог замеров."""
+    for option, filename in (("log_file", "bench.log"), ("snapshot_file", "bench.snapshot"),
+                             ("journal_file", "bench.journal")):
+        options.setdefault(option, os.path.join(TEMP.name, filename))
+    return SmartHome(**options)
+
+
+def close_home(home):
+    """Останавливает фоновые циклы дома и поток записи его лога."""
+    home.shutdown()
+    home.event_log.close()
+
+
+def build_home(count):
+    home = bench_home()
+    devices = make_devices(count)
+    with quiet():
+        home.add_devices(devices)
+    return home, devices
+
+
+class quiet:
+    """Глушит print() внутри блока, чтобы консоль не искажала замеры."""
+
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self._stdout
+
+
+def timeit(func, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
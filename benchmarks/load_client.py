@@ -0,0 +1,157 @@
+"""Генератор нагрузки для ControlServer: много соединений, каждое шлёт команды конвейером.
+
+Без --address поднимает дом с --devices устройствами и сервер на свободном порту localhost, с центром
+уведомлений и фоновыми циклами, как в main.py. Каждый клиент подписывается на уведомления (--no-subscribe —
+без подписки), поэтому в замер входит и рассылка уведомлений всем подключённым клиентам.
+
+Вердикт PASS, если сервер выдержал --target команд в секунду, а p99 задержки ответа на команду и доставки
+уведомления (от создания до записи в сокет клиента; только для своего сервера) уложились в бюджеты.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from common import *
+from control_server import ControlServer
+
+
+def make_commands(names, count, rng):
+    actions = ("turn_on", "turn_off", "show_battery", "perform_action")
+    return [f"{rng.choice(actions)} {rng.choice(names)}" for _ in range(count)]
+
+
+async def run_client(address, commands, window, latencies, subscribe, notifications):
+    if isinstance(address, tuple):
+        reader, writer = await asyncio.open_connection(*address)
+    else:
+        reader, writer = await asyncio.open_unix_connection(address)
+    sent_at = []
+    received = 0
+    errors = 0
+    first = 1   # номер ответа на первую команду
+    if subscribe:
+        writer.write(b"subscribe\n")
+        await writer.drain()
+        while "id" not in json.loads(await reader.readline()):
+            pass
+        first = 2
+
+    answered = asyncio.Event()
+
+    async def receive():
+        # Ответы и уведомления читаются кусками: по readline() на строку клиент в том же процессе
+        # отнимал бы у сервера больше времени, чем сама рассылка
+        nonlocal received, errors
+        pending = b""
+        while received < len(commands):
+            data = await reader.read(65536)
+            if not data:
+                break
+            lines = (pending + data).split(b"\n")
+            pending = lines.pop()
+            now = time.perf_counter()
+            for line in lines:
+                if line.startswith(b'{"notification"'):
+                    notifications[0] += 1   # уведомления только считаем, без разбора JSON
+                    continue
+                reply = json.loads(line)
+                latencies.append(now - sent_at[reply["id"] - first])
+                errors += not reply["ok"]
+                received += 1
+            answered.set()
+        answered.set()
+
+    receiver = asyncio.create_task(receive())
+    for command in commands:
+        # Не больше window команд без ответа, чтобы замер задержки не превращался в замер очереди
+        while len(sent_at) - received >= window and not receiver.done():
+            answered.clear()
+            await answered.wait()
+        sent_at.append(time.perf_counter())
+        writer.write(f"{command}\n".encode("utf-8"))
+        if len(sent_at) % window == 0:
+            await writer.drain()
+    await writer.drain()
+    await receiver
+    writer.close()
+    return errors
+
+
+async def generate(address, clients, commands, window, subscribe):
+    latencies = []
+    notifications = [0]
+    started = time.perf_counter()
+    errors = await asyncio.gather(*(run_client(address, batch, window, latencies, subscribe, notifications)
+                                    for batch in commands))
+    return time.perf_counter() - started, latencies, sum(errors), notifications[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--address", help="HOST:PORT or Unix socket path of a running server")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--commands", type=int, default=2000, help="commands per client")
+    parser.add_argument("--window", type=int, default=4, help="max commands in flight per client")
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--no-subscribe", dest="subscribe", action="store_false",
+                        help="do not subscribe clients to notifications")
+    parser.add_argument("--target", type=float, default=1000, help="required throughput, commands per second")
+    parser.add_argument("--latency-budget", type=float, default=100, help="p99 command latency budget, ms")
+    parser.add_argument("--notify-budget", type=float, default=100, help="p99 notification latency budget, ms")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    home = server = None
+    if args.address is None:
+        home, devices = build_home(args.devices)
+        names = [device.device_name for device in devices]
+        center = NotificationCenter(home, mode="async", policy=NotificationPolicy(clock=home.runtime.clock.time))
+        home.set_notification_center(center)
+        home.start_battery_drain()
+        home.start_motion_detection()
+        home.start_scheduler()
+        server = ControlServer(home, port=0)
+        server.start()   # вывод команд сервер отправляет в ответах
+        address = (server.host, server.port)
+    else:
+        host, _, port = args.address.rpartition(":")
+        address = (host, int(port)) if port.isdigit() else args.address
+        names = ["Light 0", "Thermostat 1", "Camera 2"]
+
+    commands = [make_commands(names, args.commands, rng) for _ in range(args.clients)]
+    elapsed, latencies, errors, notifications = asyncio.run(
+        generate(address, args.clients, commands, args.window, args.subscribe))
+    delivery = []
+    if server is not None:
+        server.stop()
+        center.stop()
+        close_home(home)
+        delivery = sorted(server.outbox.latencies)
+
+    def percentile(values, p):
+        return values[min(len(values) - 1, int(len(values) * p / 100))] * 1000
+
+    latencies.sort()
+    total = len(latencies)
+    throughput = total / elapsed
+    print(f"{args.clients} clients, {total} commands in {elapsed:.2f}s: {throughput:.0f} cmd/s, {errors} error(s), "
+          f"{notifications} notification(s) delivered")
+    print(f"Command latency, ms: p50 {percentile(latencies, 50):.2f}, p90 {percentile(latencies, 90):.2f}, "
+          f"p99 {percentile(latencies, 99):.2f}, max {latencies[-1] * 1000:.2f}")
+    failures = []
+    if throughput < args.target:
+        failures.append(f"{throughput:.0f} cmd/s is below {args.target:.0f}")
+    if percentile(latencies, 99) > args.latency_budget:
+        failures.append(f"command p99 {percentile(latencies, 99):.2f} ms is over {args.latency_budget:g} ms")
+    if delivery:
+        print(f"Notification latency, ms: p50 {percentile(delivery, 50):.2f}, p99 {percentile(delivery, 99):.2f}, "
+              f"max {delivery[-1] * 1000:.2f}")
+        if percentile(delivery, 99) > args.notify_budget:
+            failures.append(f"notification p99 {percentile(delivery, 99):.2f} ms is over {args.notify_budget:g} ms")
+    print("PASS" if not failures else "FAIL: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Нагрузочная проверка потокобезопасности: много потоков вызывают control_device,
+параллельно добавляются и удаляются устройства, а фоновые циклы работают с частыми тиками.
+В конце сверяются индексы реестра и состояние батарей."""
+import random
+import sys
+import threading
+
+from common import *
+
+THREADS = 16
+COMMANDS_PER_THREAD = 3000
+DEVICES = 600
+COMMANDS = ("turn_on", "turn_off", "charge", "show_battery", "start_recording", "stop_recording",
+            "perform_action", "set_location")
+
+
+def main():
+    home = bench_home(tick_interval=0.001)
+    devices = make_devices(DEVICES)
+    for device in devices:
+        device._battery_level = random.uniform(0.1, 100)
+    with quiet():
+        home.add_devices(devices)
+    home.set_notification_center(NotificationCenter(home))
+    home.start_battery_drain()
+    home.start_motion_detection()
+    home.start_scheduler()
+
+    errors = []
+    stop_churn = threading.Event()
+
+    def hammer(seed):
+        rng = random.Random(seed)
+        try:
+            for _ in range(COMMANDS_PER_THREAD):
+                command = rng.choice(COMMANDS)
+                device = devices[rng.randrange(DEVICES)]
+                name = device.device_name
+                if command == "set_location":
+                    home.control_device(f"set_location {name} --{rng.choice(ROOMS)} --{rng.randint(1, 4)}")
+                else:
+                    home.control_device(f"{command} {name}")
+        except Exception as e:
+            errors.append(e)
+
+    def churn():
+        rng = random.Random(0)
+        number = 0
+        try:
+            while not stop_churn.is_set():
+                extra = Light(f"Churn Light {number}", 5, "Wi-Fi")
+                home.add_devices([extra])
+                home.control_device(f"turn_on Churn Light {number}")
+                if rng.random() < 0.9:
+                    home.remove_device(extra.device_name)
+                number += 1
+        except Exception as e:
+            errors.append(e)
+
+    with quiet():
+        workers = [threading.Thread(target=hammer, args=(seed,)) for seed in range(THREADS)]
+        churner = threading.Thread(target=churn)
+        start = time.perf_counter()
+        churner.start()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stop_churn.set()
+        churner.join()
+        elapsed = time.perf_counter() - start
+        close_home(home)
+
+    registry = home.registry
+    for status in ("On", "Off"):
+        indexed = set(map(id, registry.by_status(status)))
+        actual = {id(d) for d in registry if d._status == status}
+        if indexed != actual:
+            errors.append(AssertionError(f"status index '{status}' is inconsistent"))
+    expected_power = sum(d.power_consumption for d in registry if d._status == "On")
+    if home.power.total != expected_power:
+        errors.append(AssertionError(f"active power {home.power.total}W != {expected_power}W"))
+    for device in registry:
+        if not 0 <= device._battery_level <= 100:
+            errors.append(AssertionError(f"{device.device_name} battery out of range: {device._battery_level}"))
+        if registry.get(device.device_name) is not device:
+            errors.append(AssertionError(f"{device.device_name} is not reachable by name"))
+
+    total = THREADS * COMMANDS_PER_THREAD
+    print(f"{total} commands from {THREADS} threads in {elapsed:.2f}s ({total / elapsed:.0f} cmd/s), "
+          f"{len(registry)} devices at the end")
+    if errors:
+        for error in errors[:10]:
+            print(f"FAILED: {error!r}")
+        sys.exit(1)
+    print("OK: no errors, indexes consistent")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Набор замеров SmartHome от 10 до 1M устройств с результатами в JSON и сравнением с базовым прогоном.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --sizes 10,1000,100000 --baseline baseline.json
+    python benchmarks/suite.py --save-baseline baseline.json
+
+Каждый замер повторяется --repeat раз и берётся медиана. Замер считается регрессией, если стал медленнее
+базового больше чем на --threshold (по умолчанию 20%); тогда скрипт завершается с кодом 1.
+Сравнивать имеет смысл прогоны на одной машине: окружение записывается в поле "environment".
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+
+from common import *
+from event_log import EventLog
+
+SIZES = (10, 100, 1_000, 10_000, 100_000, 1_000_000)
+SUBSCRIBERS = (1, 10, 100, 1000)
+LOOKUPS = 1000
+MIN_TIME = 0.05    # короткие замеры повторяются в цикле, пока один прогон не займёт хотя бы столько
+NOTIFICATIONS = 1000
+SEED = 1
+
+
+class NullSink:
+    def write(self, subscriber, notifications):
+        pass
+
+    def close(self):
+        pass
+
+
+def new_home(directory):
+    # Модельное время без пауз: фоновые циклы не запускаются и не мешают замерам
+    return SmartHome(simulated=True, speed=None, seed=SEED,
+                     snapshot_file=os.path.join(directory, "bench.snapshot"),
+                     journal_file=os.path.join(directory, "bench.journal"),
+                     log_file=os.path.join(directory, "bench.log"))
+
+
+def measure(func, repeat, setup=None, teardown=None):
+    """Медиана времени func(state) по repeat прогонам; setup() готовит state заново перед каждым,
+    teardown(state) убирает его после замера.
+
+    Без setup быстрый func выполняется в прогоне несколько раз (как timeit.autorange), иначе
+    микросекундные замеры тонут в шуме таймера.
+    """
+    number = 1
+    if setup is None:
+        start = time.perf_counter()
+        func(None)
+        number = max(1, int(MIN_TIME / max(time.perf_counter() - start, 1e-9)))
+    times = []
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        start = time.perf_counter()
+        for _ in range(number):
+            func(state)
+        times.append((time.perf_counter() - start) / number)
+        if teardown is not None:
+            teardown(state)
+    return statistics.median(times)
+
+
+def run_size(count, repeat, directory):
+    """Замеры для дома из count устройств: {имя замера: секунды на операцию}."""
+    rng = random.Random(SEED)
+    results = {}
+
+    def add(home):
+        with quiet():
+            home.add_devices(make_devices(count))
+
+    results["add_devices"] = measure(add, repeat, lambda: new_home(directory), close_home)
+
+    home = new_home(directory)
+    devices = make_devices(count)
+    with quiet():
+        home.add_devices(devices)
+        for device in devices[::2]:
+            device.turn_on()  # половина устройств разряжается в тике батарей
+
+    lines = [f"show_battery {devices[rng.randrange(count)].device_name}" for _ in range(LOOKUPS)]
+    with quiet():
+        results["control_device"] = measure(lambda _: [home.control_device(line) for line in lines], repeat) / LOOKUPS
+        results["status_report"] = measure(lambda _: home.status_report(), repeat)
+    results["battery_tick"] = measure(lambda _: home.update_batteries(), repeat)
+    with quiet():
+        results["check_energy"] = measure(lambda _: home.check_energy(), repeat)
+
+    def fill_log():
+        home.event_log.close()
+        log = home.event_log = EventLog(os.path.join(directory, "bench.log"), capacity=count,
+                                        batch_size=count + 1, flush_interval=3600)
+        for device in devices:
+            log.log("Device %s has been added.", device.device_name)
+
+    with quiet():
+        results["save_log"] = measure(lambda _: home.save_log(), repeat, fill_log)
+    close_home(home)
+    return results
+
+
+def run_fanout(subscribers, repeat, directory):
+    """Доставка NOTIFICATIONS уведомлений каждому из subscribers подписчиков, секунд на уведомление."""
+    home = new_home(directory)
+    home.event_log = EventLog(os.path.join(directory, "bench.log"), capacity=NOTIFICATIONS * subscribers)
+    center = NotificationCenter(home)
+    with quiet():
+        for number in range(subscribers):
+            center.subscribe(f"User {number}", sink=NullSink())
+    seconds = measure(lambda _: [center.send_notification(f"Notification {i}") for i in range(NOTIFICATIONS)],
+                      repeat) / NOTIFICATIONS
+    home.event_log.close()
+    home.shutdown()
+    return seconds
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+    return {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "numpy": numpy_version, "commit": commit or None}
+
+
+def compare(results, baseline, threshold):
+    """Строки сравнения и число регрессий. Замеры, которых нет в базовом прогоне, пропускаются."""
+    lines, regressions = [], 0
+    for key, seconds in sorted(results.items(), key=_order):
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = seconds / base
+        if ratio > 1 + threshold:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif ratio < 1 - threshold:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        lines.append(f"{key:<32} {base * 1e6:>14.2f} {seconds * 1e6:>14.2f} {ratio:>8.2f}x  {verdict}")
+    return lines, regressions
+
+
+def _order(item):
+    name, _, size = item[0].rpartition("/")
+    return name, int(size)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)),
+                        help="comma-separated device counts (default: %(default)s)")
+    parser.add_argument("--subscribers", default=",".join(map(str, SUBSCRIBERS)),
+                        help="comma-separated subscriber counts for notification fan-out (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the median is kept")
+    parser.add_argument("--output", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with a previous --output file")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slowdown that counts as a regression (default: %(default)s = 20%%)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    subscribers = [int(count) for count in args.subscribers.split(",") if count]
+    results = {}
+
+    print(f"{'devices':>10} " + " ".join(f"{name:>15}" for name in (
+        "add_devices, s", "control, us", "status, ms", "battery, ms", "energy, us", "save_log, ms")))
+    with tempfile.TemporaryDirectory() as directory:
+        for count in sizes:
+            measured = run_size(count, args.repeat, directory)
+            results.update({f"{name}/{count}": seconds for name, seconds in measured.items()})
+            print(f"{count:>10} {measured['add_devices']:>15.3f} {measured['control_device'] * 1e6:>15.2f} "
+                  f"{measured['status_report'] * 1e3:>15.3f} {measured['battery_tick'] * 1e3:>15.3f} "
+                  f"{measured['check_energy'] * 1e6:>15.2f} {measured['save_log'] * 1e3:>15.3f}")
+        print(f"\n{'subscribers':>11} {'per notification, us':>22}")
+        for count in subscribers:
+            seconds = results[f"notify_fanout/{count}"] = run_fanout(count, args.repeat, directory)
+            print(f"{count:>11} {seconds * 1e6:>22.2f}")
+
+    report = {"environment": environment(), "repeat": args.repeat, "results": results}
+    for filename in (args.output, args.save_baseline):
+        if filename:
+            with open(filename, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+            print(f"Results saved to {filename}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        lines, regressions = compare(results, baseline["results"], args.threshold)
+        print(f"\nCompared with {args.baseline} (commit {baseline['environment'].get('commit')}):")
+        print(f"{'measurement':<32} {'baseline, us':>14} {'current, us':>14} {'ratio':>9}")
+        print("\n".join(lines))
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
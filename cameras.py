@@ -0,0 +1,190 @@
+from collections import deque
+import heapq
+import itertools
+import random
+import threading
+
+try:
+    import numpy as np
+except ImportError:  # без numpy движение разыгрывается обычным random по одной камере
+    np = None
+
+
+class CameraEvent:
+    __slots__ = ("kind", "camera", "time", "notified")
+
+    def __init__(self, kind, camera, time, notified=True):
+        self.kind = kind          # motion, segment, started, stopped
+        self.camera = camera
+        self.time = time
+        self.notified = notified  # False — повторное движение внутри окна debounce, уведомление не отправлено
+
+    def __str__(self):
+        suffix = "" if self.notified else " (debounced)"
+        return f"{self.camera.device_name}: {self.kind}{suffix}"
+
+
+class CameraSystem:
+    """Записывающие камеры: движение разыгрывается для всех одним векторным броском, сегменты — по таймерам.
+
+    Набор записывающих камер обновляется по событиям start_recording/stop_recording, поэтому тик не
+    перебирает все устройства дома. rate — вероятность движения за тик, её можно задать каждой камере.
+    Повторное движение в течение debounce секунд попадает в метрики и поток камеры, но без уведомления.
+    """
+
+    def __init__(self, clock, seed=None, rate=0.05, debounce=30, segment=300, history=100):
+        self.clock = clock
+        self.rate = rate
+        self.debounce = debounce
+        self.segment = segment
+        self.history = history
+        self.stats = {"motion": 0, "debounced": 0, "segments": 0}
+        self.__rng = np.random.default_rng(seed) if np is not None else random.Random(seed)
+        self.__cameras = []        # записывающие камеры
+        self.__positions = {}      # камера -> индекс в __cameras и __rates
+        self.__rates = []
+        self.__rate_array = None   # кэш __rates для numpy, сбрасывается при изменении набора
+        self.__custom_rates = {}
+        self.__started = {}        # камера -> начало текущей записи, отсекает сегменты прошлых записей
+        self.__segments = []       # куча (время, номер, камера, начало записи)
+        self.__counter = itertools.count()
+        self.__last_alert = {}
+        self.__events = {}         # камера -> последние события
+        self.__streams = {}        # камера (None — все камеры) -> подписчики
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__cameras)
+
+    def recording(self):
+        with self.__lock:
+            return list(self.__cameras)
+
+    def track(self, camera):
+        """Учитывает камеру, добавленную или восстановленную уже записывающей."""
+        if camera._is_recording:
+            self.recording_changed(camera, True)
+
+    def recording_changed(self, camera, recording):
+        now = self.clock()
+        with self.__lock:
+            if recording and camera not in self.__positions:
+                self.__positions[camera] = len(self.__cameras)
+                self.__cameras.append(camera)
+                self.__rates.append(self.__custom_rates.get(camera, self.rate))
+                self.__rate_array = None
+                self.__started[camera] = now
+                heapq.heappush(self.__segments, (now + self.segment, next(self.__counter), camera, now))
+            elif not recording and camera in self.__positions:
+                self.__discard(camera)
+            else:
+                return
+        self.__publish(CameraEvent("started" if recording else "stopped", camera, now))
+
+    def forget(self, camera):
+        with self.__lock:
+            if camera in self.__positions:
+                self.__discard(camera)
+            self.__custom_rates.pop(camera, None)
+            self.__last_alert.pop(camera, None)
+            self.__events.pop(camera, None)
+            self.__streams.pop(camera, None)
+
+    def set_rate(self, camera, rate):
+        if not 0 <= rate <= 1:
+            raise ValueError("Motion rate must be from 0 to 1")
+        with self.__lock:
+            self.__custom_rates[camera] = rate
+            position = self.__positions.get(camera)
+            if position is not None:
+                self.__rates[position] = rate
+                self.__rate_array = None
+
+    def rate_for(self, camera):
+        return self.__custom_rates.get(camera, self.rate)
+
+    def subscribe(self, callback, camera=None):
+        """callback(CameraEvent) на каждое событие камеры (camera=None — всех камер)."""
+        with self.__lock:
+            self.__streams.setdefault(camera, []).append(callback)
+
+    def unsubscribe(self, callback, camera=None):
+        with self.__lock:
+            callbacks = self.__streams.get(camera, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def events(self, camera, limit=None):
+        events = list(self.__events.get(camera, ()))
+        return events[-limit:] if limit else events
+
+    def tick(self):
+        self.sample_motion()
+        self.record_segments()
+
+    def sample_motion(self):
+        """Один бросок на все записывающие камеры сразу."""
+        with self.__lock:
+            cameras = list(self.__cameras)
+            if not cameras:
+                return []
+            if np is not None:
+                if self.__rate_array is None:
+                    self.__rate_array = np.array(self.__rates)
+                hits = np.flatnonzero(self.__rng.random(len(cameras)) < self.__rate_array).tolist()
+            else:
+                hits = [i for i, rate in enumerate(self.__rates) if self.__rng.random() < rate]
+
+        now = self.clock()
+        detected = []
+        for position in hits:
+            camera = cameras[position]
+            notify = now - self.__last_alert.get(camera, float("-inf")) >= self.debounce
+            if notify:
+                self.__last_alert[camera] = now
+            else:
+                self.stats["debounced"] += 1
+            self.stats["motion"] += 1
+            camera.detect_motion(notify)
+            self.__publish(CameraEvent("motion", camera, now, notify))
+            detected.append(camera)
+        return detected
+
+    def record_segments(self):
+        """Сохраняет сегменты, время которых наступило: у каждой камеры — каждые segment секунд от начала записи."""
+        now = self.clock()
+        due = []
+        with self.__lock:
+            while self.__segments and self.__segments[0][0] <= now:
+                when, _, camera, started = heapq.heappop(self.__segments)
+                if self.__started.get(camera) != started:
+                    continue  # запись с тех пор остановили
+                due.append(camera)
+                heapq.heappush(self.__segments, (when + self.segment, next(self.__counter), camera, started))
+        for camera in due:
+            self.stats["segments"] += 1
+            camera.record_segment()
+            self.__publish(CameraEvent("segment", camera, now))
+        return due
+
+    def __discard(self, camera):
+        # Последняя камера встаёт на место удалённой — удаление за O(1)
+        position = self.__positions.pop(camera)
+        last = self.__cameras.pop()
+        last_rate = self.__rates.pop()
+        if last is not camera:
+            self.__cameras[position] = last
+            self.__rates[position] = last_rate
+            self.__positions[last] = position
+        self.__rate_array = None
+        self.__started.pop(camera, None)
+
+    def __publish(self, event):
+        with self.__lock:
+            self.__events.setdefault(event.camera, deque(maxlen=self.history)).append(event)
+            callbacks = self.__streams.get(event.camera, []) + self.__streams.get(None, [])
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Error in camera event subscriber: {e}")
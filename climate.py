@@ -0,0 +1,214 @@
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # без numpy модели климата нет: термостаты берут номинальную мощность, как раньше
+    np = None
+
+from smart_device import MODES
+
+AUTO, HEATING, COOLING, FAN_ONLY, DRY = range(len(MODES))
+
+
+class ClimateModel:
+    """Температура комнат с термостатами: все комнаты продвигаются на шаг одним векторным обновлением.
+
+    Комната — пара (комната, этаж) термостата. Её температура T стремится к равновесию, которое задают
+    уличная температура и тепло термостатов: dT/dt = (loss * (outdoor - T) + Q) / thermal_mass.
+    На шаге Q постоянна, поэтому уравнение решается точно (экспонента), и длинный шаг не раскачивает модель.
+    Термостат работает пропорционально отклонению от уставки (полная мощность при отклонении в band
+    градусов и больше) ступенями по step от номинала; фактическая мощность из сети — draw, её шаг
+    возвращает для PowerMeter только у тех термостатов, у которых она изменилась.
+    """
+
+    available = np is not None
+
+    HEATING_EFFICIENCY = 1.0   # тепла на ватт из сети
+    COOLING_COP = 3.0          # холода на ватт из сети
+    FAN_SHARE = 0.05           # Fan only: только вентилятор
+    DRY_SHARE = 0.3            # Dry: осушение охлаждает, но не больше этой доли мощности
+    ATTRIBUTES = frozenset(("_status", "temperature", "mode", "_location", "_floor"))
+
+    def __init__(self, clock=time.time, outdoor=10.0, initial=20.0, thermal_mass=2.0e6, loss=100.0,
+                 band=0.5, step=0.05, budget=0.005, capacity=256):
+        if np is None:
+            raise RuntimeError("ClimateModel requires numpy")
+        self.clock = clock
+        self.outdoor = outdoor
+        self.initial = initial
+        self.thermal_mass = thermal_mass   # Дж/К
+        self.loss = loss                   # Вт/К через стены и окна
+        self.band = band
+        self.step_share = step
+        self.budget = budget               # секунд на тик, дольше — перерасход в stats
+        self.stats = {"ticks": 0, "overruns": 0, "last": 0.0, "max": 0.0}
+        self.lock = threading.RLock()
+        # Термостаты
+        self.on = np.zeros(capacity, dtype=bool)
+        self.mode = np.zeros(capacity, dtype=np.int8)
+        self.setpoint = np.zeros(capacity)
+        self.power = np.zeros(capacity)
+        self.room = np.zeros(capacity, dtype=np.intp)
+        self.draw = np.zeros(capacity, dtype=np.int64)
+        self.stage = np.zeros(capacity)   # текущая ступень мощности, в долях step
+        self.active = np.zeros(capacity, dtype=bool)
+        self.dirty = np.zeros(capacity, dtype=bool)   # мощность вернуть на следующем шаге, даже если не изменилась
+        self.devices = [None] * capacity
+        self.__slots = {}
+        self.__free = list(range(capacity - 1, -1, -1))
+        # Комнаты: массивы растут удвоением, заняты первые len(self)
+        self.temperature = np.full(capacity, initial)
+        self.mass = np.full(capacity, thermal_mass)
+        self.losses = np.full(capacity, loss)
+        self.__rooms = {}          # (комната, этаж) -> номер
+        self.__keys = []
+        self.__custom = {}         # (комната, этаж) -> заданные thermal_mass и loss
+        self.__last = None
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def track(self, thermostat):
+        with self.lock:
+            slot = self.__slots.get(thermostat)
+            if slot is None:
+                if not self.__free:
+                    self.__grow()
+                slot = self.__slots[thermostat] = self.__free.pop()
+                self.devices[slot] = thermostat
+                self.active[slot] = True
+                self.draw[slot] = 0
+                self.stage[slot] = 0
+            on = thermostat._status == "On"
+            if self.on[slot] != on:
+                # PowerMeter после включения или выключения считает номинал, пока шаг не сообщит мощность
+                self.dirty[slot] = True
+            self.on[slot] = on
+            self.mode[slot] = MODES.index(thermostat.mode)
+            self.setpoint[slot] = thermostat.temperature
+            self.power[slot] = thermostat.power_consumption
+            self.room[slot] = self.__room(_room_key(thermostat))
+
+    def forget(self, thermostat):
+        with self.lock:
+            slot = self.__slots.pop(thermostat, None)
+            if slot is not None:
+                self.active[slot] = False
+                self.on[slot] = False
+                self.devices[slot] = None
+                self.__free.append(slot)
+
+    def set_room(self, location, floor=None, thermal_mass=None, loss=None, temperature=None):
+        """Параметры комнаты (новая комната создаётся). thermal_mass и loss сохраняются в снимке дома."""
+        if thermal_mass is not None and thermal_mass <= 0 or loss is not None and loss <= 0:
+            raise ValueError("Thermal mass and heat loss must be positive")
+        key = (location, floor)
+        with self.lock:
+            room = self.__room(key)
+            custom = self.__custom.setdefault(key, {})
+            if thermal_mass is not None:
+                self.mass[room] = custom["thermal_mass"] = thermal_mass
+            if loss is not None:
+                self.losses[room] = custom["loss"] = loss
+            if temperature is not None:
+                self.temperature[room] = temperature
+        return room
+
+    def custom_rooms(self):
+        with self.lock:
+            return [dict(location=location, floor=floor, **values)
+                    for (location, floor), values in self.__custom.items() if values]
+
+    def room_temperature(self, thermostat):
+        with self.lock:
+            slot = self.__slots.get(thermostat)
+            return None if slot is None else float(self.temperature[self.room[slot]])
+
+    def rooms(self):
+        """Комнаты с термостатами или своими параметрами в порядке появления:
+        ((комната, этаж), температура, средняя уставка, мощность термостатов)."""
+        with self.lock:
+            size = len(self.__keys)
+            live = self.active
+            setpoints = np.bincount(self.room[live], weights=self.setpoint[live], minlength=size)
+            counts = np.bincount(self.room[live], minlength=size)
+            draws = np.bincount(self.room[live], weights=self.draw[live], minlength=size)
+            return [(key, float(self.temperature[room]), setpoints[room] / counts[room] if counts[room] else None,
+                     int(draws[room])) for room, key in enumerate(self.__keys)
+                    if counts[room] or self.__custom.get(key)]
+
+    def step(self, now=None):
+        """Шаг модели на время, прошедшее с прошлого шага. Возвращает [(термостат, новая мощность)]."""
+        started = time.perf_counter()
+        now = self.clock() if now is None else now
+        with self.lock:
+            seconds = 0.0 if self.__last is None else max(0.0, now - self.__last)
+            self.__last = now
+            changed = self.__advance(seconds)
+        elapsed = time.perf_counter() - started
+        self.stats["ticks"] += 1
+        self.stats["last"] = elapsed
+        self.stats["max"] = max(self.stats["max"], elapsed)
+        if elapsed > self.budget:
+            self.stats["overruns"] += 1
+        return changed
+
+    def __advance(self, seconds):
+        running = self.active & self.on
+        room, mode = self.room, self.mode
+        error = self.setpoint - self.temperature[room]   # > 0 — в комнате холоднее уставки
+
+        heat = running & (error > 0) & ((mode == HEATING) | (mode == AUTO))
+        cool = running & (error < 0) & ((mode == COOLING) | (mode == AUTO) | (mode == DRY))
+        duty = np.minimum(np.abs(error) / self.band, 1.0)
+        duty = np.where(mode == DRY, np.minimum(duty, self.DRY_SHARE), duty)
+        # Ступень меняется, только если нужная мощность ушла от текущей больше чем на 3/4 ступени,
+        # иначе у границы ступени термостат переключался бы каждый тик
+        wanted = duty / self.step_share
+        self.stage[:] = np.where(heat | cool, np.where(np.abs(wanted - self.stage) < 0.75, self.stage,
+                                                      np.rint(wanted)), 0)
+        duty = self.stage * self.step_share
+        duty[running & (mode == FAN_ONLY)] = self.FAN_SHARE
+        draw = self.power * duty
+
+        heating = draw * np.where(heat, self.HEATING_EFFICIENCY, 0.0) - draw * np.where(cool, self.COOLING_COP, 0.0)
+        rooms = len(self.__keys)
+        gain = np.bincount(room[running], weights=heating[running], minlength=rooms)
+        losses, temperature = self.losses[:rooms], self.temperature[:rooms]
+        equilibrium = self.outdoor + gain / losses
+        temperature[:] = equilibrium + (temperature - equilibrium) * np.exp(-losses * seconds / self.mass[:rooms])
+
+        draw = np.rint(draw).astype(np.int64)
+        changed = np.flatnonzero(((draw != self.draw) | self.dirty) & self.active)
+        self.draw[:] = draw
+        self.dirty[:] = False
+        devices = self.devices
+        return list(zip([devices[slot] for slot in changed.tolist()], draw[changed].tolist()))
+
+    def __room(self, key):
+        room = self.__rooms.get(key)
+        if room is None:
+            room = self.__rooms[key] = len(self.__keys)
+            self.__keys.append(key)
+            if room == len(self.temperature):
+                self.temperature = np.concatenate([self.temperature, np.full(room, self.initial)])
+                self.mass = np.concatenate([self.mass, np.full(room, self.thermal_mass)])
+                self.losses = np.concatenate([self.losses, np.full(room, self.loss)])
+        return room
+
+    def __grow(self):
+        old = len(self.active)
+        new = old * 2
+        for column in ("on", "mode", "setpoint", "power", "room", "draw", "stage", "active", "dirty"):
+            array = getattr(self, column)
+            setattr(self, column, np.concatenate([array, np.zeros(new - old, dtype=array.dtype)]))
+        self.devices.extend([None] * (new - old))
+        self.__free.extend(range(new - 1, old - 1, -1))
+
+
+def _room_key(thermostat):
+    # Термостат без комнаты греет свою отдельную комнату
+    if thermostat._location is None:
+        return (thermostat.device_name, None)
+    return (thermostat._location, thermostat._floor_number)
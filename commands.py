@@ -0,0 +1,239 @@
+"""Реестр команд: разбор строки один раз в объект Command и выполнение через таблицу.
+
+Устройства объявляют свои команды декоратором @command(Param(...)), дом регистрирует
+свои (отчёты, расписания, цепи) через CommandRegistry.register().
+"""
+from contextlib import contextmanager
+from functools import lru_cache
+import threading
+
+REQUIRED = object()
+_output = threading.local()
+
+
+class CommandError(ValueError):
+    pass
+
+
+def echo(*values):
+    """print() для вывода команд: в поток, назначенный текущему потоку command_output(), иначе в sys.stdout."""
+    print(*values, file=getattr(_output, "stream", None))
+
+
+@contextmanager
+def command_output(stream):
+    """Вывод echo() текущего потока внутри блока уходит в stream (остальные потоки пишут как прежде)."""
+    previous = getattr(_output, "stream", None)
+    _output.stream = stream
+    try:
+        yield stream
+    finally:
+        _output.stream = previous
+
+
+class Param:
+    """Позиционный параметр команды ("--22") или именованный ("--floor 2", если option=True)."""
+
+    __slots__ = ("name", "type", "default", "choices", "variadic", "option")
+
+    def __init__(self, name, type=str, default=REQUIRED, choices=None, variadic=False, option=False):
+        self.name = name
+        self.type = type
+        self.default = () if variadic else default
+        self.choices = choices
+        self.variadic = variadic
+        self.option = option
+
+    def __str__(self):
+        text = f"--{self.name} <{self.name}>" if self.option else f"--<{self.name}>"
+        if self.variadic:
+            text += " ..."
+        return text if self.default is REQUIRED else f"[{text}]"
+
+    def convert(self, command, raw):
+        raw = raw.strip()
+        try:
+            value = self.type(raw)
+        except ValueError:
+            raise CommandError(f"Error: {self.name.capitalize()} must be {_type_name(self.type)}.") from None
+        if self.choices is not None and value not in self.choices:
+            raise CommandError(f"Error: {self.name.capitalize()} must be one of: {', '.join(map(str, self.choices))}.")
+        return value
+
+
+def scalar(raw):
+    """Аргумент без объявленного типа: число, если похоже на число, иначе строка."""
+    return int(raw) if raw.isdigit() else raw
+
+
+def _type_name(type):
+    return {int: "an integer", float: "a number"}.get(type, type.__name__)
+
+
+def command(*params, log=None):
+    """Объявляет метод устройства командой с типизированными параметрами."""
+    def declare(method):
+        method.command = CommandSpec(method.__name__, method, params, target="device", log=log, method=True)
+        return method
+    return declare
+
+
+class CommandSpec:
+    """target: None — команда дома, "device" — над устройством (или группой), "name" — над объектом по имени.
+
+    method=True — команда объявлена в классе устройства, и для каждого устройства берётся
+    реализация его собственного класса.
+    """
+
+    __slots__ = ("name", "handler", "positional", "options", "target", "log", "method")
+
+    def __init__(self, name, handler, params=(), target=None, log=None, method=False):
+        self.name = name
+        self.handler = handler
+        self.positional = tuple(param for param in params if not param.option)
+        self.options = {param.name: param for param in params if param.option}
+        self.target = target
+        self.log = log
+        self.method = method
+
+    @property
+    def usage(self):
+        target = {"device": " <device_name>", "name": " <name>"}.get(self.target, "")
+        params = " ".join(str(param) for param in self.positional + tuple(self.options.values()))
+        return f"{self.name}{target} {params}".strip()
+
+
+class Command:
+    """Разобранная и проверенная команда. Неизменяема, поэтому один объект можно выполнять много раз."""
+
+    __slots__ = ("spec", "target", "args", "options")
+
+    def __init__(self, spec, target, args, options):
+        self.spec = spec
+        self.target = target
+        self.args = args
+        self.options = options
+
+    @property
+    def name(self):
+        return self.spec.name
+
+    @property
+    def is_group(self):
+        return self.spec.target == "device" and self.target is None
+
+    def __repr__(self):
+        return f"Command({self.name!r}, {self.target!r}, {self.args!r}, {self.options!r})"
+
+
+class CommandRegistry:
+    """Команды дома и команды классов устройств. Разбор строк кэшируется, выполнение — поиск по таблице."""
+
+    def __init__(self, device_classes=(), selectors=(), cache_size=4096):
+        self.selectors = {param.name: param for param in selectors}
+        self.__specs = {}          # имя -> CommandSpec дома или первого класса, объявившего команду
+        self.__by_class = {}       # класс устройства -> {имя: CommandSpec}
+        for device_class in device_classes:
+            self.add_device_class(device_class)
+        self.parse = lru_cache(maxsize=cache_size)(self.__parse)
+
+    def register(self, name, handler, *params, target=None, log=None):
+        self.__specs[name] = CommandSpec(name, handler, params, target, log)
+
+    def add_device_class(self, device_class):
+        table = self.commands_for(device_class)
+        for name, spec in table.items():
+            self.__specs.setdefault(name, spec)
+
+    def commands_for(self, device_class):
+        table = self.__by_class.get(device_class)
+        if table is None:
+            table = {}
+            for klass in reversed(device_class.__mro__):
+                for name, attribute in vars(klass).items():
+                    spec = getattr(attribute, "command", None)
+                    if isinstance(spec, CommandSpec):
+                        table[name] = spec
+            self.__by_class[device_class] = table
+        return table
+
+    def lookup(self, device, name):
+        """Спецификация команды для конкретного устройства или None, если устройство её не поддерживает."""
+        table = self.__by_class.get(type(device))
+        if table is None:
+            table = self.commands_for(type(device))
+        return table.get(name)
+
+    def __contains__(self, name):
+        return name in self.__specs
+
+    def names(self):
+        return sorted(self.__specs)
+
+    def spec(self, name):
+        return self.__specs.get(name)
+
+    def bind(self, device, name, args=()):
+        """Команда устройства с проверенными по Param аргументами — для действий, выполняемых позже (расписание).
+
+        Годятся только команды, объявленные в классе устройства; иначе CommandError.
+        """
+        spec = self.lookup(device, name)
+        if spec is None:
+            raise CommandError(f"Error: {type(device).__name__} has no command '{name}'.")
+        return self.__build(spec, device.device_name, [str(arg) for arg in args])
+
+    def make(self, name, target=None, args=(), **options):
+        """Программный способ собрать команду: make("turn_off", type="Light", floor=2)."""
+        spec = self.__specs.get(name)
+        if spec is None:
+            raise CommandError(f"Unknown command: {name}")
+        raw_options = [f"{key} {value}" for key, value in options.items()]
+        return self.__build(spec, target, [str(arg) for arg in args] + raw_options)
+
+    def __parse(self, text):
+        # "change_brightness Living Room Light --50" -> ("change_brightness", "Living Room Light", ["50"])
+        parts = text.strip().split(" --")
+        name, _, target = parts[0].partition(" ")
+        spec = self.__specs.get(name)
+        if spec is None:
+            raise CommandError(f"Unknown command: {name}" if name else "Empty command.")
+        return self.__build(spec, target.strip() or None, parts[1:])
+
+    def __build(self, spec, target, params):
+        if spec.target is None and target is not None:
+            raise CommandError(f"Usage: {spec.usage}")
+        if spec.target == "name" and target is None:
+            raise CommandError(f"Usage: {spec.usage}")
+
+        options_spec = spec.options
+        if spec.target == "device" and target is None:
+            options_spec = dict(self.selectors, **spec.options)
+
+        positional, options = [], {}
+        for raw in params:
+            key, _, value = raw.strip().partition(" ")
+            option = options_spec.get(key)
+            if option is not None and value:
+                options[key] = option.convert(spec.name, value)
+            else:
+                positional.append(raw)
+
+        if spec.target == "device" and target is None and not any(key in self.selectors for key in options):
+            raise CommandError(f"Device name or a selector (--{', --'.join(self.selectors)}) "
+                               f"is required for {spec.name}.")
+
+        args = []
+        for param in spec.positional:
+            if param.variadic:
+                args.extend(param.convert(spec.name, raw) for raw in positional)
+                positional = []
+            elif positional:
+                args.append(param.convert(spec.name, positional.pop(0)))
+            elif param.default is REQUIRED:
+                raise CommandError(f"{param.name.capitalize()} is required for this command. Usage: {spec.usage}")
+            else:
+                args.append(param.default)
+        if positional:
+            raise CommandError(f"Too many arguments for {spec.name}. Usage: {spec.usage}")
+        return Command(spec, target, tuple(args), options)
@@ -0,0 +1,238 @@
+"""Сервер управления домом по TCP или Unix-сокету на asyncio-цикле SimulationRuntime.
+
+Протокол построчный: клиент шлёт команды control_device по одной в строке (можно не дожидаясь
+ответов), сервер отвечает на каждую JSON-строкой {"id": номер, "ok": ..., "output": ...} в том же порядке.
+Служебные команды:
+    status [--type/--room/--floor/--status/--battery/--name ...] [--page N --per_page N]
+                                                                  состояние устройств в JSON
+    status --since V                                              только изменившееся после версии V
+    subscribe [topic ...]                                         поток уведомлений {"notification": ...}
+    unsubscribe
+"""
+import asyncio
+from collections import deque
+import io
+import itertools
+import json
+import threading
+import time
+
+from commands import CommandError, command_output, echo
+from notifications import TOPICS
+
+
+class _Outbox:
+    """Уведомления для всех клиентов, собранные потоками центра уведомлений.
+
+    Цикл, который выполняет команды, получает один вызов на пачку, а не по вызову на клиента и уведомление:
+    пока пачка ждёт своей очереди, в неё дописываются следующие, а данные клиента уходят одной записью.
+    """
+
+    def __init__(self, loop, latencies=100000):
+        self.loop = loop
+        self.latencies = deque(maxlen=latencies)   # секунды от создания уведомления до записи в сокет
+        self.__pending = []   # (sink, данные, моменты создания уведомлений)
+        self.__scheduled = False
+        self.__encoded = None   # (пачка, байты): центр отдаёт одну и ту же пачку всем подписчикам подряд
+        self.__lock = threading.Lock()
+
+    def encode(self, notifications):
+        """JSON-строки пачки уведомлений; одна и та же пачка кодируется один раз на всех подписчиков."""
+        encoded = self.__encoded
+        if encoded is not None and encoded[0] == notifications:
+            return encoded[1]
+        data = "".join(json.dumps({"notification": str(n), "topic": n.topic, "severity": n.severity}) + "\n"
+                       for n in notifications).encode("utf-8")
+        self.__encoded = (notifications, data)
+        return data
+
+    def put(self, sink, data, created):
+        with self.__lock:
+            self.__pending.append((sink, data, created))
+            if self.__scheduled:
+                return
+            self.__scheduled = True
+        try:
+            self.loop.call_soon_threadsafe(self.__send)
+        except RuntimeError:  # цикл уже остановлен
+            pass
+
+    def __send(self):
+        with self.__lock:
+            pending, self.__pending = self.__pending, []
+            self.__scheduled = False
+        chunks = {}
+        for sink, data, created in pending:
+            entry = chunks.setdefault(sink, ([], []))
+            entry[0].append(data)
+            entry[1].extend(created)
+        now = time.monotonic()
+        for sink, (data, created) in chunks.items():
+            if sink.send(b"".join(data), len(created)):
+                self.latencies.extend(now - moment for moment in created)
+
+
+class _ClientSink:
+    """Sink NotificationCenter: уведомления уходят клиенту из потока цикла, медленному клиенту — отбрасываются."""
+
+    def __init__(self, outbox, writer, buffer_limit):
+        self.outbox = outbox
+        self.writer = writer
+        self.buffer_limit = buffer_limit
+        self.dropped = 0
+
+    def write(self, subscriber, notifications):
+        # JSON собирается здесь, в потоке центра уведомлений, — цикл только пишет готовые байты
+        self.outbox.put(self, self.outbox.encode(notifications), [n.created for n in notifications])
+
+    def send(self, data, count):
+        if self.writer.is_closing():
+            return False
+        if self.writer.transport.get_write_buffer_size() > self.buffer_limit:
+            self.dropped += count
+            return False
+        self.writer.write(data)
+        return True
+
+    def close(self):
+        pass
+
+
+class ControlServer:
+    """Принимает много клиентов одновременно; команды выполняются по очереди в потоке runtime дома."""
+
+    def __init__(self, home, host="127.0.0.1", port=8765, path=None, buffer_limit=1024 * 1024):
+        self.home = home
+        self.host = host
+        self.port = port
+        self.path = path
+        self.buffer_limit = buffer_limit
+        self.clients = 0
+        self.commands = 0
+        self.outbox = None
+        self.__server = None
+        self.__ids = itertools.count(1)
+
+    @property
+    def address(self):
+        return self.path or f"{self.host}:{self.port}"
+
+    def start(self, timeout=5):
+        """Запускает сервер на цикле home.runtime (при необходимости запускает и сам runtime)."""
+        runtime = self.home.runtime
+        runtime.start()
+        self.outbox = _Outbox(runtime.loop)
+        asyncio.run_coroutine_threadsafe(self.__listen(), runtime.loop).result(timeout)
+        print(f"Control server listening on {self.address}")
+
+    def stop(self, timeout=5):
+        loop = self.home.runtime.loop
+        if self.__server is not None and loop is not None:
+            asyncio.run_coroutine_threadsafe(self.__close(), loop).result(timeout)
+        self.__server = None
+
+    async def __listen(self):
+        if self.path:
+            self.__server = await asyncio.start_unix_server(self.__handle, path=self.path)
+        else:
+            self.__server = await asyncio.start_server(self.__handle, self.host, self.port)
+            # port=0 — свободный порт, который выбрала ОС
+            self.port = self.__server.sockets[0].getsockname()[1]
+
+    async def __close(self):
+        self.__server.close()
+        await self.__server.wait_closed()
+
+    async def __handle(self, reader, writer):
+        self.clients += 1
+        subscriber = f"client-{next(self.__ids)}"
+        sink = None
+        number = 0
+        pending = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                # Обрабатываем все пришедшие целиком строки пачкой и отвечаем одной записью в сокет
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                replies = []
+                for line in lines:
+                    line = line.decode("utf-8", "replace").strip()
+                    if not line:
+                        continue
+                    number += 1
+                    if line == "subscribe" or line.startswith("subscribe "):
+                        sink, reply = self.__subscribe(subscriber, sink, line, writer)
+                    elif line == "unsubscribe":
+                        sink, reply = self.__unsubscribe(subscriber, sink), {"ok": True}
+                    elif line == "status" or line.startswith("status "):
+                        reply = self.__status(line)
+                    else:
+                        reply = self.__execute(line)
+                    reply["id"] = number
+                    replies.append(json.dumps(reply))
+                if replies:
+                    writer.write(("\n".join(replies) + "\n").encode("utf-8"))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.__unsubscribe(subscriber, sink)
+            self.clients -= 1
+            writer.close()
+
+    def __execute(self, line):
+        self.commands += 1
+        # Вывод команды (echo) уходит в её ответ, а не в консоль сервера
+        with command_output(io.StringIO()) as output:
+            try:
+                # Ошибки, которые команда обработала сама (напечатала), control_device возвращает как False
+                ok = self.home.control_device(line) is not False
+            except Exception as e:
+                echo(f"Error: {e}")
+                ok = False
+        return {"ok": ok, "output": output.getvalue().rstrip("\n")}
+
+    def __status(self, line):
+        selectors, paging = {}, {"page": 1, "per_page": 1000}
+        try:
+            for param in line.split(" --")[1:]:
+                key, _, value = param.strip().partition(" ")
+                selector = self.home.commands.selectors.get(key)
+                if key in ("page", "per_page", "since") and value.isdigit():
+                    paging[key] = int(value)
+                elif selector is not None and value:
+                    selectors[key] = selector.convert("status", value)
+                else:
+                    raise CommandError(f"Unknown status filter: {param.strip()}")
+            if "since" in paging:
+                return dict(self.home.status.diff(paging["since"]), ok=True)
+            devices = self.home.find_devices(**selectors)
+            pending = self.home.find_pending(**selectors)
+        except ValueError as e:
+            return {"ok": False, "output": str(e)}
+        if paging["page"] < 1 or paging["per_page"] < 1:
+            return {"ok": False, "output": "Page and per_page must be positive."}
+        status, total, pages = self.home.status.report(devices, paging["page"], paging["per_page"], pending)
+        return {"ok": True, "status": status, "total": total, "pages": pages, "version": self.home.status.version}
+
+    def __subscribe(self, subscriber, sink, line, writer):
+        center = self.home.notification_center
+        if center is None:
+            return sink, {"ok": False, "output": "Notification center is not set."}
+        topics = line.split()[1:] or None
+        unknown = set(topics or ()) - set(TOPICS)
+        if unknown:
+            return sink, {"ok": False, "output": f"Unknown topics: {', '.join(sorted(unknown))}"}
+        self.__unsubscribe(subscriber, sink)
+        sink = _ClientSink(self.outbox, writer, self.buffer_limit)
+        with command_output(io.StringIO()):   # "X has subscribed" не нужно в консоли сервера
+            center.subscribe(subscriber, topics, sink)
+        return sink, {"ok": True, "output": f"Subscribed to {', '.join(topics or TOPICS)}."}
+
+    def __unsubscribe(self, subscriber, sink):
+        if sink is not None and self.home.notification_center is not None:
+            self.home.notification_center.unsubscribe(subscriber)
+        return None
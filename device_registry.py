@@ -0,0 +1,203 @@
+from smart_device import *
+import threading
+
+
+class _TrieNode:
+    # names — имена, содержащие путь к узлу, в порядке добавления в реестр (dict как упорядоченное множество)
+    __slots__ = ("children", "names")
+
+    def __init__(self):
+        self.children = {}
+        self.names = {}
+
+
+class DeviceRegistry:
+    """Реестр устройств с индексами по имени, префиксам и атрибутам.
+
+    Изменения идут под общей блокировкой реестра, а обход — по неизменяемому снимку (copy-on-write),
+    поэтому фоновые циклы не видят список в середине add/remove.
+    """
+
+    INDEXED = ("_location", "_floor", "_status")
+    TRIE_DEPTH = 3   # в дерево попадают все фрагменты имени не длиннее TRIE_DEPTH
+
+    def __init__(self):
+        self.__lock = threading.RLock()
+        self.__snapshot = ()
+        self.__devices = {}      # точное имя (lower) -> устройство, в порядке добавления
+        self.__order = {}        # точное имя (lower) -> порядковый номер добавления
+        self.__counter = 0
+        self.__trie = None       # строится при первом нечётком поиске, чтобы массовая загрузка не платила за него
+        self.__by_type = {}
+        self.__by_location = {}
+        self.__by_floor = {}
+        self.__by_status = {}
+        self.__indexed = {}      # точное имя (lower) -> значения INDEXED, под которыми устройство лежит в индексах
+
+    def __len__(self):
+        return len(self.__devices)
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def snapshot(self):
+        snapshot = self.__snapshot
+        if snapshot is None:
+            with self.__lock:
+                if self.__snapshot is None:
+                    self.__snapshot = tuple(self.__devices.values())
+                snapshot = self.__snapshot
+        return snapshot
+
+    def __contains__(self, device_name):
+        return device_name.lower() in self.__devices
+
+    def add(self, device):
+        key = device.device_name.lower()
+        with self.__lock:
+            if key in self.__devices:
+                raise ValueError(f"Device '{device.device_name}' is already registered")
+
+            self.__devices[key] = device
+            self.__snapshot = None
+            self.__order[key] = self.__counter
+            self.__counter += 1
+            if self.__trie is not None:
+                self.__trie_insert(key)
+
+            self.__index(self.__by_type, type(device).__name__, key)
+            values = [getattr(device, attribute) for attribute in self.INDEXED]
+            self.__indexed[key] = values
+            for index, value in zip(self.__attribute_indexes(), values):
+                self.__index(index, value, key)
+
+    def remove(self, device_name):
+        key = device_name.lower()
+        with self.__lock:
+            device = self.__devices.pop(key, None)
+            if device is None:
+                return None
+
+            self.__snapshot = None
+            del self.__order[key]
+            if self.__trie is not None:
+                for fragment in self.__fragments(key):
+                    self.__trie_discard(self.__trie, fragment, 0, key)
+
+            self.__unindex(self.__by_type, type(device).__name__, key)
+            for index, value in zip(self.__attribute_indexes(), self.__indexed.pop(key)):
+                self.__unindex(index, value, key)
+        return device
+
+    def get(self, device_name):
+        return self.__devices.get(device_name.lower())
+
+    def find(self, device_name):
+        """Ищет устройство: сначала точное имя, затем самое раннее по добавлению имя, содержащее подстроку."""
+        key = device_name.lower()
+        device = self.__devices.get(key)
+        if device is not None:
+            return device
+
+        with self.__lock:
+            return self.__find_fuzzy(key)
+
+    def __find_fuzzy(self, key):
+        if self.__trie is None:
+            self.__trie = _TrieNode()
+            for name in self.__devices:
+                self.__trie_insert(name)
+        if not key:
+            return next(iter(self.__devices.values()), None)
+        # Дерево только сужает круг: берём самый редкий фрагмент запроса, его имена уже идут
+        # в порядке добавления, и первое из них, содержащее весь запрос, — ответ линейного поиска
+        candidates = None
+        for fragment in self.__fragments(key):
+            node = self.__trie
+            for char in fragment:
+                node = node.children.get(char)
+                if node is None:
+                    return None
+            if candidates is None or len(node.names) < len(candidates):
+                candidates = node.names
+        for name in candidates:
+            if key in name:
+                return self.__devices[name]
+        return None
+
+    def by_type(self, type_name):
+        return self.__select(self.__by_type, type_name)
+
+    def by_location(self, location):
+        return self.__select(self.__by_location, location)
+
+    def by_floor(self, floor):
+        if isinstance(floor, int):
+            floor = format_floor(floor)
+        return self.__select(self.__by_floor, floor)
+
+    def by_status(self, status):
+        return self.__select(self.__by_status, status)
+
+    def reindex(self, device, attribute, old, new):
+        """Обновляет вторичный индекс после изменения атрибута устройства."""
+        if attribute not in self.INDEXED:
+            return
+        key = device.device_name.lower()
+        position = self.INDEXED.index(attribute)
+        index = self.__attribute_indexes()[position]
+        with self.__lock:
+            values = self.__indexed.get(key)
+            if values is None or self.__devices[key] is not device:
+                return
+            # Берём текущее значение, а не new: при гонке двух изменений индекс сходится к последнему
+            current = getattr(device, attribute)
+            if values[position] != current:
+                self.__unindex(index, values[position], key)
+                self.__index(index, current, key)
+                values[position] = current
+
+    def __attribute_indexes(self):
+        return (self.__by_location, self.__by_floor, self.__by_status)
+
+    def __select(self, index, value):
+        with self.__lock:
+            return [self.__devices[key] for key in sorted(index.get(value, ()), key=self.__order.__getitem__)]
+
+    @staticmethod
+    def __index(index, value, key):
+        index.setdefault(value, set()).add(key)
+
+    @staticmethod
+    def __unindex(index, value, key):
+        keys = index.get(value)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    @classmethod
+    def __fragments(cls, name):
+        # "cam" при глубине 3: "cam"; "camera" -> "cam", "ame", "mer", "era", "ra", "a" —
+        # путь к каждому узлу дерева оказывается подстрокой всех имён, записанных в узле
+        depth = cls.TRIE_DEPTH
+        return {name[i:i + depth] for i in range(len(name))}
+
+    def __trie_insert(self, key):
+        for fragment in self.__fragments(key):
+            node = self.__trie
+            for char in fragment:
+                node = node.children.setdefault(char, _TrieNode())
+                # Номера добавления только растут, поэтому новое имя встаёт в конец и порядок сохраняется
+                node.names[key] = None
+
+    def __trie_discard(self, node, suffix, depth, key):
+        if depth == len(suffix):
+            return
+        child = node.children.get(suffix[depth])
+        if child is None:
+            return
+        child.names.pop(key, None)
+        self.__trie_discard(child, suffix, depth + 1, key)
+        if not child.names:
+            del node.children[suffix[depth]]
@@ -0,0 +1,174 @@
+from collections import deque
+from datetime import datetime
+import gzip
+import os
+import shutil
+import threading
+import time
+
+
+class LogRecord:
+    __slots__ = ("created", "message", "args")
+
+    def __init__(self, message, args, created=None):
+        self.created = time.time() if created is None else created
+        self.message = message
+        self.args = args
+
+    def __str__(self):
+        return f"{datetime.fromtimestamp(self.created)} - {self.text()}"
+
+    def text(self):
+        return self.message % self.args if self.args else self.message
+
+
+class EventLog:
+    """Журнал событий: кольцевой буфер записей и фоновая запись в файл пачками с ротацией."""
+
+    def __init__(self, filename="SmartHome.log", capacity=10000, batch_size=500, flush_interval=1.0,
+                 max_bytes=10 * 1024 * 1024, rotate_interval=None, backup_count=5, compress=False):
+        self.filename = filename
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.dropped = 0
+        self.written = 0
+
+        self.__history = deque(maxlen=capacity)
+        self.__pending = deque()
+        self.__condition = threading.Condition()
+        self.__writer = None
+        self.__running = False
+        self.__flushing = False
+        self.__flush_requested = False
+        self.__file = None
+        self.__opened_at = None
+
+    def log(self, message, *args):
+        """Сохраняет запись без форматирования: строка собирается уже в фоновом потоке."""
+        self.log_many(message, (args,))
+
+    def log_many(self, message, args):
+        """Как log() для записей с одним форматом и разными аргументами — под одной блокировкой и с одним временем."""
+        created = time.time()
+        records = [LogRecord(message, values, created) for values in args]
+        with self.__condition:
+            overflow = len(self.__pending) + len(records) - self.capacity
+            for _ in range(min(overflow, len(self.__pending))):
+                self.__pending.popleft()
+                self.dropped += 1
+            if len(records) > self.capacity:
+                self.dropped += len(records) - self.capacity
+                records = records[-self.capacity:]
+            self.__pending.extend(records)
+            self.__history.extend(records)
+            if self.__writer is None:
+                self.__start()
+            elif len(self.__pending) >= self.batch_size:
+                self.__condition.notify()
+
+    def recent(self, count=None):
+        with self.__condition:
+            records = list(self.__history)
+        if count is not None:
+            records = records[-count:]
+        return [str(record) for record in records]
+
+    def flush(self, timeout=5):
+        """Ждёт, пока все накопленные записи попадут в файл."""
+        deadline = time.monotonic() + timeout
+        with self.__condition:
+            if self.__writer is None:
+                return
+            # Флаг, а не только notify: только что запущенный писатель мог ещё не дойти до wait()
+            self.__flush_requested = True
+            self.__condition.notify_all()
+            while (self.__pending or self.__flushing) and time.monotonic() < deadline:
+                self.__condition.wait(0.05)
+
+    def close(self):
+        self.flush()
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+            writer, self.__writer = self.__writer, None
+        if writer is not None:
+            writer.join()
+
+    def __start(self):
+        self.__running = True
+        self.__writer = threading.Thread(target=self.__write_loop, daemon=True)
+        self.__writer.start()
+
+    def __write_loop(self):
+        while True:
+            with self.__condition:
+                if self.__running and len(self.__pending) < self.batch_size and not self.__flush_requested:
+                    self.__condition.wait(self.flush_interval)
+                self.__flush_requested = False
+                batch = list(self.__pending)
+                self.__pending.clear()
+                self.__flushing = bool(batch)
+                running = self.__running
+
+            if batch:
+                try:
+                    self.__write(batch)
+                except OSError as e:
+                    print(f"Error saving log: {e}")
+                with self.__condition:
+                    self.__flushing = False
+                    self.__condition.notify_all()
+            if not running:
+                if self.__file is not None:
+                    self.__file.close()
+                    self.__file = None
+                return
+
+    def __write(self, batch):
+        # Записи одного log_many() делят время — дату форматируем раз на серию, а не на каждую строку
+        lines = []
+        created = stamp = None
+        for record in batch:
+            if record.created != created:
+                created, stamp = record.created, str(datetime.fromtimestamp(record.created))
+            lines.append(f"{stamp} - {record.text()}\n")
+        data = "".join(lines)
+        if self.__file is None:
+            self.__open()
+        if self.__should_rotate(len(data.encode("utf-8"))):
+            self.__rotate()
+        self.__file.write(data)
+        self.__file.flush()
+        self.written += len(batch)
+
+    def __open(self):
+        self.__file = open(self.filename, "a", encoding="utf-8")
+        self.__opened_at = time.time()
+
+    def __should_rotate(self, incoming):
+        if self.max_bytes and self.__file.tell() and self.__file.tell() + incoming > self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self.__opened_at >= self.rotate_interval
+
+    def __rotate(self):
+        self.__file.close()
+        suffix = ".gz" if self.compress else ""
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.filename}.{index}{suffix}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.filename}.{index + 1}{suffix}")
+            if self.compress:
+                with open(self.filename, "rb") as source, gzip.open(f"{self.filename}.1.gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(self.filename)
+            else:
+                os.replace(self.filename, f"{self.filename}.1")
+        else:
+            os.remove(self.filename)
+        self.__open()
@@ -0,0 +1,217 @@
+"""Инвентарь устройств из манифеста (CSV или JSON) с ленивым созданием объектов.
+
+Манифест — строки с полями type, name, power, connection и необязательными location, floor, battery:
+    type,name,power,connection,location,floor,battery
+    Light,Hall Light 1,9,Wi-Fi,Hall,1,100
+В JSON — список объектов с теми же полями (или {"devices": [...]}).
+
+Устройства из манифеста выключены, поэтому не потребляют мощность и не разряжаются: до первого
+обращения они хранятся столбцами (массивы чисел и таблица строк), а объект SmartDevice создаётся,
+когда к устройству впервые обращается команда.
+"""
+from array import array
+import csv
+import fnmatch
+import json
+import os
+import threading
+
+from smart_device import *
+from smart_device import _level_value
+
+TYPES = (Light, Thermostat, Camera)
+NONE = -1
+
+
+class Inventory:
+    """Ещё не созданные устройства манифеста: номер строки -> столбцы, имя (lower) -> номер строки."""
+
+    def __init__(self):
+        self.file = None
+        self.removed = []           # имена, удалённые до создания объекта, — сохраняются в снимке
+        self.__names = []
+        self.__positions = {}       # имя (lower) -> номер строки
+        self.__types = bytearray()
+        self.__power = array("i")
+        self.__connections = bytearray()
+        self.__locations = array("i")  # номер в __strings, NONE — не задана
+        self.__floors = array("i")
+        self.__battery = array("d")
+        self.__pending = bytearray()   # 1 — объект ещё не создан
+        self.__strings = []
+        self.__string_ids = {}
+        self.__defaults = {}           # тип -> to_dict() нового устройства, основа записей статуса
+        self.__count = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return self.__count
+
+    def __contains__(self, device_name):
+        position = self.__positions.get(device_name.lower())
+        return position is not None and self.__pending[position]
+
+    def load(self, filename, skip=(), removed=()):
+        """Читает манифест; имена из skip (уже созданные устройства) и removed пропускает. Возвращает число строк."""
+        with open(filename, encoding="utf-8", newline="") as file:
+            if filename.lower().endswith(".json"):
+                rows = json.load(file)
+                rows = rows["devices"] if isinstance(rows, dict) else rows
+            else:
+                rows = list(csv.DictReader(file))
+        removed = {name.lower() for name in removed}
+        type_codes = {cls.__name__.lower(): code for code, cls in enumerate(TYPES)}
+        count = 0
+        with self.__lock:
+            for number, row in enumerate(rows, 1):
+                name = str(row.get("name") or "").strip()
+                key = name.lower()
+                if not name:
+                    raise ValueError(f"{filename}: device {number} has no name")
+                if key in self.__positions and self.__pending[self.__positions[key]]:
+                    raise ValueError(f"{filename}: device '{name}' is listed twice")
+                if key in removed:
+                    self.removed.append(name)
+                    continue
+                if name in skip:
+                    continue
+                type_code = type_codes.get(str(row.get("type") or "").strip().lower())
+                if type_code is None:
+                    raise ValueError(f"{filename}: device '{name}' has unknown type '{row.get('type')}'. "
+                                     f"Types: {', '.join(cls.__name__ for cls in TYPES)}")
+                connection = str(row.get("connection") or "").strip()
+                if connection not in CONNECTIONS:
+                    raise ValueError(f"{filename}: device '{name}': connection must be Wi-Fi / Bluetooth / Ethernet")
+                try:
+                    power = int(row["power"])
+                    floor = int(row["floor"]) if row.get("floor") not in (None, "") else NONE
+                    battery = float(row["battery"]) if row.get("battery") not in (None, "") else 100.0
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError(f"{filename}: device '{name}' needs an integer power and floor "
+                                     f"and a numeric battery") from None
+                if power <= 0:
+                    raise ValueError(f"{filename}: device '{name}' must consume at least 1W!")
+                if floor != NONE and floor not in FLOORS:
+                    raise ValueError(f"{filename}: device '{name}' floor must be from {FLOORS.start} "
+                                     f"to {FLOORS.stop - 1}")
+                location = str(row.get("location") or "").strip()
+                self.__positions[key] = len(self.__names)
+                self.__names.append(name)
+                self.__types.append(type_code)
+                self.__power.append(power)
+                self.__connections.append(CONNECTIONS.index(connection))
+                self.__locations.append(self.__string(location) if location else NONE)
+                self.__floors.append(floor)
+                self.__battery.append(min(max(battery, 0.0), 100.0))
+                self.__pending.append(1)
+                count += 1
+            self.__count += count
+        self.file = os.path.abspath(filename)
+        return count
+
+    def take(self, device_name):
+        """Создаёт объект устройства и убирает его из инвентаря. None — такого устройства здесь нет."""
+        with self.__lock:
+            position = self.__positions.get(device_name.lower())
+            if position is None or not self.__pending[position]:
+                return None
+            self.__release(position)
+        return self.build(position)
+
+    def take_matching(self, device_name):
+        """Как take, но по подстроке: первое в порядке манифеста ещё не созданное устройство, чьё имя её содержит."""
+        key = device_name.lower()
+        with self.__lock:
+            pending = self.__pending
+            for name, position in self.__positions.items():
+                if pending[position] and key in name:
+                    self.__release(position)
+                    break
+            else:
+                return None
+        return self.build(position)
+
+    def take_many(self, positions):
+        with self.__lock:
+            positions = [position for position in positions if self.__pending[position]]
+            for position in positions:
+                self.__release(position)
+        return [self.build(position) for position in positions]
+
+    def remove(self, device_name):
+        with self.__lock:
+            position = self.__positions.get(device_name.lower())
+            if position is None or not self.__pending[position]:
+                return None
+            self.__release(position)
+            self.removed.append(self.__names[position])
+        return self.__names[position]
+
+    def build(self, position):
+        """Объект устройства по строке манифеста (без регистрации в доме)."""
+        device = TYPES[self.__types[position]](self.__names[position], self.__power[position],
+                                               CONNECTIONS[self.__connections[position]])
+        location = self.__locations[position]
+        device._location = self.__strings[location] if location != NONE else None
+        device._floor = self.__floors[position] if self.__floors[position] != NONE else None
+        device._battery_level = self.__battery[position]
+        return device
+
+    def select(self, type=None, room=None, floor=None, status=None, battery=None, name=None, classes=TYPES):
+        """Номера ещё не созданных устройств по селекторам групповых команд, в порядке манифеста.
+
+        battery — проверка уровня заряда, name — шаблон вида "Hue*", classes — допустимые классы устройств.
+        Устройства манифеста выключены, поэтому status "On" не выбирает ни одного.
+        """
+        if status is not None and status != "Off":
+            return []
+        codes = {code for code, cls in enumerate(TYPES) if cls in classes and (type is None or cls.__name__ == type)}
+        if not codes:
+            return []
+        location = NONE
+        if room is not None:
+            location = self.__string_ids.get(room)
+            if location is None:
+                return []
+        pattern = name.lower() if name is not None else None
+        selected = []
+        pending, names = self.__pending, self.__names
+        for position in range(len(names)):
+            if not pending[position]:
+                continue
+            if self.__types[position] not in codes:
+                continue
+            if room is not None and self.__locations[position] != location:
+                continue
+            if floor is not None and self.__floors[position] != floor:
+                continue
+            if battery is not None and not battery(self.__battery[position]):
+                continue
+            if pattern is not None and not fnmatch.fnmatchcase(names[position].lower(), pattern):
+                continue
+            selected.append(position)
+        return selected
+
+    def status(self, position):
+        """Запись статуса как у SmartDevice.to_dict(), собранная из столбцов без создания объекта."""
+        cls = TYPES[self.__types[position]]
+        defaults = self.__defaults.get(cls)
+        if defaults is None:
+            defaults = self.__defaults[cls] = cls("", 1, CONNECTIONS[0]).to_dict()
+        location = self.__locations[position]
+        return dict(defaults, name=self.__names[position], power=self.__power[position],
+                    connection=CONNECTIONS[self.__connections[position]],
+                    location=self.__strings[location] if location != NONE else None,
+                    floor=self.__floors[position] if self.__floors[position] != NONE else None,
+                    battery=round(_level_value(self.__battery[position]), 1))
+
+    def __release(self, position):
+        self.__pending[position] = 0
+        self.__count -= 1
+
+    def __string(self, value):
+        string_id = self.__string_ids.get(value)
+        if string_id is None:
+            string_id = self.__string_ids[value] = len(self.__strings)
+            self.__strings.append(value)
+        return string_id
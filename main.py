@@ -79,17 +79,51 @@ o Используйте таймеры для имитации периодич
 '''
 
 from smart_home import *
+from replay import read_commands, replay
+from control_server import ControlServer
+import argparse
+import os
+import sys
+import threading
 import time
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Smart home control")
+    parser.add_argument("--script", metavar="FILE",
+                        help="replay commands from FILE ('-' for stdin) instead of the interactive prompt")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="commands per second for --script (default: as fast as possible)")
+    parser.add_argument("--quiet", action="store_true", help="suppress command output during --script")
+    parser.add_argument("--listen", metavar="ADDRESS",
+                        help="serve commands over HOST:PORT or a Unix socket path instead of the interactive prompt")
+    parser.add_argument("--fresh", action="store_true",
+                        help="start from the default devices without reading or writing the snapshot")
+    parser.add_argument("--manifest", metavar="FILE",
+                        help="load devices from a CSV/JSON manifest instead of the default list "
+                             "(device objects are created on first use)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile hot paths from the start (same as the 'stats --on' command)")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="write profiling stats in Prometheus text format on exit (implies --profile)")
+    return parser.parse_args()
+
+
 def main():
+    args = parse_args()
+
     # Дом
     home = SmartHome()
+    if args.profile or args.metrics_file:
+        home.profiler.install()
     home.start_battery_drain() 
     home.start_motion_detection() 
+    home.start_scheduler()
+    home.start_analytics()
+    home.start_climate()
 
     # Центр уведомлений
-    notification_center = NotificationCenter(home)
+    notification_center = NotificationCenter(home, mode="async", policy=NotificationPolicy(clock=home.runtime.clock.time))
     notification_center.subscribe("Mr Anderson")
 
     devices = [
@@ -112,10 +146,51 @@ def main():
         Thermostat(device_name="Ecobee SmartThermostat", power_consumption=1800, network_connection="Wi-Fi"),
     ]
 
-    home.add_devices(devices)
+    # Состояние прошлого запуска восстанавливаем из снимка, список выше нужен только при первом запуске.
+    # Манифест заменяет список; уже загруженный в прошлый раз манифест восстанавливается вместе со снимком
+    # (его загрузка попадает в журнал, поэтому снимок сразу не нужен)
+    restored = False
+    if not args.fresh:
+        try:
+            restored = home.restore()
+        except ValueError as e:
+            # Снимок чужой версии или повреждён: откладываем файлы в сторону, чтобы первый снимок их не затёр
+            for filename in (home.snapshot_file, home.journal_file):
+                if os.path.exists(filename):
+                    os.replace(filename, f"{filename}.bad")
+            print(f"Saved state is not restored: {e}. Starting fresh, old files are kept with the .bad suffix.")
+    if args.manifest and home.inventory.file != os.path.abspath(args.manifest):
+        home.load_manifest(args.manifest)
+    elif not restored:
+        home.add_devices(devices)
+        if not args.fresh:
+            home.checkpoint()
     home.set_notification_center(notification_center)
 
     try:
+        if args.script:
+            # Сценарий идёт через тот же дом с работающими фоновыми циклами, только без input() и паузы
+            stream = sys.stdin if args.script == "-" else open(args.script, encoding="utf-8")
+            with stream:
+                stats = replay(home, read_commands(stream), args.rate, args.quiet)
+            print(stats.report())
+            if home.profiler.installed:
+                print("\n".join(home.profiler.stats()))
+            return
+
+        if args.listen:
+            host, _, port = args.listen.rpartition(":")
+            server = ControlServer(home, host=host or "127.0.0.1", port=int(port)) if port.isdigit() \
+                else ControlServer(home, path=args.listen)
+            server.start()
+            try:
+                threading.Event().wait()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.stop()
+            return
+
         while True:
             if not home.check_energy():
                 break
@@ -131,6 +206,16 @@ def main():
 
     finally:
         home.stop_battery_drain() 
+        home.stop_motion_detection()
+        home.stop_scheduler()
+        home.stop_analytics()
+        home.stop_climate()
+        if not args.fresh:
+            home.checkpoint()
+        if args.metrics_file:
+            home.profiler.export(args.metrics_file)
+        home.shutdown()
+        notification_center.stop()
         home.save_log()
 
 
@@ -0,0 +1,434 @@
+from collections import Counter, deque
+from contextlib import contextmanager
+import socket
+import threading
+import time
+
+from commands import echo
+from smart_device import format_floor
+
+TOPICS = ("device", "battery", "motion", "schedule")
+BACKPRESSURE_POLICIES = ("block", "drop_oldest", "coalesce")
+SEVERITIES = ("info", "warning", "critical")
+
+
+class Notification:
+    __slots__ = ("topic", "message", "created", "count", "device", "severity", "reply")
+
+    def __init__(self, topic, message, device=None, severity="info", reply=False):
+        self.topic = topic
+        self.message = message
+        self.created = time.monotonic()
+        self.count = 1
+        self.device = device
+        self.severity = severity
+        self.reply = reply   # ответ на команду пользователя — политика его не задерживает
+
+    def __str__(self):
+        return self.message if self.count == 1 else f"{self.message} (x{self.count})"
+
+
+class ConsoleSink:
+    def write(self, subscriber, notifications):
+        print("\n".join(f"Notification to {subscriber}: {n}" for n in notifications))
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    def __init__(self, filename):
+        self.filename = filename
+        self.__file = open(filename, "a", encoding="utf-8")
+        self.__lock = threading.Lock()
+
+    def write(self, subscriber, notifications):
+        with self.__lock:
+            self.__file.writelines(f"{subscriber}\t{n.topic}\t{n}\n" for n in notifications)
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class MemorySink:
+    def __init__(self, maxlen=10000):
+        self.notifications = deque(maxlen=maxlen)
+
+    def write(self, subscriber, notifications):
+        self.notifications.extend((subscriber, n) for n in notifications)
+
+    def close(self):
+        pass
+
+
+class SocketSink:
+    """Отправляет пачку уведомлений одной датаграммой: на Unix-сокет (путь) или на UDP-адрес (host, port)."""
+
+    def __init__(self, address):
+        self.address = address
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        self.__socket = socket.socket(family, socket.SOCK_DGRAM)
+
+    def write(self, subscriber, notifications):
+        payload = "".join(f"{subscriber}\t{n.topic}\t{n}\n" for n in notifications)
+        try:
+            self.__socket.sendto(payload.encode("utf-8"), self.address)
+        except OSError as e:
+            print(f"Error sending notifications to {self.address}: {e}")
+
+    def close(self):
+        self.__socket.close()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _Window:
+    __slots__ = ("opened", "topic", "device_type", "floor", "device_name", "severity", "devices", "held", "events")
+
+    def __init__(self, opened, notification):
+        self.opened = opened
+        self.topic = notification.topic
+        self.device_type, self.floor, self.device_name = _group_of(notification.device)
+        self.severity = notification.severity
+        self.devices = set()
+        self.held = []     # объединённые и ещё не отправленные уведомления
+        self.events = 0
+
+
+def _group_of(device):
+    # Устройство без комнаты не с кем объединять — у него своё окно
+    return type(device).__name__, device._floor_number, None if device._location is not None else device.device_name
+
+
+class NotificationPolicy:
+    """Уровни важности, лимиты и объединение уведомлений перед рассылкой.
+
+    - critical проходит всегда, мимо лимитов и окон, как и ответы на команды пользователя и уведомления
+      без устройства (они уже сводные);
+    - у каждого устройства свой token bucket: сверх него уведомления устройства отбрасываются;
+    - уведомления одной темы от устройств одного типа на одном этаже уходят сразу, пока их token bucket
+      (group_rate, group_burst) не исчерпан. Всплеск сверх него открывает окно на window секунд: всё, что
+      пришло в окне, уходит одной сводкой в его конце ("5 cameras on 1st floor detected motion").
+    Истёкшие окна закрывает flush(): его вызывает поток центра уведомлений или таймер дома.
+    """
+
+    PHRASES = {"motion": "detected motion", "battery": "reported battery events", "device": "changed state",
+               "schedule": "ran scheduled tasks"}
+
+    def __init__(self, device_rate=1.0, device_burst=5, group_rate=1.0, group_burst=5, window=10.0,
+                 clock=time.monotonic):
+        self.device_rate = device_rate
+        self.device_burst = device_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.window = window
+        self.clock = clock
+        self.stats = {"passed": 0, "critical": 0, "replies": 0, "suppressed": 0, "merged": 0, "summaries": 0}
+        self.__device_buckets = {}
+        self.__group_buckets = {}   # (тема, тип устройства, этаж, имя) -> TokenBucket
+        self.__windows = {}   # (тема, тип устройства, этаж) -> _Window
+        self.__lock = threading.Lock()
+
+    def admit(self, notification):
+        """Возвращает уведомления, которые нужно отправить сейчас: [notification], сводки закрытых окон или []."""
+        now = self.clock()
+        with self.__lock:
+            ready = self.__close_windows(now)
+            if notification.severity == "critical":
+                self.stats["critical"] += 1
+                return ready + [notification]
+            if notification.reply:
+                self.stats["replies"] += 1
+                return ready + [notification]
+            device = notification.device
+            if device is None:
+                # Уведомления дома и сводки групповых команд уже сводные
+                self.stats["passed"] += 1
+                return ready + [notification]
+
+            bucket = self.__device_buckets.get(device)
+            if bucket is None:
+                bucket = self.__device_buckets[device] = TokenBucket(self.device_rate, self.device_burst, now)
+            if not bucket.take(now):
+                self.stats["suppressed"] += 1
+                return ready
+
+            key = (notification.topic,) + _group_of(device)
+            window = self.__windows.get(key)
+            if window is None:
+                bucket = self.__group_buckets.get(key)
+                if bucket is None:
+                    bucket = self.__group_buckets[key] = TokenBucket(self.group_rate, self.group_burst, now)
+                if bucket.take(now):
+                    self.stats["passed"] += 1
+                    return ready + [notification]
+                # Всплеск превысил лимит группы: до конца окна её уведомления копятся в сводку
+                window = self.__windows[key] = _Window(now, notification)
+
+            window.devices.add(device)
+            window.events += 1
+            window.held.append(notification)
+            self.stats["merged"] += 1
+            return ready
+
+    def flush(self, force=False):
+        """Сводки окон, время которых истекло (force=True — всех окон)."""
+        with self.__lock:
+            return self.__close_windows(float("inf") if force else self.clock())
+
+    def forget(self, device):
+        with self.__lock:
+            self.__device_buckets.pop(device, None)
+            for key in [key for key in self.__group_buckets if key[3] == device.device_name]:
+                del self.__group_buckets[key]
+
+    def __close_windows(self, now):
+        ready = []
+        for key in [key for key, window in self.__windows.items() if window.opened + self.window <= now]:
+            window = self.__windows.pop(key)
+            if len(window.held) == 1 and window.events == 1:
+                ready.append(window.held[0])   # объединять было не с чем
+            elif window.held:
+                ready.append(self.__summary(window))
+                self.stats["summaries"] += 1
+        return ready
+
+    def __summary(self, window):
+        events = window.events
+        devices = len(window.devices)
+        phrase = self.PHRASES.get(window.topic, f"sent {window.topic} notifications")
+        if window.device_name is not None:
+            subject = window.device_name
+        else:
+            noun = window.device_type.lower() + ("s" if devices != 1 else "")
+            where = f" on {format_floor(window.floor)} floor" if window.floor is not None else ""
+            subject = f"{devices} {noun}{where}"
+        message = f"{subject} {phrase}" + (f" ({events} events)" if events > devices else "")
+        return Notification(window.topic, message, severity=window.severity)
+
+
+class Subscription:
+    __slots__ = ("subscriber", "topics", "sink")
+
+    def __init__(self, subscriber, topics, sink):
+        self.subscriber = subscriber
+        self.topics = set(topics) if topics else None
+        self.sink = sink
+
+    def accepts(self, topic):
+        return self.topics is None or topic in self.topics
+
+
+class NotificationCenter:
+    """Рассылает уведомления подписчикам синхронно или через ограниченную очередь и фоновые потоки."""
+
+    def __init__(self, home, mode="sync", queue_size=1000, batch_size=100, workers=1, backpressure="block",
+                 policy=None):
+        if mode not in ("sync", "async"):
+            raise ValueError("'mode' must be sync / async")
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"'backpressure' must be one of the: {BACKPRESSURE_POLICIES}")
+        self.home = home
+        self.subscribers = []
+        self.mode = mode
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.backpressure = backpressure
+        self.policy = policy
+
+        self.__subscriptions = []
+        self.__queue = deque()
+        self.__pending = {}  # (topic, message) -> Notification, для политики coalesce
+        self.__condition = threading.Condition()
+        self.__running = False
+        self.__workers = []
+        self.__stats = {"enqueued": 0, "delivered": 0, "dropped": 0, "coalesced": 0, "max_depth": 0}
+        self.__latencies = deque(maxlen=1000)
+        self.__started = time.monotonic()
+        self.__local = threading.local()
+
+        if mode == "async":
+            self.start(workers)
+
+    def subscribe(self, subscriber, topics=None, sink=None):
+        unknown = set(topics or ()) - set(TOPICS)
+        if unknown:
+            raise ValueError(f"Unknown topics: {', '.join(sorted(unknown))}. Topics: {', '.join(TOPICS)}")
+        self.subscribers.append(subscriber)
+        self.__subscriptions.append(Subscription(subscriber, topics, sink or ConsoleSink()))
+        echo(f"{subscriber} has subscribed to notifications.")
+
+    def unsubscribe(self, subscriber):
+        self.subscribers = [s for s in self.subscribers if s != subscriber]
+        self.__subscriptions = [s for s in self.__subscriptions if s.subscriber != subscriber]
+
+    def send_notification(self, message, topic="device", device=None, severity="info"):
+        if severity not in SEVERITIES:
+            raise ValueError(f"'severity' must be one of the: {SEVERITIES}")
+        reply = device is not None and device is getattr(self.__local, "reply", None)
+        notification = Notification(topic, message, device, severity, reply)
+        collected = getattr(self.__local, "collected", None)
+        if collected is not None:
+            collected.append(notification)
+            return
+        if self.policy is None:
+            self.__dispatch(notification)
+            return
+        for ready in self.policy.admit(notification):
+            self.__dispatch(ready)
+
+    def flush(self, force=True):
+        """Отправляет сводки окон политики, не дожидаясь их конца (force=False — только истёкших)."""
+        if self.policy is not None:
+            for ready in self.policy.flush(force):
+                self.__dispatch(ready)
+
+    def __dispatch(self, notification):
+        if self.mode == "sync" or not self.__running:
+            self.__deliver([notification])
+            return
+
+        topic, message = notification.topic, notification.message
+        with self.__condition:
+            if self.backpressure == "coalesce":
+                pending = self.__pending.get((topic, message))
+                if pending is not None:
+                    pending.count += 1
+                    self.__stats["coalesced"] += 1
+                    return
+
+            if len(self.__queue) >= self.queue_size:
+                if self.backpressure == "block":
+                    while len(self.__queue) >= self.queue_size and self.__running:
+                        self.__condition.wait()
+                else:
+                    dropped = self.__queue.popleft()
+                    self.__pending.pop((dropped.topic, dropped.message), None)
+                    self.__stats["dropped"] += 1
+
+            self.__queue.append(notification)
+            if self.backpressure == "coalesce":
+                self.__pending[(topic, message)] = notification
+            self.__stats["enqueued"] += 1
+            self.__stats["max_depth"] = max(self.__stats["max_depth"], len(self.__queue))
+            self.__condition.notify_all()
+
+    @contextmanager
+    def reply(self, device):
+        """Уведомления текущего потока об устройстве device внутри блока — ответ на команду пользователя.
+
+        device=None — в блоке ответов нет (действия правил внутри команды).
+        """
+        previous = getattr(self.__local, "reply", None)
+        self.__local.reply = device
+        try:
+            yield
+        finally:
+            self.__local.reply = previous
+
+    @contextmanager
+    def collect(self, summary):
+        """Копит уведомления текущего потока и по выходу отправляет вместо них одно — summary.
+
+        Так групповая команда над N устройствами даёт одно сводное уведомление, а не N.
+        """
+        if getattr(self.__local, "collected", None) is not None:
+            yield  # уже внутри другой группы — её сводка учтёт и эти уведомления
+            return
+        self.__local.collected = collected = []
+        try:
+            yield
+        finally:
+            self.__local.collected = None
+            if collected:
+                topic = Counter(n.topic for n in collected).most_common(1)[0][0]
+                severity = max((n.severity for n in collected), key=SEVERITIES.index)
+                self.send_notification(summary, topic, severity=severity)
+
+    def start(self, workers=1):
+        with self.__condition:
+            if self.__running:
+                return
+            self.__running = True
+        self.__started = time.monotonic()
+        self.__workers = [threading.Thread(target=self.__work, daemon=True) for _ in range(workers)]
+        for worker in self.__workers:
+            worker.start()
+
+    def stop(self, timeout=5):
+        """Отправляет незакрытые сводки, дожидается отправки очереди и останавливает фоновые потоки."""
+        self.flush()
+        with self.__condition:
+            self.__running = False
+            self.__condition.notify_all()
+        for worker in self.__workers:
+            worker.join(timeout)
+        self.__workers = []
+        for subscription in self.__subscriptions:
+            subscription.sink.close()
+
+    def metrics(self):
+        with self.__condition:
+            stats = dict(self.__stats)
+            stats["queue_depth"] = len(self.__queue)
+            latencies = sorted(self.__latencies)
+        elapsed = time.monotonic() - self.__started
+        stats["throughput"] = stats["delivered"] / elapsed if elapsed > 0 else 0.0
+        if self.policy is not None:
+            stats.update(self.policy.stats)
+        if latencies:
+            stats["latency_avg_ms"] = sum(latencies) / len(latencies) * 1000
+            stats["latency_p95_ms"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+            stats["latency_max_ms"] = latencies[-1] * 1000
+        return stats
+
+    def __work(self):
+        # С политикой поток просыпается и без новых уведомлений, чтобы вовремя отправить сводки окон
+        timeout = self.policy.window / 2 if self.policy is not None else None
+        while True:
+            with self.__condition:
+                while not self.__queue and self.__running:
+                    if not self.__condition.wait(timeout) and timeout is not None:
+                        break
+                if not self.__queue and not self.__running:
+                    return
+                batch = [self.__queue.popleft() for _ in range(min(self.batch_size, len(self.__queue)))]
+                for notification in batch:
+                    self.__pending.pop((notification.topic, notification.message), None)
+                self.__condition.notify_all()
+            if self.policy is not None:
+                batch += self.policy.flush(force=False)
+            if batch:
+                self.__deliver(batch)
+
+    def __deliver(self, notifications):
+        for subscription in self.__subscriptions:
+            matching = [n for n in notifications if subscription.accepts(n.topic)]
+            if not matching:
+                continue
+            subscription.sink.write(subscription.subscriber, matching)
+            self.home.log_events("User '%s' got message: %s",
+                                 [(subscription.subscriber, notification) for notification in matching])
+
+        now = time.monotonic()
+        with self.__condition:
+            self.__stats["delivered"] += len(notifications)
+            self.__latencies.extend(now - n.created for n in notifications)
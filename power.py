@@ -0,0 +1,158 @@
+import threading
+
+# Чем больше число, тем важнее устройство: при перегрузке первыми выключаются наименее важные
+DEFAULT_PRIORITY = {"Light": 1, "Thermostat": 2, "Camera": 3}
+
+
+def device_priority(device):
+    if device._priority is not None:
+        return device._priority
+    return DEFAULT_PRIORITY.get(type(device).__name__, 0)
+
+
+class Circuit:
+    """Цепь с лимитом мощности: вся квартира, комната, этаж или тип устройств."""
+
+    def __init__(self, name, limit, room=None, floor=None, device_type=None, shed_load=True):
+        if not isinstance(limit, int) or limit <= 0:
+            raise ValueError("Circuit limit must be a positive integer!")
+        self.name = name
+        self.limit = limit
+        self.room = room
+        self.floor = floor
+        self.device_type = device_type
+        self.shed_load = shed_load
+        self.load = 0
+
+    def __str__(self):
+        return f"{self.name}: {self.load}W / {self.limit}W"
+
+    def covers(self, room, floor, device_type):
+        return ((self.room is None or self.room == room)
+                and (self.floor is None or self.floor == floor)
+                and (self.device_type is None or self.device_type == device_type))
+
+    @property
+    def overloaded(self):
+        return self.load >= self.limit
+
+
+class PowerMeter:
+    """Текущая потребляемая мощность, обновляемая на каждом включении/выключении устройства.
+
+    Для каждого устройства запоминается, что именно было учтено, поэтому update() можно
+    вызывать сколько угодно раз — счётчики всегда сходятся к текущему состоянию устройств.
+    """
+
+    def __init__(self, limit, on_overload=None):
+        self.main = Circuit("main", limit, shed_load=False)
+        self.circuits = {"main": self.main}
+        self.on_overload = on_overload
+        self.by_room = {}
+        self.by_floor = {}
+        self.by_type = {}
+        self.__counted = {}  # устройство -> (мощность, комната, этаж, тип, цепи)
+        self.__draw = {}     # устройство -> фактическая мощность, если она не равна номинальной
+        self.__lock = threading.RLock()
+
+    @property
+    def total(self):
+        return self.main.load
+
+    def overloaded(self):
+        return self.main.overloaded
+
+    def update(self, device):
+        """Пересчитывает вклад устройства после включения, выключения или переезда."""
+        with self.__lock:
+            before = [circuit.overloaded for circuit in self.circuits.values()]
+            previous = self.__counted.pop(device, None)
+            if previous is not None:
+                self.__apply(previous, -1)
+            if (previous is not None) != (device._status == "On"):
+                # После включения или выключения прежняя фактическая мощность уже не верна:
+                # до следующего замера считаем номинальную
+                self.__draw.pop(device, None)
+            if device._status == "On":
+                entry = self.__entry(device)
+                self.__counted[device] = entry
+                self.__apply(entry, 1)
+            crossed = self.__crossed(before)
+        self.__notify(crossed)
+
+    def set_draw(self, draws):
+        """Фактическая мощность устройств, которые берут из сети меньше номинала (термостат без нагрузки).
+
+        draws — пары (устройство, ватты) за один тик, пересчитываются под одной блокировкой.
+        """
+        with self.__lock:
+            before = [circuit.overloaded for circuit in self.circuits.values()]
+            for device, watts in draws:
+                self.__draw[device] = watts
+                previous = self.__counted.get(device)
+                if previous is not None and previous[0] != watts:
+                    self.__apply(previous, -1)
+                    entry = (watts,) + previous[1:]
+                    self.__counted[device] = entry
+                    self.__apply(entry, 1)
+            crossed = self.__crossed(before)
+        self.__notify(crossed)
+
+    def forget(self, device):
+        with self.__lock:
+            self.__draw.pop(device, None)
+            previous = self.__counted.pop(device, None)
+            if previous is not None:
+                self.__apply(previous, -1)
+
+    def add_circuit(self, name, limit, room=None, floor=None, device_type=None, shed_load=True):
+        circuit = Circuit(name, limit, room, floor, device_type, shed_load)
+        with self.__lock:
+            if name in self.circuits:
+                raise ValueError(f"Circuit '{name}' already exists")
+            self.circuits[name] = circuit
+            # Пересчитываем только что созданную цепь по уже включённым устройствам
+            for device, entry in list(self.__counted.items()):
+                if circuit.covers(*entry[1:4]):
+                    self.__counted[device] = entry[:4] + (entry[4] + (circuit,),)
+                    circuit.load += entry[0]
+        # Цепь, перегруженная уже при создании, тоже считается перешедшей через лимит
+        self.__notify([circuit] if circuit.overloaded else [])
+        return circuit
+
+    def remove_circuit(self, name):
+        if name == "main":
+            raise ValueError("Main circuit cannot be removed")
+        with self.__lock:
+            circuit = self.circuits.pop(name)
+            for device, entry in list(self.__counted.items()):
+                if circuit in entry[4]:
+                    self.__counted[device] = entry[:4] + (tuple(c for c in entry[4] if c is not circuit),)
+
+    def devices_on(self, circuit):
+        with self.__lock:
+            return [device for device, entry in self.__counted.items() if circuit in entry[4]]
+
+    def __entry(self, device):
+        room, floor, device_type = device._location, device._floor_number, type(device).__name__
+        circuits = tuple(c for c in self.circuits.values() if c.covers(room, floor, device_type))
+        return self.__draw.get(device, device.power_consumption), room, floor, device_type, circuits
+
+    def __crossed(self, before):
+        # Срабатываем только на переходе через лимит, а не при каждом изменении под перегрузкой
+        return [circuit for circuit, was_overloaded in zip(self.circuits.values(), before)
+                if circuit.overloaded and not was_overloaded]
+
+    def __notify(self, crossed):
+        if self.on_overload:
+            for circuit in crossed:
+                self.on_overload(circuit)
+
+    def __apply(self, entry, sign):
+        power, room, floor, device_type, circuits = entry
+        for totals, key in ((self.by_room, room), (self.by_floor, floor), (self.by_type, device_type)):
+            totals[key] = totals.get(key, 0) + sign * power
+            if not totals[key]:
+                del totals[key]
+        for circuit in circuits:
+            circuit.load += sign * power
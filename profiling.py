@@ -0,0 +1,246 @@
+"""Встроенное профилирование горячих путей: счётчики, гистограммы задержек, отставание тиков, ожидание блокировок.
+
+По умолчанию выключено и ничего не стоит: Profiler.install() подменяет методы своего дома и его центра
+уведомлений обёртками с замером (атрибутами экземпляров, другие дома процесса не затрагиваются),
+uninstall() убирает обёртки. Результаты — stats() или export() в текстовом формате Prometheus.
+"""
+from bisect import bisect_left
+import os
+import threading
+import time
+
+import smart_device
+
+# Верхние границы корзин гистограмм, секунды
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+           0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum", "max", "lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # последняя — +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(BUCKETS, value)] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent):
+        """Оценка сверху: граница корзины, в которую попадает percent-й процентиль."""
+        rank = self.count * percent / 100
+        total = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+
+class _TimedLock:
+    """Обёртка над RLock устройства: захват без ожидания почти бесплатен, ожидание попадает в гистограммы.
+
+    Полосы блокировок устройств общие для всего процесса, поэтому обёртки ставятся один раз на все
+    включённые профайлеры и снимаются, когда выключается последний.
+    """
+
+    __slots__ = ("lock",)
+    profilers = ()
+
+    def __init__(self, lock):
+        self.lock = lock
+
+    def acquire(self, blocking=True, timeout=-1):
+        if self.lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        started = time.perf_counter()
+        acquired = self.lock.acquire(True, timeout)
+        wait = time.perf_counter() - started
+        for profiler in _TimedLock.profilers:
+            profiler.observe_lock("device", wait)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Profiler:
+    """Замеры для control_device, send_notification, update_battery, фоновых циклов и блокировок устройств."""
+
+    def __init__(self, home):
+        self.home = home
+        self.installed = False
+        self.started = None
+        self.calls = {}         # путь -> Histogram длительности вызова
+        self.errors = {}        # путь -> число исключений
+        self.tick_lag = {}      # цикл -> Histogram отставания от срока
+        self.tick_time = {}     # цикл -> Histogram длительности тика
+        self.overruns = {}      # цикл -> тики, которые шли дольше своего интервала
+        self.lock_wait = {}     # блокировка -> Histogram ожидания
+        self.__patched = []     # (объект, имя) — обёртки в атрибутах экземпляров
+        self.__center = None
+
+    def install(self):
+        if self.installed:
+            return
+        self.reset()
+        # Фоновые циклы дома ищут метод при каждом тике, поэтому обёртка экземпляра подхватывается сразу
+        self.__patch(self.home, "control_device")
+        self.__patch(self.home, "update_batteries")
+        self.installed = True
+        self.watch_center(self.home.notification_center)
+        with _LOCKS_GUARD:
+            if not _TimedLock.profilers:
+                smart_device._DEVICE_LOCKS = tuple(_TimedLock(lock) for lock in smart_device._DEVICE_LOCKS)
+            _TimedLock.profilers += (self,)
+        self.home.runtime.observer = self.observe_tick
+
+    def uninstall(self):
+        if not self.installed:
+            return
+        for owner, name in reversed(self.__patched):
+            owner.__dict__.pop(name, None)
+        self.__patched = []
+        self.__center = None
+        with _LOCKS_GUARD:
+            _TimedLock.profilers = tuple(profiler for profiler in _TimedLock.profilers if profiler is not self)
+            if not _TimedLock.profilers:
+                smart_device._DEVICE_LOCKS = tuple(lock.lock for lock in smart_device._DEVICE_LOCKS)
+        self.home.runtime.observer = None
+        self.installed = False
+
+    def watch_center(self, center):
+        """Замеряет send_notification центра уведомлений дома; вызывается и при смене центра."""
+        if not self.installed or center is self.__center:
+            return
+        if self.__center is not None:
+            self.__center.__dict__.pop("send_notification", None)
+            self.__patched = [(owner, name) for owner, name in self.__patched if owner is not self.__center]
+        self.__center = center
+        if center is not None:
+            self.__patch(center, "send_notification")
+
+    def timed(self, name, function):
+        """function с замером длительности и исключений под именем name."""
+        histogram = _histogram(self.calls, name)
+        errors = self.errors
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                errors[name] = errors.get(name, 0) + 1
+                raise
+            finally:
+                histogram.observe(perf_counter() - started)
+
+        timed.__name__ = getattr(function, "__name__", name)
+        timed.__doc__ = function.__doc__
+        return timed
+
+    def reset(self):
+        self.started = time.monotonic()
+        for table in (self.calls, self.errors, self.tick_lag, self.tick_time, self.overruns, self.lock_wait):
+            table.clear()
+
+    def observe_tick(self, timer, lag, duration):
+        _histogram(self.tick_lag, timer.name).observe(lag)
+        _histogram(self.tick_time, timer.name).observe(duration)
+        if duration > timer.interval:
+            self.overruns[timer.name] = self.overruns.get(timer.name, 0) + 1
+
+    def observe_lock(self, name, wait):
+        _histogram(self.lock_wait, name).observe(wait)
+
+    def stats(self):
+        """Сводка в виде строк для команды stats."""
+        elapsed = time.monotonic() - self.started if self.started is not None else 0.0
+        lines = [f"Profiling for {elapsed:.1f}s"]
+        for path, histogram in sorted(self.calls.items()):
+            lines.append(f"{path}: {histogram.count} calls ({histogram.count / elapsed if elapsed else 0:.0f}/s), "
+                         f"{_timings(histogram)}, {self.errors.get(path, 0)} error(s)")
+        for name, histogram in sorted(self.tick_time.items()):
+            lag = self.tick_lag[name]
+            lines.append(f"loop {name}: {histogram.count} ticks, {_timings(histogram)}, "
+                         f"lag p99 {lag.percentile(99) * 1000:.3f} max {lag.max * 1000:.3f} ms, "
+                         f"{self.overruns.get(name, 0)} overrun(s)")
+        for name, histogram in sorted(self.lock_wait.items()):
+            lines.append(f"{name} locks: {histogram.count} contended acquire(s), {_timings(histogram)}")
+        return lines
+
+    def export(self, filename):
+        """Пишет метрики в текстовом формате Prometheus (через временный файл, чтобы читатель не увидел половину)."""
+        lines = []
+        _histogram_lines(lines, "smarthome_call_seconds", "Duration of instrumented calls.", "path", self.calls)
+        lines += ["# HELP smarthome_call_errors_total Exceptions raised by instrumented calls.",
+                  "# TYPE smarthome_call_errors_total counter"]
+        lines += [f'smarthome_call_errors_total{{path="{path}"}} {self.errors.get(path, 0)}' for path in sorted(self.calls)]
+        _histogram_lines(lines, "smarthome_tick_seconds", "Duration of background loop ticks.", "loop", self.tick_time)
+        _histogram_lines(lines, "smarthome_tick_lag_seconds", "How late background loop ticks started.", "loop",
+                         self.tick_lag)
+        lines += ["# HELP smarthome_tick_overruns_total Ticks that took longer than their interval.",
+                  "# TYPE smarthome_tick_overruns_total counter"]
+        lines += [f'smarthome_tick_overruns_total{{loop="{name}"}} {self.overruns.get(name, 0)}'
+                  for name in sorted(self.tick_time)]
+        _histogram_lines(lines, "smarthome_lock_wait_seconds", "Time spent waiting for contended locks.", "lock",
+                         self.lock_wait)
+        temporary = filename + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary, filename)
+
+    def __patch(self, owner, name):
+        setattr(owner, name, self.timed(name, getattr(owner, name)))
+        self.__patched.append((owner, name))
+
+
+_LOCKS_GUARD = threading.Lock()
+
+
+def _histogram(table, name):
+    histogram = table.get(name)
+    if histogram is None:
+        histogram = table.setdefault(name, Histogram())
+    return histogram
+
+
+def _timings(histogram):
+    if not histogram.count:
+        return "no samples"
+    return (f"avg {histogram.sum / histogram.count * 1000:.3f} p50 {histogram.percentile(50) * 1000:.3f} "
+            f"p99 {histogram.percentile(99) * 1000:.3f} max {histogram.max * 1000:.3f} ms")
+
+
+def _histogram_lines(lines, metric, help, label, histograms):
+    lines += [f"# HELP {metric} {help}", f"# TYPE {metric} histogram"]
+    for name, histogram in sorted(histograms.items()):
+        for bound, total in histogram.cumulative():
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{metric}_bucket{{{label}="{name}",le="{le}"}} {total}')
+        lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.sum!r}')
+        lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
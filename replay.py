@@ -0,0 +1,79 @@
+"""Проигрывание записанных команд (файл или stdin) без интерактивного ввода с замером задержек."""
+from contextlib import nullcontext, redirect_stdout
+import os
+import sys
+import time
+
+
+class ReplayStats:
+    def __init__(self):
+        self.latencies = []   # секунды на команду
+        self.lag = 0.0        # максимальное отставание от заданного темпа, секунды
+        self.errors = 0       # команды, которые не выполнились: ошибка ввода, устройство не найдено, исключение
+        self.elapsed = 0.0
+
+    @property
+    def commands(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.commands / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+    def report(self):
+        lines = [f"Replayed {self.commands} command(s) in {self.elapsed:.2f}s ({self.throughput:.0f} cmd/s), "
+                 f"{self.errors} error(s)"]
+        if self.latencies:
+            latency = ", ".join(f"p{p} {self.percentile(p) * 1000:.3f}" for p in (50, 90, 99))
+            lines.append(f"Latency, ms: {latency}, max {max(self.latencies) * 1000:.3f}")
+        if self.lag:
+            lines.append(f"Max lag behind target rate: {self.lag * 1000:.1f} ms")
+        return "\n".join(lines)
+
+
+def read_commands(stream):
+    """Строки сценария без пустых и комментариев (#). "quit" завершает сценарий."""
+    for line in stream:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.lower() == "quit":
+            return
+        yield line
+
+
+def replay(home, commands, rate=None, quiet=False):
+    """Выполняет команды через home.control_device: как можно быстрее или rate команд в секунду.
+
+    quiet=True глушит вывод команд, чтобы замер не упирался в консоль.
+    """
+    stats = ReplayStats()
+    interval = 1 / rate if rate else 0
+    with open(os.devnull, "w") if quiet else nullcontext() as devnull, \
+            redirect_stdout(devnull) if quiet else nullcontext():
+        started = time.perf_counter()
+        for number, command in enumerate(commands):
+            if interval:
+                # Темп задаётся от начала сценария, поэтому медленная команда не сдвигает все следующие
+                delay = started + number * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    stats.lag = max(stats.lag, -delay)
+
+            begin = time.perf_counter()
+            try:
+                if home.control_device(command) is False:
+                    stats.errors += 1
+            except Exception as e:
+                stats.errors += 1
+                print(f"Error in '{command}': {e}", file=sys.stderr)
+            stats.latencies.append(time.perf_counter() - begin)
+        stats.elapsed = time.perf_counter() - started
+    return stats
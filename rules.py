@@ -0,0 +1,302 @@
+"""Правила автоматизации: "когда <условие> — выполнить <команду>".
+
+Условие — одно или несколько выражений через " and ":
+    motion in Hall                       событие: движение на камере в комнате Hall
+    motion on floor 2                    ... на любой камере 2-го этажа
+    Thermostat.mode == Heating           хотя бы один термостат в режиме Heating
+    Light.status == On in Kitchen        хотя бы одна лампа на кухне включена
+    power > 3000                         активная мощность дома больше 3000 Вт
+Действие — любая команда control_device, например групповая "turn_on --type Light --floor 1".
+
+Правило с событием срабатывает на каждое подходящее событие, если остальные условия выполнены.
+Правило из одних условий срабатывает, когда условия становятся верными (а не пока они верны).
+"""
+import re
+import threading
+
+from commands import echo
+
+OPERATORS = {
+    "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+}
+EVENTS = ("motion",)
+# Имя в условии -> поле устройства, изменение которого сообщает _state_changed
+ATTRIBUTES = {"status": "_status", "mode": "mode", "temperature": "temperature", "brightness": "brightness",
+              "color": "color", "recording": "_is_recording", "charging": "_is_charging",
+              "priority": "_priority", "location": "_location", "floor": "_floor"}
+
+_CLAUSE = re.compile(r"^(?:(?P<type>[A-Za-z]\w*)\.)?(?P<name>\w+)"
+                     r"(?:\s*(?P<op>==|!=|>=|<=|>|<)\s*(?P<value>.+?))?"
+                     r"(?:\s+in\s+(?P<room>.+?))?(?:\s+on floor\s+(?P<floor>-?\d+))?$")
+
+
+class RuleError(ValueError):
+    pass
+
+
+def _value(raw):
+    if raw in ("True", "False"):
+        return raw == "True"
+    for convert in (int, float):
+        try:
+            return convert(raw)
+        except ValueError:
+            pass
+    return raw
+
+
+def _compare(operator, actual, expected):
+    if isinstance(actual, str) and isinstance(expected, str):
+        actual, expected = actual.lower(), expected.lower()
+    try:
+        return OPERATORS[operator](actual, expected)
+    except TypeError:  # None или несравнимые типы — условие не выполнено
+        return False
+
+
+class Clause:
+    """Одно выражение условия. watches — поля, при изменении которых его нужно пересчитать."""
+
+    def __init__(self, text, device_type=None, room=None, floor=None):
+        self.text = text
+        self.device_type = device_type
+        self.room = room
+        self.floor = floor
+        self.watches = ()
+
+    def where(self, device):
+        return ((self.device_type is None or type(device).__name__ == self.device_type)
+                and (self.room is None or device._location == self.room)
+                and (self.floor is None or device._floor_number == self.floor))
+
+    def __str__(self):
+        return self.text
+
+
+class EventClause(Clause):
+    """Событие устройства (движение): верно только в момент самого события на подходящем устройстве."""
+
+    def __init__(self, text, event, **filters):
+        super().__init__(text, **filters)
+        self.event = event
+        self.watches = (event,)
+
+    def holds(self, device, attribute):
+        return attribute == self.event and device is not None and self.where(device)
+
+
+class StateClause(Clause):
+    """Условие на состояние устройств: хранит множество подходящих устройств и обновляет его по изменениям."""
+
+    def __init__(self, text, field, operator, value, **filters):
+        super().__init__(text, **filters)
+        # Этаж сообщается как "_floor" ("2nd"), а сравнивается номер
+        self.attribute = "_floor_number" if field == "_floor" else field
+        self.operator = operator
+        self.value = value
+        self.matching = set()
+        # Смена комнаты или этажа может вывести устройство из-под фильтра
+        self.watches = (field,) + tuple(watched for watched, used in (("_location", self.room), ("_floor", self.floor))
+                                        if used is not None and watched != field)
+
+    def update(self, device):
+        if self.where(device) and _compare(self.operator, getattr(device, self.attribute, None), self.value):
+            self.matching.add(device)
+        else:
+            self.matching.discard(device)
+
+    def holds(self, device, attribute):
+        return bool(self.matching)
+
+
+class PowerClause(Clause):
+    """Условие на активную мощность дома. Мощность меняется при включении и выключении устройств
+    и при изменении фактической мощности термостатов (поле "power", см. SmartHome.update_climate)."""
+
+    def __init__(self, text, power, operator, value):
+        super().__init__(text)
+        self.power = power
+        self.operator = operator
+        self.value = value
+        self.watches = ("_status", "power")
+
+    def holds(self, device, attribute):
+        return _compare(self.operator, self.power.total, self.value)
+
+
+class Rule:
+    __slots__ = ("name", "trigger", "action", "command", "clauses", "event", "active", "fired")
+
+    def __init__(self, name, trigger, action, command, clauses):
+        self.name = name
+        self.trigger = trigger
+        self.action = action
+        self.command = command
+        self.clauses = clauses
+        self.event = any(isinstance(clause, EventClause) for clause in clauses)
+        self.active = False   # для правил без событий: условия уже были верны при прошлой проверке
+        self.fired = 0
+
+    def holds(self, device, attribute):
+        return all(clause.holds(device, attribute) for clause in self.clauses)
+
+    def __str__(self):
+        return f"{self.name}: when {self.trigger} then {self.action}"
+
+
+class RuleEngine:
+    """Правила, проиндексированные по полям, за которыми они следят.
+
+    Изменение поля устройства пересчитывает только выражения, подписанные на это поле, и проверяет
+    только их правила. Действия выполняются синхронно в том же потоке, поэтому каскад (действие
+    правила вызвало другое правило) виден как цепочка: правило, уже стоящее в цепочке, не срабатывает
+    повторно (цикл), а цепочка длиннее max_depth обрывается.
+    """
+
+    def __init__(self, home, max_depth=5):
+        self.home = home
+        self.max_depth = max_depth
+        self.stats = {"evaluated": 0, "fired": 0, "cycles": 0, "cut": 0}
+        self.__rules = {}
+        self.__index = {}           # поле -> [(выражение, правило)]
+        self.__state_clauses = []   # StateClause всех правил — для добавления и удаления устройств
+        self.__lock = threading.RLock()
+        self.__local = threading.local()
+
+    def __len__(self):
+        return len(self.__rules)
+
+    def __iter__(self):
+        return iter(list(self.__rules.values()))
+
+    def get(self, name):
+        return self.__rules.get(name)
+
+    def add(self, name, trigger, action):
+        """Разбирает условие и команду и включает правило. Ошибки — RuleError / CommandError."""
+        if name in self.__rules:
+            raise RuleError(f"Rule '{name}' already exists.")
+        command = self.home.commands.parse(action)
+        clauses = [self.__parse_clause(text.strip()) for text in re.split(r"\s+and\s+", trigger.strip())]
+        rule = Rule(name, trigger.strip(), action.strip(), command, clauses)
+        with self.__lock:
+            for clause in clauses:
+                if isinstance(clause, StateClause):
+                    for device in self.home.registry.snapshot():
+                        clause.update(device)
+                    self.__state_clauses.append(clause)
+                for attribute in clause.watches:
+                    self.__index.setdefault(attribute, []).append((clause, rule))
+            # Условия, уже верные при добавлении, не считаются срабатыванием
+            rule.active = not rule.event and rule.holds(None, None)
+            self.__rules[name] = rule
+        return rule
+
+    def remove(self, name):
+        with self.__lock:
+            rule = self.__rules.pop(name, None)
+            if rule is None:
+                return None
+            for attribute in list(self.__index):
+                entries = [entry for entry in self.__index[attribute] if entry[1] is not rule]
+                if entries:
+                    self.__index[attribute] = entries
+                else:
+                    del self.__index[attribute]
+            self.__state_clauses = [clause for clause in self.__state_clauses if clause not in rule.clauses]
+        return rule
+
+    def device_added(self, device):
+        if self.__state_clauses:
+            with self.__lock:
+                for clause in self.__state_clauses:
+                    clause.update(device)
+
+    def device_removed(self, device):
+        if self.__state_clauses:
+            with self.__lock:
+                for clause in self.__state_clauses:
+                    clause.matching.discard(device)
+                for rule in self.__rules.values():
+                    if not rule.event:
+                        rule.active = rule.holds(None, None)
+
+    def changed(self, device, attribute):
+        """Слушатель изменений: без правил на это поле — один поиск в словаре."""
+        entries = self.__index.get(attribute)
+        if not entries:
+            return
+        due = []
+        with self.__lock:
+            checked = set()
+            for clause, rule in entries:
+                if isinstance(clause, StateClause) and clause not in checked:
+                    checked.add(clause)
+                    clause.update(device)
+            for rule in dict.fromkeys(rule for _, rule in entries):
+                self.stats["evaluated"] += 1
+                holds = rule.holds(device, attribute)
+                if rule.event:
+                    if holds:
+                        due.append(rule)
+                    continue
+                if holds and not rule.active:
+                    due.append(rule)
+                rule.active = holds
+        for rule in due:
+            self.__fire(rule)
+
+    def __fire(self, rule):
+        chain = getattr(self.__local, "chain", None)
+        if chain is None:
+            chain = self.__local.chain = []
+        if rule in chain:
+            self.stats["cycles"] += 1
+            self.home.log_event("Rule cycle skipped: %s", " -> ".join(r.name for r in chain + [rule]))
+            return
+        if len(chain) >= self.max_depth:
+            self.stats["cut"] += 1
+            echo(f"Rule cascade cut at depth {self.max_depth}: rule '{rule.name}' skipped.")
+            self.home.log_event("Rule cascade cut at depth %s: %s", self.max_depth,
+                                " -> ".join(r.name for r in chain + [rule]))
+            return
+        chain.append(rule)
+        try:
+            rule.fired += 1
+            self.stats["fired"] += 1
+            self.home.log_event("Rule '%s' fired: %s", rule.name, rule.action)
+            center = self.home.notification_center
+            if center is None:
+                self.home.execute(rule.command)
+            else:
+                with center.reply(None):   # действие правила — не ответ на команду пользователя
+                    self.home.execute(rule.command)
+        except Exception as e:
+            echo(f"Error in rule '{rule.name}': {e}")
+        finally:
+            chain.pop()
+
+    def __parse_clause(self, text):
+        match = _CLAUSE.match(text)
+        if match is None:
+            raise RuleError(f"Cannot parse condition: {text}")
+        device_type, name, operator, raw, room, floor = match.group("type", "name", "op", "value", "room", "floor")
+        filters = {"device_type": device_type, "room": room, "floor": int(floor) if floor is not None else None}
+        if name in EVENTS:
+            if operator is not None:
+                raise RuleError(f"Event '{name}' takes no comparison: {text}")
+            return EventClause(text, name, **filters)
+        if operator is None:
+            raise RuleError(f"Condition needs a comparison (==, !=, >, >=, <, <=): {text}")
+        value = _value(raw.strip())
+        if name == "power" and device_type is None:
+            if room is not None or floor is not None:
+                raise RuleError(f"Power condition takes no room or floor: {text}")
+            return PowerClause(text, self.home.power, operator, value)
+        field = ATTRIBUTES.get(name)
+        if field is None:
+            raise RuleError(f"Unknown attribute '{name}'. Attributes: power, {', '.join(ATTRIBUTES)}; "
+                            f"events: {', '.join(EVENTS)}")
+        return StateClause(text, field, operator, value, **filters)
@@ -0,0 +1,199 @@
+from datetime import datetime
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+
+
+class RealClock:
+    simulated = False
+
+    def time(self):
+        return time.time()
+
+    def now(self):
+        return datetime.now()
+
+
+class SimulatedClock:
+    """Модельное время: идёт только тогда, когда его двигает SimulationRuntime."""
+
+    simulated = True
+
+    def __init__(self, start=None):
+        self.__time = start.timestamp() if start else time.time()
+
+    def time(self):
+        return self.__time
+
+    def now(self):
+        return datetime.fromtimestamp(self.__time)
+
+    def advance_to(self, moment):
+        if moment > self.__time:
+            self.__time = moment
+
+
+class Timer:
+    __slots__ = ("name", "interval", "callback", "due", "cancelled")
+
+    def __init__(self, name, interval, callback, due):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.due = due
+        self.cancelled = False
+
+
+class SimulationRuntime:
+    """Один поток с asyncio-циклом, в котором по таймерам выполняются все периодические задачи дома.
+
+    speed задаёт ускорение модельного времени (speed=1440 — сутки за минуту),
+    speed=None — без пауз, так быстро, как позволяет процессор.
+    """
+
+    def __init__(self, clock=None, speed=1.0):
+        self.clock = clock or RealClock()
+        self.speed = speed
+        self.loop = None
+        self.observer = None  # observer(timer, lag, duration) после каждого срабатывания, см. profiling.Profiler
+        self.__timers = []
+        self.__counter = itertools.count()
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.__wakeup = None
+        self.__ready = threading.Event()
+        self.__running = False
+        self.__anchor = None
+
+    @property
+    def running(self):
+        return self.__running
+
+    def every(self, interval, callback, name=None):
+        """Запускает callback каждые interval секунд (модельного времени)."""
+        if interval <= 0:
+            raise ValueError("'interval' must be positive")
+        timer = Timer(name or getattr(callback, "__name__", "timer"), interval, callback,
+                      self.clock.time() + interval)
+        with self.__lock:
+            heapq.heappush(self.__timers, (timer.due, next(self.__counter), timer))
+        self.__wake()
+        return timer
+
+    def cancel(self, timer):
+        timer.cancelled = True
+        self.__wake()
+
+    def timers(self):
+        with self.__lock:
+            return [timer for _, _, timer in sorted(self.__timers) if not timer.cancelled]
+
+    def start(self):
+        if self.__running:
+            return
+        self.__running = True
+        self.__ready.clear()
+        self.__thread = threading.Thread(target=lambda: asyncio.run(self.__main()), daemon=True)
+        self.__thread.start()
+        self.__ready.wait()
+
+    def stop(self, timeout=5):
+        """Останавливает цикл и дожидается завершения потока."""
+        if not self.__running:
+            return
+        self.__running = False
+        self.__wake()
+        if self.__thread is not threading.current_thread():
+            self.__thread.join(timeout)
+        self.__thread = None
+        self.loop = None
+
+    def run_for(self, seconds):
+        """Синхронно прогоняет seconds модельного времени без пауз. Только для SimulatedClock."""
+        if not self.clock.simulated:
+            raise RuntimeError("run_for() requires SimulatedClock")
+        if self.__running:
+            raise RuntimeError("Runtime is already running in background")
+        until = self.clock.time() + seconds
+        while True:
+            timer = self.__pop_due(until)
+            if timer is None:
+                break
+            self.__fire(timer, 0.0)
+        self.clock.advance_to(until)
+
+    async def __main(self):
+        self.loop = asyncio.get_running_loop()
+        self.__wakeup = asyncio.Event()
+        # Модельное время отсчитывается от точки старта, поэтому паузы между тиками не накапливают дрейф
+        self.__anchor = (time.monotonic(), self.clock.time())
+        self.__ready.set()
+        while self.__running:
+            due = self.__next_due()
+            delay = None if due is None else self.__delay_until(due)
+            if delay is None or delay > 0:
+                self.__wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.__wakeup.wait(), delay)
+                    continue  # таймеры изменились — пересчитываем ближайший
+                except asyncio.TimeoutError:
+                    if not self.clock.simulated:
+                        continue
+
+            timer = self.__pop_due(due)
+            if timer is not None:
+                self.__fire(timer, max(0.0, -self.__delay_until(due)))
+            # Отдаём управление другим задачам цикла (например, серверу управления)
+            await asyncio.sleep(0)
+
+    def __delay_until(self, due):
+        if not self.clock.simulated:
+            return due - self.clock.time()
+        if self.speed is None:
+            return 0
+        real_start, simulated_start = self.__anchor
+        return (due - simulated_start) / self.speed - (time.monotonic() - real_start)
+
+    def __next_due(self):
+        with self.__lock:
+            while self.__timers and self.__timers[0][2].cancelled:
+                heapq.heappop(self.__timers)
+            return self.__timers[0][0] if self.__timers else None
+
+    def __pop_due(self, until):
+        with self.__lock:
+            while self.__timers:
+                due, _, timer = self.__timers[0]
+                if timer.cancelled:
+                    heapq.heappop(self.__timers)
+                    continue
+                if due > until:
+                    return None
+                heapq.heappop(self.__timers)
+                timer.due = due + timer.interval
+                heapq.heappush(self.__timers, (timer.due, next(self.__counter), timer))
+                if self.clock.simulated:
+                    self.clock.advance_to(due)
+                return timer
+        return None
+
+    def __fire(self, timer, lag):
+        """lag — на сколько реальных секунд срабатывание опоздало к сроку."""
+        observer = self.observer
+        started = time.perf_counter() if observer is not None else 0.0
+        try:
+            timer.callback()
+        except Exception as e:
+            print(f"Error in {timer.name}: {e}")
+        if observer is not None:
+            observer(timer, lag, time.perf_counter() - started)
+
+    def __wake(self):
+        loop, wakeup = self.loop, self.__wakeup
+        if loop is not None and wakeup is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:  # цикл уже закрыт
+                pass
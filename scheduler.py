@@ -0,0 +1,268 @@
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import threading
+
+
+class DailyRule:
+    """Каждый день в HH:MM."""
+
+    def __init__(self, time):
+        hour, minute = time.split(":")
+        self.hour, self.minute = int(hour), int(minute)
+        if not (0 <= self.hour < 24 and 0 <= self.minute < 60):
+            raise ValueError(f"Invalid time: {time}. Time format: HH:MM")
+
+    def __str__(self):
+        return f"{self.hour:02d}:{self.minute:02d}"
+
+    def next_after(self, moment):
+        candidate = moment.replace(hour=self.hour, minute=self.minute, second=0, microsecond=0)
+        if candidate <= moment:
+            candidate += timedelta(days=1)
+        return candidate
+
+
+class IntervalRule:
+    """Каждые N секунд/минут/часов, начиная с момента создания."""
+
+    UNITS = {"s": 1, "m": 60, "h": 3600}
+
+    def __init__(self, every, start):
+        unit = every[-1]
+        if unit not in self.UNITS or not every[:-1].isdigit() or int(every[:-1]) <= 0:
+            raise ValueError(f"Invalid interval: {every}. Example: every 15m")
+        self.text = every
+        self.interval = timedelta(seconds=int(every[:-1]) * self.UNITS[unit])
+        self.start = start
+
+    def __str__(self):
+        return f"every {self.text}"
+
+    def next_after(self, moment):
+        if moment < self.start:
+            return self.start
+        periods = (moment - self.start) // self.interval + 1
+        return self.start + periods * self.interval
+
+
+class OnceRule:
+    """Один раз в указанный момент."""
+
+    def __init__(self, moment):
+        self.moment = moment
+
+    def __str__(self):
+        return f"once {self.moment:%Y-%m-%d %H:%M}"
+
+    def next_after(self, moment):
+        return self.moment if self.moment > moment else None
+
+
+class CronRule:
+    """Правило в формате cron: "минута час день месяц день_недели" (0 — воскресенье)."""
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression: {expression}. Example: cron */5 * * * *")
+        self.expression = expression
+        parsed = [self.__parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELDS)]
+        self.minutes, self.hours, self.days, self.months, self.weekdays = parsed
+        self.__any_day = fields[2] == "*"
+        self.__any_weekday = fields[4] == "*"
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self.__day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        return None
+
+    def __day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.__any_day or self.__any_weekday:
+            return day and weekday
+        return day or weekday
+
+    @staticmethod
+    def __parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step = part.split("/")
+                step = int(step)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = map(int, part.split("-"))
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end or step <= 0:
+                raise ValueError(f"Cron field '{field}' must be in range {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
+
+
+def parse_rule(text, now):
+    """Разбирает расписание: "18:00", "every 15m", "once 2024-01-01 18:00" или "cron */5 * * * *"."""
+    text = text.strip()
+    if text.startswith("every "):
+        return IntervalRule(text[len("every "):].strip(), now)
+    if text.startswith("once "):
+        return OnceRule(datetime.strptime(text[len("once "):].strip(), "%Y-%m-%d %H:%M"))
+    if text.startswith("cron "):
+        return CronRule(text[len("cron "):])
+    return DailyRule(text)
+
+
+class ScheduledJob:
+    __slots__ = ("when", "device", "command", "rule", "cancelled")
+
+    def __init__(self, when, device, command, rule):
+        self.when = when
+        self.device = device
+        self.command = command   # Command, проверенная CommandRegistry.bind при добавлении
+        self.rule = rule
+        self.cancelled = False
+
+    @property
+    def action(self):
+        return self.command.name
+
+    @property
+    def args(self):
+        return self.command.args
+
+    def __str__(self):
+        args = " ".join(str(arg) for arg in self.args)
+        return f"{self.action} {args}".strip() + f" at {self.rule} (next: {self.when:%Y-%m-%d %H:%M:%S})"
+
+    def run(self, execute):
+        # Не включаем уже включённое устройство (как и старый check_schedule)
+        if self.action == "turn_on" and self.device._status == "On":
+            return
+        if self.action == "turn_off" and self.device._status == "Off":
+            return
+        if execute(self.device, self.command) is False:
+            return
+        self.device.send_notification(f"Scheduled {self.action} for {self.device.device_name} executed.", "schedule")
+
+
+class Scheduler:
+    """Планировщик на min-heap: срабатывание и перепланирование задания — O(log n).
+
+    Действие задания — команда устройства из commands (CommandRegistry), её аргументы проверяются при добавлении.
+    execute(device, command) выполняет её так же, как команды пользователя (у дома — с журналом событий);
+    False — команда не выполнена. Без execute вызывается обработчик команды напрямую.
+    """
+
+    def __init__(self, commands, clock=datetime.now, catch_up=True, max_catch_up=100, execute=None):
+        self.commands = commands
+        self.clock = clock
+        self.execute = execute or self.__handle
+        self.catch_up = catch_up
+        self.max_catch_up = max_catch_up
+        self.__heap = []
+        self.__jobs = {}  # устройство -> список его заданий
+        self.__counter = itertools.count()
+        self.__lock = threading.RLock()
+
+    def __len__(self):
+        with self.__lock:
+            return sum(len(jobs) for jobs in self.__jobs.values())
+
+    @staticmethod
+    def __handle(device, command):
+        return command.spec.handler(device, *command.args, **command.options)
+
+    def add(self, device, rule, action="turn_on", args=(), when=None):
+        command = self.commands.bind(device, action, args)
+        if isinstance(rule, str):
+            rule = parse_rule(rule, self.clock())
+
+        # when передаётся при восстановлении из снимка, чтобы не потерять уже назначенный запуск
+        when = when or rule.next_after(self.clock())
+        if when is None:
+            raise ValueError(f"Schedule '{rule}' has no future runs")
+        job = ScheduledJob(when, device, command, rule)
+        with self.__lock:
+            self.__jobs.setdefault(device, []).append(job)
+            heapq.heappush(self.__heap, (when, next(self.__counter), job))
+        return job
+
+    def jobs(self):
+        with self.__lock:
+            return [job for jobs in self.__jobs.values() for job in jobs]
+
+    def jobs_for(self, device):
+        with self.__lock:
+            return list(self.__jobs.get(device, ()))
+
+    def cancel(self, job):
+        # Ленивое удаление: отменённое задание выбрасывается, когда дойдёт до вершины кучи
+        with self.__lock:
+            job.cancelled = True
+            jobs = self.__jobs.get(job.device, [])
+            if job in jobs:
+                jobs.remove(job)
+            if not jobs:
+                self.__jobs.pop(job.device, None)
+
+    def cancel_device(self, device):
+        for job in self.jobs_for(device):
+            self.cancel(job)
+
+    def next_run(self):
+        with self.__lock:
+            while self.__heap and self.__heap[0][2].cancelled:
+                heapq.heappop(self.__heap)
+            return self.__heap[0][0] if self.__heap else None
+
+    def run_pending(self, now=None):
+        """Выполняет все задания, время которых наступило. Возвращает список выполненных."""
+        now = now or self.clock()
+        fired = []
+        missed = {}
+        while True:
+            with self.__lock:
+                if not self.__heap or self.__heap[0][0] > now:
+                    break
+                when, _, job = heapq.heappop(self.__heap)
+                if job.cancelled:
+                    continue
+
+                # После простоя повторяющиеся задания догоняют пропущенные запуски, но не больше max_catch_up
+                missed[job] = missed.get(job, 0) + 1
+                if self.catch_up and missed[job] < self.max_catch_up:
+                    job.when = job.rule.next_after(when)
+                else:
+                    job.when = job.rule.next_after(now)
+                if job.when is None:
+                    self.cancel(job)
+                else:
+                    heapq.heappush(self.__heap, (job.when, next(self.__counter), job))
+
+            try:
+                job.run(self.execute)
+            except Exception as e:  # ошибка одного задания не должна останавливать остальные
+                print(f"Scheduled {job.action} for {job.device.device_name} failed: {e}")
+            fired.append(job)
+        return fired
@@ -0,0 +1,382 @@
+"""Много домов в нескольких процессах: координатор HomeCluster и процессы-шарды.
+
+Каждый дом живёт целиком в одном шарде (процессе со своим GIL). Координатор знает, какой шард владеет
+домом, и отправляет команды пачками: одна пачка — одно сообщение в канал шарда, так что накладные
+расходы IPC делятся на все команды пачки, а шарды выполняют свои пачки параллельно.
+
+Числовое состояние домов (мощность, число устройств, средний заряд, версия статуса) шард пишет в
+разделяемую память, и координатор читает его без обмена сообщениями. Уведомления шард копит и
+отправляет пачкой после каждого сообщения в общую очередь событий.
+"""
+from contextlib import redirect_stdout
+import io
+import multiprocessing
+from multiprocessing import shared_memory
+import os
+import queue
+import threading
+import time
+
+from smart_home import SmartHome, NotificationCenter
+from snapshot import decode_device, encode_device
+
+FIELDS = ("power", "devices", "battery", "version")
+_POWER, _DEVICES, _BATTERY, _VERSION = range(len(FIELDS))
+
+
+class ShardError(RuntimeError):
+    pass
+
+
+class _BatchSink:
+    """Sink NotificationCenter дома внутри шарда: уведомления копятся до отправки пачкой."""
+
+    def __init__(self, home_id, pending):
+        self.home_id = home_id
+        self.pending = pending
+
+    def write(self, subscriber, notifications):
+        self.pending.extend((self.home_id, n.topic, n.severity, str(n)) for n in notifications)
+
+    def close(self):
+        pass
+
+
+class _Shard:
+    """Состояние процесса-шарда: его дома и их строки в разделяемой памяти."""
+
+    def __init__(self, state, directory, home_options):
+        self.state = state
+        self.directory = directory
+        self.home_options = home_options
+        self.homes = {}       # home_id -> (SmartHome, строка в разделяемой памяти)
+        self.pending = []     # уведомления для очереди событий
+
+    def add(self, home_id, slot, devices):
+        path = os.path.join(self.directory, home_id)
+        home = SmartHome(simulated=True, speed=None, snapshot_file=path + ".snapshot",
+                         journal_file=path + ".journal", log_file=path + ".log", **self.home_options)
+        with _Discard():
+            if not home.restore():
+                home.add_devices([decode_device(data) for data in devices])
+            center = NotificationCenter(home)
+            center.subscribe("cluster", sink=_BatchSink(home_id, self.pending))
+            home.set_notification_center(center)
+        home.start_battery_drain()
+        home.start_scheduler()
+        self.homes[home_id] = (home, slot)
+        self.publish(home_id, battery=True)
+        return len(home.registry)
+
+    def control(self, home_id, command, capture):
+        home = self.homes[home_id][0]
+        if not capture:
+            with _Discard():
+                home.control_device(command)
+            return None
+        output = io.StringIO()
+        with redirect_stdout(output):
+            home.control_device(command)
+        return output.getvalue()
+
+    def summary(self, home_id):
+        home = self.homes[home_id][0]
+        return home.status.summary()
+
+    def run_for(self, seconds):
+        for home_id, (home, _) in self.homes.items():
+            with _Discard():
+                home.run_for(seconds)
+            self.publish(home_id, battery=True)
+        return len(self.homes)
+
+    def checkpoint(self):
+        for home, _ in self.homes.values():
+            with _Discard():
+                home.checkpoint()
+        return len(self.homes)
+
+    def publish(self, home_id, battery=False):
+        home, slot = self.homes[home_id]
+        row = slot * len(FIELDS)
+        state = self.state
+        state[row + _POWER] = home.power.total
+        state[row + _DEVICES] = len(home.registry)
+        state[row + _VERSION] = home.status.version
+        if battery:  # среднее по всем устройствам — только после тиков, а не на каждую команду
+            devices = home.registry.snapshot()
+            state[row + _BATTERY] = sum(d._battery_level for d in devices) / len(devices) if devices else 0.0
+
+    def close(self):
+        for home, _ in self.homes.values():
+            home.shutdown()
+            home.event_log.close()
+
+
+class _Discard(io.TextIOBase):
+    """redirect_stdout в никуда: вывод команд без --capture не нужен и не должен доходить до консоли."""
+
+    def __enter__(self):
+        self.__redirect = redirect_stdout(self)
+        self.__redirect.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self.__redirect.__exit__(*exc)
+
+    def write(self, text):
+        return len(text)
+
+
+def _serve(connection, events, memory_name, directory, home_options):
+    """Цикл процесса-шарда: пачка запросов -> пачка ответов, уведомления — отдельной пачкой в events."""
+    memory = shared_memory.SharedMemory(name=memory_name)
+    shard = _Shard(memory.buf.cast("d"), directory, home_options)
+    try:
+        while True:
+            batch = connection.recv()
+            if batch is None:
+                break
+            replies = []
+            touched = set()
+            for operation, home_id, payload in batch:
+                try:
+                    if operation == "control":
+                        replies.append((True, shard.control(home_id, *payload)))
+                        touched.add(home_id)
+                    elif operation == "add":
+                        replies.append((True, shard.add(home_id, *payload)))
+                    elif operation == "summary":
+                        replies.append((True, shard.summary(home_id)))
+                    elif operation == "run_for":
+                        replies.append((True, shard.run_for(payload)))
+                    elif operation == "checkpoint":
+                        replies.append((True, shard.checkpoint()))
+                    else:
+                        replies.append((False, f"Unknown operation: {operation}"))
+                except Exception as e:
+                    replies.append((False, f"{type(e).__name__}: {e}"))
+            for home_id in touched:
+                shard.publish(home_id)
+            connection.send(replies)
+            if shard.pending:
+                events.put(list(shard.pending))
+                shard.pending.clear()
+    finally:
+        shard.close()
+        shard.state.release()
+        memory.close()
+
+
+class HomeCluster:
+    """Координатор домов, разложенных по процессам-шардам.
+
+    control_device(home_id, команда) выполняет одну команду, control_many() — много команд разных
+    домов за один обмен с каждым шардом. energy()/state() читают разделяемую память без IPC,
+    summary() собирает status_summary домов, notifications() и subscribe() отдают уведомления.
+    """
+
+    def __init__(self, workers=None, directory="homes", capacity=1024, **home_options):
+        self.workers = workers or os.cpu_count() or 1
+        self.directory = directory
+        self.capacity = capacity  # домов на шард
+        os.makedirs(directory, exist_ok=True)
+        # spawn, а не fork: у домов есть фоновые потоки и блокировки, копировать их в потомка нельзя
+        context = multiprocessing.get_context("spawn")
+        self.__events = context.Queue()
+        self.__shards = []
+        for _ in range(self.workers):
+            memory = shared_memory.SharedMemory(create=True, size=capacity * len(FIELDS) * 8)
+            parent, child = context.Pipe()
+            process = context.Process(target=_serve, args=(child, self.__events, memory.name, directory, home_options),
+                                      daemon=True)
+            process.start()
+            child.close()
+            self.__shards.append(_ShardHandle(process, parent, memory))
+        self.__homes = {}   # home_id -> (номер шарда, строка в разделяемой памяти)
+        self.__subscribers = []
+        self.__collector = None
+        self.__backlog = []   # уведомления, дочитанные из очереди при close()
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.__homes)
+
+    def homes(self):
+        return list(self.__homes)
+
+    def shard_of(self, home_id):
+        return self.__homes[home_id][0]
+
+    def add_home(self, home_id, devices=()):
+        """Создаёт дом в наименее занятом шарде (или восстанавливает из его снимка). Возвращает число устройств."""
+        with self.__lock:
+            if home_id in self.__homes:
+                raise ValueError(f"Home '{home_id}' already exists.")
+            shard = min(range(self.workers), key=lambda number: (self.__shards[number].homes, number))
+            handle = self.__shards[shard]
+            if handle.homes >= self.capacity:
+                raise ShardError(f"All shards are full ({self.capacity} homes each).")
+            slot = handle.homes
+            handle.homes += 1
+            self.__homes[home_id] = (shard, slot)
+        try:
+            return self.__call(shard, [("add", home_id, (slot, [encode_device(device) for device in devices]))])[0]
+        except ShardError:
+            with self.__lock:
+                del self.__homes[home_id]
+            raise
+
+    def control_device(self, home_id, command_input):
+        """Выполняет команду в доме и возвращает её вывод."""
+        return self.__call(self.shard_of(home_id), [("control", home_id, (command_input, True))])[0]
+
+    def control_many(self, commands, capture=False):
+        """Выполняет [(home_id, команда)] одной пачкой на шард; шарды работают параллельно.
+
+        Возвращает выводы команд в исходном порядке (capture=False — None вместо вывода, так быстрее).
+        """
+        batches = {}
+        for position, (home_id, command_input) in enumerate(commands):
+            shard = self.shard_of(home_id)
+            positions, batch = batches.setdefault(shard, ([], []))
+            positions.append(position)
+            batch.append(("control", home_id, (command_input, capture)))
+        results = [None] * sum(len(positions) for positions, _ in batches.values())
+        for shard, replies in self.__call_many({shard: batch for shard, (_, batch) in batches.items()}).items():
+            for position, reply in zip(batches[shard][0], replies):
+                results[position] = reply
+        return results
+
+    def summary(self, home_ids=None):
+        """status_summary домов: {home_id: сводка}."""
+        home_ids = list(self.__homes) if home_ids is None else list(home_ids)
+        batches = {}
+        for home_id in home_ids:
+            batches.setdefault(self.shard_of(home_id), []).append(home_id)
+        replies = self.__call_many({shard: [("summary", home_id, None) for home_id in ids]
+                                    for shard, ids in batches.items()})
+        return {home_id: summary for shard, ids in batches.items() for home_id, summary in zip(ids, replies[shard])}
+
+    def run_for(self, seconds):
+        """Прогоняет seconds модельного времени во всех домах (шарды параллельно)."""
+        self.__call_many({shard: [("run_for", None, seconds)] for shard in range(self.workers)})
+
+    def checkpoint(self):
+        self.__call_many({shard: [("checkpoint", None, None)] for shard in range(self.workers)})
+
+    def state(self, home_id):
+        """Числовое состояние дома из разделяемой памяти: {"power", "devices", "battery", "version"}."""
+        shard, slot = self.__homes[home_id]
+        state = self.__shards[shard].state
+        row = slot * len(FIELDS)
+        return dict(zip(FIELDS, state[row:row + len(FIELDS)]))
+
+    def energy(self):
+        """Активная мощность каждого дома, Вт — без обращения к шардам."""
+        result = {}
+        for home_id, (shard, slot) in self.__homes.items():
+            result[home_id] = self.__shards[shard].state[slot * len(FIELDS) + _POWER]
+        return result
+
+    def total_energy(self):
+        return sum(self.energy().values())
+
+    def notifications(self, timeout=0):
+        """Забирает накопленные уведомления: [(home_id, topic, severity, message)]."""
+        notifications, self.__backlog = self.__backlog, []
+        try:
+            notifications.extend(self.__events.get(timeout=timeout) if timeout else self.__events.get_nowait())
+            while True:
+                notifications.extend(self.__events.get_nowait())
+        except queue.Empty:
+            pass
+        return notifications
+
+    def subscribe(self, callback):
+        """callback(home_id, topic, severity, message) из фонового потока для каждого уведомления."""
+        self.__subscribers.append(callback)
+        if self.__collector is None:
+            self.__collector = threading.Thread(target=self.__collect, daemon=True)
+            self.__collector.start()
+
+    def close(self, timeout=5):
+        for handle in self.__shards:
+            with handle.lock:
+                try:
+                    handle.connection.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+        # Шард не завершится, пока его последние уведомления не прочитаны из очереди
+        deadline = time.monotonic() + timeout
+        while any(handle.process.is_alive() for handle in self.__shards) and time.monotonic() < deadline:
+            if self.__collector is None:
+                self.__backlog.extend(self.notifications(timeout=0.05))
+            else:
+                time.sleep(0.05)
+        for handle in self.__shards:
+            if handle.process.is_alive():
+                handle.process.terminate()
+            handle.process.join()
+            handle.connection.close()
+            handle.state.release()
+            handle.memory.close()
+            handle.memory.unlink()
+        self.__shards = []
+        if self.__collector is not None:
+            self.__events.put(None)  # останавливает поток subscribe()
+            self.__collector.join(timeout)
+
+    def __call(self, shard, batch):
+        return self.__call_many({shard: batch})[shard]
+
+    def __call_many(self, batches):
+        # Сначала отправляем всем шардам, потом собираем ответы: шарды работают одновременно.
+        # Блокировки шардов берутся по возрастанию номера, чтобы параллельные вызовы не сцепились
+        handles = [(shard, self.__shards[shard]) for shard in sorted(batches)]
+        for _, handle in handles:
+            handle.lock.acquire()
+        try:
+            for shard, handle in handles:
+                handle.connection.send(batches[shard])
+            replies = {shard: handle.connection.recv() for shard, handle in handles}
+        finally:
+            for _, handle in handles:
+                handle.lock.release()
+        results = {}
+        for shard, shard_replies in replies.items():
+            values = []
+            for ok, value in shard_replies:
+                if not ok:
+                    raise ShardError(value)
+                values.append(value)
+            results[shard] = values
+        return results
+
+    def __collect(self):
+        while True:
+            batch = self.__events.get()
+            if batch is None:
+                return
+            for notification in batch:
+                for callback in self.__subscribers:
+                    try:
+                        callback(*notification)
+                    except Exception as e:
+                        print(f"Error in cluster subscriber: {e}")
+
+
+class _ShardHandle:
+    def __init__(self, process, connection, memory):
+        self.process = process
+        self.connection = connection
+        self.memory = memory
+        self.state = memory.buf.cast("d")
+        self.homes = 0
+        self.lock = threading.Lock()
@@ -1,8 +1,97 @@
 import threading
 import time
 
+from commands import command, echo, Param
+
+CONNECTIONS = ("Wi-Fi", "Bluetooth", "Ethernet")
+
+# Полосатые блокировки: устройство берёт одну из общих RLock по своему хешу,
+# поэтому миллион устройств не создаёт миллион объектов блокировки
+_DEVICE_LOCKS = tuple(threading.RLock() for _ in range(64))
+MODES = ("Auto", "Heating", "Cooling", "Fan only", "Dry")
+# Допустимые этажи и приоритеты — столько помещается в поля снимка (int32 без метки «не задан» и int64)
+FLOORS = range(-2 ** 31 + 1, 2 ** 31)
+PRIORITIES = range(-2 ** 63, 2 ** 63)
+
+
+def format_floor(floor):
+    if floor == 1:
+        return f"{floor}st"
+    elif floor == 2:
+        return f"{floor}nd"
+    elif floor == 3:
+        return f"{floor}rd"
+    else:
+        return f"{floor}th"
+
+
+class _BatteryField:
+    """Поле устройства, которое хранится в BatteryEngine, пока устройство к нему подключено."""
+
+    def __init__(self, column, to_value, to_column=None):
+        self.column = column
+        self.to_value = to_value
+        self.to_column = to_column
+
+    def __set_name__(self, owner, name):
+        self.own = "_own" + name
+
+    def __get__(self, device, owner=None):
+        if device is None:
+            return self
+        engine = device._battery_engine
+        if engine is None:
+            return self.to_value(getattr(device, self.own))
+        return self.to_value(getattr(engine, self.column)[device._battery_slot])
+
+    def __set__(self, device, value):
+        engine = device._battery_engine
+        if engine is None:
+            setattr(device, self.own, self.to_column(value))
+        else:
+            engine.set(self.column, device._battery_slot, self.to_column(value))
+
+
+class _CodedField:
+    """Строковое поле с небольшим набором значений, хранится как номер значения."""
+
+    def __init__(self, values):
+        self.values = values
+
+    def __set_name__(self, owner, name):
+        self.own = "_code_" + name.lstrip("_")
+
+    def __get__(self, device, owner=None):
+        if device is None:
+            return self
+        code = getattr(device, self.own)
+        return self.values[code] if isinstance(code, int) else code
+
+    def __set__(self, device, value):
+        # Неизвестное значение сохраняем как есть, чтобы его поймал validate_data()
+        setattr(device, self.own, self.values.index(value) if value in self.values else value)
+
+
+def _level_value(level):
+    level = float(level)
+    return int(level) if level.is_integer() else level
+
+
 class SmartDevice:
+    __slots__ = ("_battery_engine", "_battery_slot", "device_name", "power_consumption",
+                 "_code_network_connection", "_own_status", "_own_battery_level", "_own_is_charging",
+                 "_own_low_battery_notified", "_location", "_floor_number", "_notification_center",
+                 "_schedule", "_state_listener", "_priority")
+
+    _battery_level = _BatteryField("level", _level_value, float)
+    _is_charging = _BatteryField("charging", bool, bool)
+    _low_battery_notified = _BatteryField("low_notified", bool, bool)
+    _status = _BatteryField("on", lambda on: "On" if on else "Off", lambda status: status == "On")
+    network_connection = _CodedField(CONNECTIONS)
+
     def __init__(self, device_name, power_consumption, network_connection):
+        self._battery_engine = None
+        self._battery_slot = None
         self.device_name = device_name
         self.power_consumption = power_consumption
         self.network_connection = network_connection
@@ -14,6 +103,8 @@ class SmartDevice:
         self._schedule = None
         self._is_charging = False
         self._low_battery_notified = False 
+        self._state_listener = None
+        self._priority = None
 
     def __str__(self):
         # Format the device details into a readable string
@@ -29,8 +120,29 @@ class SmartDevice:
                 f"Floor: {floor}\n"
                 f"Charging: {charging_status}\n")
 
+    def to_dict(self):
+        """Состояние устройства для status-запросов сервера управления."""
+        return {"name": self.device_name, "type": type(self).__name__, "status": self._status,
+                "battery": round(self._battery_level, 1), "charging": self._is_charging,
+                "power": self.power_consumption, "connection": self.network_connection,
+                "location": self._location, "floor": self._floor_number,
+                "priority": self._priority, "schedule": self._schedule}
+
+    @property
+    def _lock(self):
+        return _DEVICE_LOCKS[hash(self) % len(_DEVICE_LOCKS)]
+
+    @property
+    def _floor(self):
+        return format_floor(self._floor_number) if self._floor_number is not None else None
+
+    @_floor.setter
+    def _floor(self, floor):
+        # Этаж хранится числом, "2nd" собирается только при чтении
+        self._floor_number = int(floor.rstrip("stndrh")) if isinstance(floor, str) else floor
+
     def validate_data(self):
-        appropriate_connections = ["Wi-Fi", "Bluetooth", "Ethernet"]
+        appropriate_connections = CONNECTIONS
         if not isinstance(self.power_consumption, int):
             raise ValueError("power_consumption must be an integer!")
         elif self.power_consumption <= 0:
@@ -39,79 +151,122 @@ class SmartDevice:
         if self.network_connection not in appropriate_connections:
             raise ValueError("'network_connection' must be Wi-Fi / Bluetooth / Ethernet")
 
+    # Состояние меняется под блокировкой устройства, а слушатели и уведомления
+    # вызываются уже после неё — так цепочки действий между устройствами не могут зациклить блокировки
+    @command()
     def turn_on(self):
-        self._status = "On"
+        with self._lock:
+            old_status, self._status = self._status, "On"
+        self._state_changed("_status", old_status, "On")
         self.send_notification(f"{self.device_name} has been enabled.")
 
+    @command()
     def turn_off(self):
-        self._status = "Off"
+        with self._lock:
+            old_status, self._status = self._status, "Off"
+        self._state_changed("_status", old_status, "Off")
         self.send_notification(f"{self.device_name} has been disabled.")
 
+    @command(Param("location"), Param("floor", int))
     def set_location(self, room, floor):
         if not isinstance(room, str) or not isinstance(floor, int):
             raise ValueError("Invalid arguments' type!")
-
-        self._location = room
-        if floor == 1:
-            self._floor = f"{floor}st"
-        elif floor == 2:
-            self._floor = f"{floor}nd"
-        elif floor == 3:
-            self._floor = f"{floor}rd"
-        else:
-            self._floor = f"{floor}th"
-        self.send_notification(f"New location for {self.device_name}: {self._location} on {self._floor} floor.")
-
+        if floor not in FLOORS:
+            raise ValueError(f"Floor must be from {FLOORS.start} to {FLOORS.stop - 1}!")
+
+        with self._lock:
+            old_location, old_floor = self._location, self._floor
+            self._location = room
+            self._floor = floor
+            new_floor = self._floor
+        self._state_changed("_location", old_location, room)
+        self._state_changed("_floor", old_floor, new_floor)
+        self.send_notification(f"New location for {self.device_name}: {room} on {new_floor} floor.")
+
+    @command()
     def perform_action(self):
-        print("Device is doing it's job...")
+        echo("Device is doing it's job...")
 
-    def send_notification(self, message):
+    def send_notification(self, message, topic="device", severity="info"):
         if self._notification_center:
-            self._notification_center.send_notification(message)
+            self._notification_center.send_notification(message, topic, self, severity)
 
     def attach_notification_center(self, notification_center):
         self._notification_center = notification_center
 
+    def attach_state_listener(self, listener):
+        self._state_listener = listener
+
+    def _state_changed(self, attribute, old, new):
+        if self._state_listener and old != new:
+            self._state_listener(self, attribute, old, new)
+
+    @command()
     def charge(self):
-        if self._battery_level < 100:
-            self._is_charging = True
-            self.send_notification(f"{self.device_name} is now charging.")
+        with self._lock:
+            charging = self._battery_level < 100
+            was_charging, self._is_charging = self._is_charging, charging
+        self._state_changed("_is_charging", was_charging, charging)
+        if charging:
+            self.send_notification(f"{self.device_name} is now charging.", "battery")
         else:
-            self.send_notification(f"{self.device_name} is already fully charged!")
-            self._is_charging = False
+            self.send_notification(f"{self.device_name} is already fully charged!", "battery")
 
     def update_battery(self):
-        if self._is_charging and self._battery_level < 100:
-            self._battery_level += 1
-            if self._battery_level >= 100:
-                self._battery_level = 100
-                self._is_charging = False
-                self._low_battery_notified = False  # Сбрасываем флаг, если устройство полностью зарядилось
-                message = f"{self.device_name} is fully charged."
-                self.send_notification(message)
-        elif self._status == "On":
-            self._battery_level -= 0.2
-            if self._battery_level <= 0:
-                self._battery_level = 0
-                self.turn_off()
-                message = f"{self.device_name} turned off due to low battery."
-                self.send_notification(message)
-                self._low_battery_notified = False  # Сбрасываем флаг, если устройство выключилось
-            elif self._battery_level < 15:
-                if not self._low_battery_notified:
-                    # Уведомление отправляется только один раз
-                    message = f"Low battery for {self.device_name}. Please recharge."
-                    self.send_notification(message)
-                    self._low_battery_notified = True  # Устанавливаем флаг, чтобы не отправлять уведомление повторно
-            else:
-                self._low_battery_notified = False  # Сбрасываем флаг, если заряд выше 15%
-
+        # Та же логика в векторном виде — BatteryEngine.tick()
+        event = None
+        with self._lock:
+            if self._is_charging and self._battery_level < 100:
+                self._battery_level += 1
+                if self._battery_level >= 100:
+                    self._battery_level = 100
+                    self._is_charging = False
+                    self._low_battery_notified = False  # Сбрасываем флаг, если устройство полностью зарядилось
+                    event = self.battery_full
+            elif self._status == "On":
+                self._battery_level -= 0.2
+                if self._battery_level <= 0:
+                    self._battery_level = 0
+                    event = self.battery_empty
+                elif self._battery_level < 15:
+                    if not self._low_battery_notified:
+                        # Уведомление отправляется только один раз
+                        event = self.battery_low
+                        self._low_battery_notified = True  # Устанавливаем флаг, чтобы не отправлять уведомление повторно
+                else:
+                    self._low_battery_notified = False  # Сбрасываем флаг, если заряд выше 15%
+        if event:
+            event()
+
+    def battery_full(self):
+        self.send_notification(f"{self.device_name} is fully charged.", "battery")
+
+    def battery_low(self):
+        self.send_notification(f"Low battery for {self.device_name}. Please recharge.", "battery", "warning")
+
+    def battery_empty(self):
+        self.turn_off()
+        self.send_notification(f"{self.device_name} turned off due to low battery.", "battery", "critical")
+        self._low_battery_notified = False  # Сбрасываем флаг, если устройство выключилось
+
+    @command()
     def show_battery(self):
-        self.send_notification(f"{self.device_name} - {self._battery_level:.1f}%")
+        self.send_notification(f"{self.device_name} - {self._battery_level:.1f}%", "battery")
+
+    @command(Param("priority", int))
+    def set_priority(self, priority):
+        if not isinstance(priority, int):
+            raise ValueError("Priority must be an integer!")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priority must be from {PRIORITIES.start} to {PRIORITIES.stop - 1}!")
+        old_priority, self._priority = self._priority, priority
+        self._state_changed("_priority", old_priority, priority)
+        self.send_notification(f"Priority for {self.device_name} set to {priority}.")
 
     def set_schedule(self, time):
-        self._schedule = time
-        self.send_notification(f"Schedule for {self.device_name} set to {time}.")
+        old_schedule, self._schedule = self._schedule, time
+        self._state_changed("_schedule", old_schedule, time)
+        self.send_notification(f"Schedule for {self.device_name} set to {time}.", "schedule")
 
     def check_schedule(self, current_time):
         if self._schedule == current_time and self._status == "Off":
@@ -121,28 +276,38 @@ class SmartDevice:
 
 
 class Light(SmartDevice):
+    __slots__ = ("brightness", "color")
+
     def __init__(self, device_name, power_consumption, network_connection):
         super().__init__(device_name, power_consumption, network_connection)
         self.brightness = 50
         self.color = "white"
 
+    def to_dict(self):
+        return dict(super().to_dict(), brightness=self.brightness, color=self.color)
+
+    @command(Param("color"))
     def change_color(self, new_color):
         if type(new_color is str):
-            self.color = new_color
+            old_color, self.color = self.color, new_color
+            self._state_changed("color", old_color, new_color)
             self.send_notification(f"Color for {self.device_name} changed to {new_color}")
         else:
             raise TypeError("Type of 'new_color' must be str!")
 
+    @command(Param("brightness", int))
     def change_brightness(self, new_brightness):
         if type(new_brightness is int):
             if new_brightness <= 100 and new_brightness >= 10:
-                self.brightness = new_brightness
+                old_brightness, self.brightness = self.brightness, new_brightness
+                self._state_changed("brightness", old_brightness, new_brightness)
                 self.send_notification(f"Brightness for {self.device_name} changed to {new_brightness}")
             else:
                 raise ValueError("'new_brightness' must be from 10 to 100")
         else:
             raise TypeError("Type of 'new_brightness' must be int!")
 
+    @command()
     def perform_action(self):
         if self._status == "On":
             self.send_notification(f"Device {self.device_name} is lighting up with {self.color} color at {self.brightness}% brightness.")
@@ -151,32 +316,42 @@ class Light(SmartDevice):
 
 
 class Thermostat(SmartDevice):
+    __slots__ = ("temperature", "_code_mode")
+
+    mode = _CodedField(MODES)
+    __appropriate_temp = range(0, 35)
+    __appropriate_mods = list(MODES)
+
     def __init__(self, device_name, power_consumption, network_connection):
         super().__init__(device_name, power_consumption, network_connection)
         self.temperature = 20
         self.mode = "Auto"
 
-    def change_temperature(self, new_temp):
-        self.__appropriate_temp = range(0, 35)
+    def to_dict(self):
+        return dict(super().to_dict(), temperature=self.temperature, mode=self.mode)
 
+    @command(Param("temperature", int), log="%s temperature set to %s°C.")
+    def change_temperature(self, new_temp):
         if type(new_temp is int):
             if new_temp in self.__appropriate_temp:
-                self.temperature = new_temp
+                old_temp, self.temperature = self.temperature, new_temp
+                self._state_changed("temperature", old_temp, new_temp)
                 self.send_notification(f"Temperature for {self.device_name} set on {new_temp}°C")
             else:
                 raise ValueError(f"'new_temp' must be in range of {self.__appropriate_temp}")
         else:
             raise TypeError("'new_temp' must be int!")
 
+    @command(Param("mode", choices=MODES))
     def change_mode(self, new_mode):
-        self.__appropriate_mods = ["Auto", "Heating", "Cooling", "Fan only", "Dry"]
-
         if new_mode in self.__appropriate_mods:
-            self.mode = new_mode
+            old_mode, self.mode = self.mode, new_mode
+            self._state_changed("mode", old_mode, new_mode)
             self.send_notification(f"Mode for {self.device_name} changed to {new_mode}")
         else:
             raise ValueError(f"'new_mode' must be one of the: {self.__appropriate_mods}")
 
+    @command()
     def perform_action(self):
         if self._status == "On":
             self.send_notification(f"Device {self.device_name} is now on {self.mode} mode with {self.temperature}°C")
@@ -185,27 +360,46 @@ class Thermostat(SmartDevice):
             
 
 class Camera(SmartDevice):
+    __slots__ = ("_is_recording",)
+
     def __init__(self, device_name, power_consumption, network_connection):
         super().__init__(device_name, power_consumption, network_connection)
         self._is_recording = False
 
+    def to_dict(self):
+        return dict(super().to_dict(), recording=self._is_recording)
+
+    @command()
     def start_recording(self):
-        if self._status == "On":
-            self._is_recording = True
+        with self._lock:
+            started = self._status == "On"
+            if started:
+                was_recording, self._is_recording = self._is_recording, True
+        if started:
+            self._state_changed("_is_recording", was_recording, True)
             self.send_notification(f"{self.device_name} has started recording.")
         else:
             self.send_notification(f"{self.device_name} is Off. Pleace, turn in Ot.")
 
+    @command()
     def stop_recording(self):
-        self._is_recording = False
+        was_recording, self._is_recording = self._is_recording, False
+        self._state_changed("_is_recording", was_recording, False)
         self.send_notification(f"{self.device_name} has stopped recording.")
 
+    @command()
     def perform_action(self):
         if self._status == "On" and self._is_recording:
             self.send_notification(f"{self.device_name} is recording and ready to detect motion.")
         else:
             self.send_notification(f"{self.device_name} is Off. Pleace, turn it On and run recording.")
 
-    def detect_motion(self):
+    def record_segment(self):
+        if self._status == "On" and self._is_recording:
+            self.send_notification(f"{self.device_name} saved a new video segment.")
+
+    def detect_motion(self, notify=True):
         if self._is_recording:
-            self.send_notification(f"Camera {self.device_name} in {self._location} on {self._floor} floor has detected some movements!")
\ No newline at end of file
+            self._state_changed("motion", False, True)  # событие, а не смена состояния
+            if notify:
+                self.send_notification(f"Camera {self.device_name} in {self._location} on {self._floor} floor has detected some movements!", "motion", "warning")
\ No newline at end of file
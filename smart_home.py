@@ -1,204 +1,856 @@
 
 from smart_device import *
+from device_registry import DeviceRegistry
+from battery_engine import BatteryEngine
+from scheduler import Scheduler, IntervalRule, parse_rule
+from commands import CommandRegistry, CommandError, Param, scalar, echo
+from notifications import *
+from event_log import EventLog
+from runtime import SimulationRuntime, SimulatedClock
+from power import PowerMeter, device_priority
+from analytics import MetricsStore, PERIODS
+from status import StatusCache, format_line
+from inventory import Inventory, TYPES
+from cameras import CameraSystem
+from climate import ClimateModel
+from profiling import Profiler
+from rules import RuleEngine
+from snapshot import Journal, read_snapshot, write_snapshot, encode_device, decode_device
 from datetime import datetime
-import threading
-import random
+import fnmatch
+import functools
+import json
+import operator
+import os
 import time
 
 class SmartHome:
-    def __init__(self):
-        self.__device_list = []
+    RECORDING_SEGMENT = 5 * 60  # камеры сохраняют запись каждые 5 минут
+
+    def __init__(self, tick_interval=1.0, simulated=False, speed=1.0, snapshot_file="SmartHome.snapshot",
+                 journal_file="SmartHome.journal", seed=None, log_file="SmartHome.log"):
+        """simulated=True включает модельное время: speed — ускорение, speed=None — без пауз (см. run_for).
+
+        seed делает движение на камерах воспроизводимым.
+        """
+        self.tick_interval = tick_interval
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.__journal = None
+        self.runtime = SimulationRuntime(SimulatedClock() if simulated else None, speed)
+        self.__loops = {}
+        self.__device_list = DeviceRegistry()
+        self.__battery = BatteryEngine() if BatteryEngine.available else None
         self.__total_energy = 10000
-        self.log = []
-        self.running_battery = True
-        self.running_camera = True
-
+        self.power = PowerMeter(self.__total_energy, on_overload=self.__power_overload)
+        self.event_log = EventLog(log_file)
+        self.notification_center = None
+        self.metrics = MetricsStore(clock=self.runtime.clock.time)
+        self.inventory = Inventory()
+        self.status = StatusCache(self.__device_list, inventory=self.inventory)
+        self.cameras = CameraSystem(self.runtime.clock.time, seed=seed, segment=self.RECORDING_SEGMENT)
+        self.climate = ClimateModel(self.runtime.clock.time) if ClimateModel.available else None
+        self.profiler = Profiler(self)
+        self.commands = self.__register_commands()
+        self.scheduler = Scheduler(self.commands, clock=self.runtime.clock.now, execute=self.__run_scheduled)
+        self.rules = RuleEngine(self)
+
+
+    @property
+    def devices(self):
+        return list(self.__device_list)
+
+    @property
+    def registry(self):
+        return self.__device_list
 
     def add_devices(self, devices):
+        added = 0
         for device in devices:
             if isinstance(device, SmartDevice):
-                self.__device_list.append(device)
-                print(f"{device.device_name} has been added.")
+                # Проверяем данные один раз при регистрации, а не на каждой команде
+                device.validate_data()
+                self.__register(device)
+                self.__journal_append(Journal.ADD, encode_device(device))
+                added += 1
             else:
                 raise ValueError("'device' object is not an instance of SmartDevice")
+        # Одна строка на весь список: при больших списках вывод в консоль дороже самой регистрации
+        if added == 1:
+            echo(f"{device.device_name} has been added.")
+        elif added:
+            echo(f"{added} devices have been added.")
+
+    def load_manifest(self, filename):
+        """Загружает устройства из манифеста (CSV/JSON). Объекты создаются при первом обращении к устройству."""
+        started = time.perf_counter()
+        if self.inventory.file is not None and self.inventory.file != os.path.abspath(filename):
+            raise ValueError(f"Manifest {self.inventory.file} is already loaded")
+        count = self.inventory.load(filename, skip=self.__device_list)
+        self.__journal_append(Journal.MANIFEST, self.inventory.file)
+        self.log_event("%s devices loaded from manifest %s.", count, filename)
+        echo(f"Loaded {count} devices from {filename} in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return count
+
+    def __materialize(self, devices):
+        """Регистрирует устройства, только что созданные из инвентаря. В журнал они идут как ADD."""
+        for device in devices:
+            self.__register(device)
+            self.__journal_append(Journal.ADD, encode_device(device))
+        return devices
+
+    def __device(self, device_name):
+        # Точное имя ищем в реестре, затем в инвентаре (устройство создаётся сейчас); подстроку — в том же порядке
+        device = self.__device_list.get(device_name)
+        if device is not None:
+            return device
+        device = self.inventory.take(device_name)
+        if device is None:
+            device = self.__device_list.find(device_name)
+            if device is not None:
+                return device
+            device = self.inventory.take_matching(device_name)
+        if device is not None:
+            self.__materialize([device])
+        return device
+
+    def __register(self, device):
+        self.__device_list.add(device)
+        self.status.invalidate(device)
+        device.attach_state_listener(self._device_changed)
+        if self.notification_center is not None:
+            device.attach_notification_center(self.notification_center)
+        if self.__battery is not None:
+            self.__battery.register(device)
+        self.power.update(device)
+        self.metrics.status_changed(device, device._status)
+        if isinstance(device, Camera):
+            self.cameras.track(device)
+        elif isinstance(device, Thermostat) and self.climate is not None:
+            self.climate.track(device)
+        self.rules.device_added(device)
 
     def remove_device(self, *devices):
         for device_name in devices:
-            for device in self.devices:
-                if device.name == device_name:
-                    self.__device_list.remove(device)
-                    print(f"Device {device.name} has been removed from the house.")
-                else:
-                    print(f"Device {device.name} not found.")
-
-    def log_event(self, message):
-        self.log.append(f"{datetime.now()} - {message}")
-
-    def __parse_command(self, command_input):
-        parts = command_input.split(" --")
-        cmd_and_device = parts[0].split(" ", 1)
-        command = cmd_and_device[0]
-        device_name = cmd_and_device[1] if len(cmd_and_device) > 1 else None
-        params = parts[1:] if len(parts) > 1 else []
-        return command, device_name, params
-
-    def control_device(self, command_input):
-        # Парсим команду
-        command, device_name, params = self.__parse_command(command_input)
-
-        if not device_name:
-            # Обработка команд без устройств
-            if command == "help":
-                self.help()
-                return
-            elif command == "status_report":
-                self.status_report()
-                return
-            elif command == "check_schedule":
-                self.check_schedules()
-                return
+            device = self.__device_list.remove(device_name)
+            if device is not None:
+                device.attach_state_listener(None)
+                self.scheduler.cancel_device(device)
+                self.power.forget(device)
+                self.metrics.forget(device)
+                self.status.forget(device)
+                self.cameras.forget(device)
+                if self.climate is not None:
+                    self.climate.forget(device)
+                self.rules.device_removed(device)
+                if self.notification_center is not None and self.notification_center.policy is not None:
+                    self.notification_center.policy.forget(device)
+                if self.__battery is not None:
+                    self.__battery.unregister(device)
+                self.__journal_append(Journal.REMOVE, device.device_name)
+                echo(f"Device {device.device_name} has been removed from the house.")
+                continue
+            # Объекта у устройства ещё нет — достаточно вычеркнуть его из инвентаря
+            removed = self.inventory.remove(device_name)
+            if removed is not None:
+                self.status.forget_name(removed)
+                self.__journal_append(Journal.REMOVE, removed)
+                echo(f"Device {removed} has been removed from the house.")
             else:
-                print(f"Unknown command: {command}")
-                return
-
-        # Поиск устройства
-        for device in self.__device_list:
-            if device_name.lower() in device.device_name.lower():
+                echo(f"Device {device_name} not found.")
+
+    def _device_changed(self, device, attribute, old, new):
+        self.__device_list.reindex(device, attribute, old, new)
+        if attribute != "motion":
+            self.status.invalidate(device)
+        if attribute in ("_status", "_location", "_floor"):
+            self.power.update(device)
+        if attribute == "_status":
+            self.metrics.status_changed(device, new)
+        elif attribute == "motion":
+            self.metrics.motion_detected(device)
+        elif attribute == "_is_recording":
+            self.cameras.recording_changed(device, new)
+        if attribute in ClimateModel.ATTRIBUTES and self.climate is not None and isinstance(device, Thermostat):
+            self.climate.track(device)
+        if attribute != "motion":
+            self.__journal_append(Journal.SET, device.device_name, attribute, new)
+        self.rules.changed(device, attribute)
+
+    def checkpoint(self):
+        """Сохраняет снимок всего дома и начинает журнал изменений заново."""
+        started = time.perf_counter()
+        devices = self.__device_list.snapshot()
+        circuits = [{"name": circuit.name, "limit": circuit.limit, "room": circuit.room, "floor": circuit.floor,
+                     "type": circuit.device_type} for circuit in self.power.circuits.values()
+                    if circuit is not self.power.main]
+        rules = [{"name": rule.name, "when": rule.trigger, "then": rule.action} for rule in self.rules]
+        meta = {"circuits": circuits, "rules": rules}
+        if self.climate is not None:
+            meta["climate"] = {"outdoor": self.climate.outdoor, "rooms": self.climate.custom_rooms()}
+        if self.inventory.file is not None:
+            # Устройства инвентаря не попадают в снимок: при восстановлении манифест читается заново
+            meta["manifest"] = {"file": self.inventory.file, "removed": self.inventory.removed}
+        write_snapshot(self.snapshot_file, devices, self.scheduler.jobs(), meta)
+        # Всё, что было в журнале, уже есть в снимке
+        if self.__journal is None:
+            self.__journal = Journal(self.journal_file)
+        self.__journal.truncate()
+        self.log_event("Checkpoint of %s devices saved to %s.", len(devices), self.snapshot_file)
+        echo(f"Checkpoint saved to {self.snapshot_file}: {len(devices)} devices "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def restore(self):
+        """Восстанавливает дом из снимка и журнала. Возвращает False, если восстанавливать нечего."""
+        started = time.perf_counter()
+        snapshot = read_snapshot(self.snapshot_file)
+        entries = Journal.read(self.journal_file)
+        if snapshot is None and not entries:
+            self.__journal = Journal(self.journal_file)
+            return False
+
+        devices, jobs, meta = snapshot or ([], [], {"circuits": []})
+        devices = {device.device_name: device for device in devices}
+        jobs = [(device.device_name, *job) for device, *job in jobs]
+        circuits = list(meta["circuits"])
+        rules = {rule["name"]: rule for rule in meta.get("rules", [])}
+        manifest = meta.get("manifest")
+        climate = meta.get("climate", {"outdoor": None, "rooms": []})
+        for operation, values in entries:
+            if operation == Journal.SET:
+                name, attribute, value = values
+                if name in devices:
+                    setattr(devices[name], attribute, value)
+            elif operation == Journal.ADD:
+                device = decode_device(values[0])
+                devices[device.device_name] = device
+            elif operation == Journal.REMOVE:
+                if devices.pop(values[0], None) is None and manifest is not None:
+                    manifest["removed"].append(values[0])
+                jobs = [job for job in jobs if job[0] != values[0]]
+            elif operation == Journal.SCHEDULE:
+                name, action, args, rule, start, when = values
+                jobs.append((name, action, json.loads(args), rule,
+                             datetime.fromtimestamp(start) if start else None, datetime.fromtimestamp(when)))
+            elif operation == Journal.UNSCHEDULE:
+                jobs = [job for job in jobs if job[0] != values[0]]
+            elif operation == Journal.CIRCUIT:
+                circuits.append(json.loads(values[0]))
+            elif operation == Journal.RULE:
+                rule = json.loads(values[0])
+                rules[rule["name"]] = rule
+            elif operation == Journal.UNRULE:
+                rules.pop(values[0], None)
+            elif operation == Journal.MANIFEST:
+                manifest = {"file": values[0], "removed": []}
+            elif operation == Journal.CLIMATE:
+                change = json.loads(values[0])
+                if "outdoor" in change:
+                    climate["outdoor"] = change["outdoor"]
+                else:
+                    climate["rooms"].append(change)
+
+        for device in devices.values():
+            self.__register(device)
+        for circuit in circuits:
+            self.power.add_circuit(circuit["name"], circuit["limit"], room=circuit["room"],
+                                   floor=circuit["floor"], device_type=circuit["type"])
+        if self.climate is not None:
+            if climate["outdoor"] is not None:
+                self.climate.outdoor = climate["outdoor"]
+            for room in climate["rooms"]:
+                self.climate.set_room(room["location"], room["floor"], room.get("thermal_mass"), room.get("loss"))
+        for name, action, args, rule, start, when in jobs:
+            if name in devices:
                 try:
-                    device.validate_data()
+                    self.scheduler.add(devices[name], parse_rule(rule, start or when), action, args, when)
                 except ValueError as e:
-                    print(f"Validation error for {device.device_name}: {e}")
-                    return False
-
-                if command == "charge":
-                    device.charge()
-
-                elif command == "turn_on":
-                    device.turn_on()
-
-                elif command == "turn_off":
-                    device.turn_off()
-
-                elif command == "start_recording":
-                    device.start_recording()
-
-                elif command == "stop_recording":
-                    device.stop_recording()
-
-                elif command == "change_temperature":
-                    if len(params) >= 1:
-                        try:
-                            device.change_temperature(int(params[0]))
-                            self.log_event(f"{device_name} temperature set to {params[0]}°C.")
-                        except ValueError:
-                            print("Error: Temperature must be an integer.")
-                    else:
-                        print("Temperature value is required for this command.")
-
-                elif command == "change_brightness":
-                    if len(params) >= 1:
-                        try:
-                            device.change_brightness(int(params[0]))
-                        except ValueError:
-                            print("Error: Brightness level must be an integer.")
-                    else:
-                        print("Brightness level is required for this command.")
-
-                elif command == "perform_action":
-                    device.perform_action()
-
-                elif command == "set_schedule":
-                    if len(params) >= 1:
-                        device.set_schedule(params[0])
-                    else:
-                        print("Schedule time is required for this command.")
-
-                elif command == "show_battery":
-                    device.show_battery()
-
-                elif command == "set_location":
-                    if len(params) >= 2:
-                        try:
-                            location, floor = params[0], int(params[1])
-                            device.set_location(location.strip(), floor)
-                        except ValueError:
-                            print("Error: Floor must be an integer.")
-                    else:
-                        print("Location and floor are required for this command.")
+                    echo(f"Schedule for {name} skipped: {e}")
+        for rule in rules.values():
+            self.rules.add(rule["name"], rule["when"], rule["then"])
+        pending = 0
+        if manifest is not None:
+            try:
+                pending = self.inventory.load(manifest["file"], skip=self.__device_list, removed=manifest["removed"])
+            except (OSError, ValueError) as e:
+                echo(f"Manifest {manifest['file']} is not loaded: {e}")
+        self.__journal = Journal(self.journal_file)
+        echo(f"Restored {len(devices) + pending} devices ({pending} from manifest) and {len(jobs)} schedule(s) "
+              f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return True
 
-                else:
-                    print(f"Invalid command: {command}")
-                return
+    def __journal_append(self, operation, *values):
+        if self.__journal is not None:
+            self.__journal.append(operation, *values)
+
+    @property
+    def log(self):
+        return self.event_log.recent()
+
+    def log_event(self, message, *args):
+        # Форматирование и запись в файл выполняет фоновый поток EventLog
+        self.event_log.log(message, *args)
+
+    def log_events(self, message, args):
+        """Много записей одного формата (args — их аргументы) одним обращением к журналу."""
+        self.event_log.log_many(message, args)
+
+    def __register_commands(self):
+        """Команды дома. Команды устройств объявлены в их классах декоратором @command."""
+        selectors = (Param("type", option=True), Param("room", option=True), Param("floor", int, option=True),
+                     Param("status", str.capitalize, choices=("On", "Off"), option=True),
+                     Param("battery", option=True), Param("name", option=True))
+        commands = CommandRegistry((Light, Thermostat, Camera), selectors)
+        commands.register("help", self.help)
+        commands.register("status_report", self.status_report, *selectors, Param("page", int, option=True),
+                          Param("per_page", int, option=True),
+                          Param("format", choices=("line", "full", "json"), option=True))
+        commands.register("status_summary", self.status_summary, *selectors)
+        commands.register("status_diff", self.status_diff, Param("since", int, option=True))
+        commands.register("check_schedule", self.check_schedules)
+        commands.register("notification_stats", self.notification_stats)
+        commands.register("power_report", self.power_report)
+        commands.register("checkpoint", self.checkpoint)
+        commands.register("stats", self.stats, Param("action", choices=("show", "on", "off", "reset"), default="show"))
+        commands.register("export_stats", self.export_stats, Param("filename", default="SmartHome.prom"))
+        for metric in ("energy", "runtime", "motion"):
+            commands.register(f"{metric}_report", functools.partial(self.analytics_report, metric),
+                              Param("room", option=True), Param("floor", int, option=True),
+                              Param("type", option=True), Param("period", choices=tuple(PERIODS), option=True),
+                              Param("top", int, option=True))
+        commands.register("add_circuit", self.__add_circuit, Param("limit", int), Param("room", option=True),
+                          Param("floor", int, option=True), Param("type", option=True), target="name")
+        commands.register("set_schedule", self.__set_schedule, Param("rule"), Param("action", default="turn_on"),
+                          Param("args", scalar, variadic=True), target="device")
+        commands.register("show_schedule", self.__show_schedule, target="device")
+        commands.register("cancel_schedule", self.__cancel_schedule, target="device")
+        commands.register("add_rule", self.__add_rule, Param("when"), Param("then", variadic=True), target="name")
+        commands.register("remove_rule", self.__remove_rule, target="name")
+        commands.register("rules", self.show_rules)
+        commands.register("climate_report", self.climate_report, Param("room", option=True),
+                          Param("floor", int, option=True))
+        commands.register("set_outdoor", self.__set_outdoor, Param("temperature", float))
+        commands.register("set_room_climate", self.__set_room_climate, Param("floor", int, option=True),
+                          Param("mass", float, option=True), Param("loss", float, option=True), target="name")
+        commands.register("set_motion_rate", self.__set_motion_rate, Param("rate", float), target="device")
+        commands.register("camera_events", self.__camera_events, Param("limit", int, option=True), target="device")
+        commands.register("battery_history", self.__battery_history,
+                          Param("resolution", choices=("minute", "hour", "day"), option=True),
+                          Param("period", choices=tuple(PERIODS), option=True), target="device")
+        return commands
 
-        print(f"Device '{device_name}' not found.")
+    def control_device(self, command_input):
+        """Выполняет строку команды. Возвращает False, если команда не выполнена (ошибка уже напечатана)."""
+        # Строка разбирается и проверяется один раз (повторные строки берутся из кэша разбора)
+        try:
+            command = self.commands.parse(command_input)
+        except CommandError as e:
+            echo(e)
+            return False
+        return self.execute(command, reply=True)
+
+    def execute(self, command, reply=False):
+        """Выполняет готовую команду: из REPL, сценария или собранную через self.commands.make().
+
+        Возвращает False при ошибке; команды дома сообщают о неудаче, возвращая False из обработчика.
+        reply=True — команда пользователя: уведомления её целевого устройства идут ему ответом мимо лимитов
+        политики, а групповые команды и побочные уведомления других устройств лимиты проходят как обычно.
+        """
+        spec = command.spec
+        if spec.target is None:
+            return spec.handler(*command.args, **command.options) is not False
+        elif spec.target == "name":
+            return spec.handler(command.target, *command.args, **command.options) is not False
+        elif command.is_group:
+            return self.__execute_group(command)
+        else:
+            device = self.__device(command.target)
+            if device is None:
+                echo(f"Device '{command.target}' not found.")
+                return False
+            spec = self.__resolve(device, spec)
+            if spec is None:
+                echo(f"{type(device).__name__} {device.device_name} does not support {command.name}.")
+                return False
+            if not reply or self.notification_center is None:
+                return self.__apply(device, spec, command.args, command.options)
+            with self.notification_center.reply(device):
+                return self.__apply(device, spec, command.args, command.options)
+
+    def __resolve(self, device, spec):
+        # Команда устройства — реализация из таблицы его класса, команда дома подходит любому устройству
+        return self.commands.lookup(device, spec.name) if spec.method else spec
+
+    def __apply(self, device, spec, args, options):
+        try:
+            done = spec.handler(device, *args, **options) is not False
+        except (ValueError, TypeError) as e:
+            echo(f"Error: {e}")
+            return False
+        if done and spec.log:
+            self.log_event(spec.log, device.device_name, *args)
+        return done
+
+    def __run_scheduled(self, device, command):
+        # Задание планировщика выполняется как команда пользователя: с журналом событий и разбором ошибок
+        return self.__apply(device, command.spec, command.args, command.options)
+
+    def __execute_group(self, command):
+        """Команда над всеми устройствами, выбранными по --type/--room/--floor/--status/--battery/--name."""
+        selectors = {key: value for key, value in command.options.items() if key in self.commands.selectors}
+        options = {key: value for key, value in command.options.items() if key not in selectors}
+        try:
+            # Из инвентаря создаются только выбранные устройства тех классов, что поддерживают команду
+            classes = [cls for cls in TYPES
+                       if not command.spec.method or command.name in self.commands.commands_for(cls)]
+            self.__materialize(self.inventory.take_many(self.find_pending(classes, **selectors)))
+            selected = self.__select_devices(selectors)
+        except ValueError as e:
+            echo(f"Error: {e}")
+            return False
+        # Набор устройств определяется один раз; порядок — как в status_report.
+        # Устройства, чей класс не поддерживает команду (запись у лампы), пропускаются
+        targets = []
+        for device in self.__device_list.snapshot():
+            if selected is None or device in selected:
+                spec = self.__resolve(device, command.spec)
+                if spec is not None:
+                    targets.append((device, spec))
+        if not targets:
+            echo("No devices match the selection.")
+            return True
+
+        filters = ", ".join(f"{key} {value}" for key, value in selectors.items())
+        summary = f"{command.name} applied to {len(targets)} device(s) ({filters})."
+        if self.notification_center is None:
+            applied = [self.__apply(device, spec, command.args, options) for device, spec in targets]
+            echo(summary)
+            return all(applied)
+        with self.notification_center.collect(summary):
+            applied = [self.__apply(device, spec, command.args, options) for device, spec in targets]
+        return all(applied)
+
+    def __add_rule(self, name, when, *then):
+        # "--turn_on --type Light --floor 1" разбит на части по " --", собираем команду обратно
+        if not then:
+            echo("Error: Command is required for this rule. Usage: add_rule <name> --<when> --<command> [--<args>]")
+            return False
+        try:
+            rule = self.rules.add(name, when, " --".join(then))
+        except ValueError as e:
+            echo(f"Error: {e}")
+            return False
+        self.__journal_append(Journal.RULE, json.dumps({"name": rule.name, "when": rule.trigger, "then": rule.action}))
+        echo(f"Rule {rule} added.")
+
+    def __remove_rule(self, name):
+        if self.rules.remove(name) is None:
+            echo(f"Rule '{name}' not found.")
+            return False
+        self.__journal_append(Journal.UNRULE, name)
+        echo(f"Rule '{name}' removed.")
+
+    def show_rules(self):
+        if not len(self.rules):
+            echo("No rules.")
+            return
+        for rule in self.rules:
+            echo(f"{rule} (fired {rule.fired} time(s))")
+        stats = self.rules.stats
+        echo(f"Evaluated {stats['evaluated']}, fired {stats['fired']}, cycles skipped {stats['cycles']}, "
+              f"cascades cut {stats['cut']}")
+
+    def __set_schedule(self, device, rule, action="turn_on", *args):
+        try:
+            job = self.scheduler.add(device, rule, action, args)
+        except CommandError as e:
+            echo(e)   # сообщение CommandError уже начинается с "Error:"
+            return False
+        start = job.rule.start.timestamp() if isinstance(job.rule, IntervalRule) else None
+        self.__journal_append(Journal.SCHEDULE, device.device_name, action, json.dumps(job.args),
+                              str(job.rule), start, job.when.timestamp())
+        device.set_schedule(str(job.rule))
+
+    def __show_schedule(self, device):
+        jobs = self.scheduler.jobs_for(device)
+        if not jobs:
+            echo(f"No schedule for {device.device_name}.")
+        for job in jobs:
+            echo(f"{device.device_name}: {job}")
+
+    def __cancel_schedule(self, device):
+        self.scheduler.cancel_device(device)
+        self.__journal_append(Journal.UNSCHEDULE, device.device_name)
+        echo(f"Schedule for {device.device_name} cancelled.")
+
+    def __set_motion_rate(self, device, rate):
+        if not isinstance(device, Camera):
+            echo(f"{device.device_name} is not a camera.")
+            return False
+        self.cameras.set_rate(device, rate)
+        echo(f"Motion rate for {device.device_name} set to {rate:.0%} per tick.")
+
+    def __camera_events(self, device, limit=20):
+        events = self.cameras.events(device, limit)
+        if not events:
+            echo(f"No events for {device.device_name}.")
+        for event in events:
+            echo(f"{datetime.fromtimestamp(event.time):%Y-%m-%d %H:%M:%S} - {event}")
+
+    def __battery_history(self, device, resolution="minute", period="hour"):
+        history = self.metrics.battery_history(device, resolution, PERIODS[period])
+        if not history:
+            echo(f"No battery changes recorded for {device.device_name}.")
+        for moment, level in history:
+            echo(f"{datetime.fromtimestamp(moment):%Y-%m-%d %H:%M} - {level:.1f}%")
 
     def check_energy(self):
-        active_energy = sum(d.power_consumption for d in self.__device_list if d._status == "On")
-        if active_energy >= self.__total_energy:
-            print("Power overload! The house's circuits have tripped.")
-            self.log_event("Power overload occurred.")
-
-            if self.battery_level < 15:
-                self.send_notification(f"Low battery for {self.device_name}. Please recharge.")
-            elif self.battery_level == 0:
-                self.turn_off()
-
-        for device in self.__device_list:
-            device.update_battery()
+        # Мощность считает PowerMeter при каждом включении/выключении, здесь только O(1) проверка.
+        # Батареи обновляет только фоновый поток (start_battery_drain), иначе заряд уходит вдвое быстрее
+        if self.power.overloaded():
+            echo("Power overload! The house's circuits have tripped.")
         return True
 
-    def status_report(self):
-        for device in self.__device_list:
-            print(device)
+    def power_report(self):
+        echo(f"Active power: {self.power.total}W of {self.__total_energy}W")
+        for title, totals in (("room", self.power.by_room), ("floor", self.power.by_floor),
+                              ("type", self.power.by_type)):
+            for key, watts in sorted(totals.items(), key=lambda item: -item[1]):
+                label = format_floor(key) if title == "floor" and key is not None else key or "Not Set"
+                echo(f"  {title} {label}: {watts}W")
+        for circuit in self.power.circuits.values():
+            echo(f"  circuit {circuit}")
+
+    def __add_circuit(self, name, limit, room=None, floor=None, type=None):
+        try:
+            circuit = self.power.add_circuit(name, limit, room=room, floor=floor, device_type=type)
+        except ValueError as e:
+            echo(f"Error: {e}")
+            return False
+        self.__journal_append(Journal.CIRCUIT, json.dumps({"name": name, "limit": limit, "room": circuit.room,
+                                                           "floor": floor, "type": circuit.device_type}))
+        echo(f"Circuit {circuit} added.")
+
+    def start_climate(self):
+        """Каждый тик — шаг модели климата для всех комнат и фактическая мощность термостатов."""
+        if self.climate is not None:
+            self.__start_loop("climate", self.tick_interval, self.update_climate)
+
+    def stop_climate(self):
+        self.__stop_loop("climate")
+
+    def update_climate(self):
+        draws = self.climate.step()
+        if not draws:
+            return
+        total = self.power.total
+        self.power.set_draw(draws)
+        self.metrics.set_draw(draws)
+        if self.power.total != total:
+            self.rules.changed(None, "power")
+
+    def climate_report(self, room=None, floor=None):
+        if self.climate is None:
+            echo("Climate model requires numpy.")
+            return False
+        rooms = [(key, temperature, setpoint, draw) for key, temperature, setpoint, draw in self.climate.rooms()
+                 if (room is None or key[0] == room) and (floor is None or key[1] == floor)]
+        echo(f"Outdoor: {self.climate.outdoor:.1f}°C, {len(rooms)} room(s)")
+        for (location, floor_number), temperature, setpoint, draw in rooms:
+            label = location + (f", {format_floor(floor_number)} floor" if floor_number is not None else "")
+            target = f"target {setpoint:.1f}°C" if setpoint is not None else "no thermostat"
+            echo(f"  {label}: {temperature:.1f}°C ({target}), {draw}W")
+        stats = self.climate.stats
+        echo(f"Last step {stats['last'] * 1000:.2f} ms (max {stats['max'] * 1000:.2f}, "
+              f"budget {self.climate.budget * 1000:.1f}), {stats['overruns']} overrun(s) in {stats['ticks']} tick(s)")
+
+    def __set_outdoor(self, temperature):
+        if self.climate is None:
+            echo("Climate model requires numpy.")
+            return False
+        self.climate.outdoor = temperature
+        self.__journal_append(Journal.CLIMATE, json.dumps({"outdoor": temperature}))
+        echo(f"Outdoor temperature set to {temperature:.1f}°C.")
+
+    def __set_room_climate(self, room, floor=None, mass=None, loss=None):
+        """mass — теплоёмкость комнаты в кДж/К, loss — теплопотери в Вт/К."""
+        if self.climate is None:
+            echo("Climate model requires numpy.")
+            return False
+        thermal_mass = mass * 1000 if mass is not None else None
+        try:
+            self.climate.set_room(room, floor, thermal_mass, loss)
+        except ValueError as e:
+            echo(f"Error: {e}")
+            return False
+        self.__journal_append(Journal.CLIMATE, json.dumps({"location": room, "floor": floor,
+                                                           "thermal_mass": thermal_mass, "loss": loss}))
+        echo(f"Climate of {room} updated.")
+
+    def start_analytics(self, interval=60):
+        """Раз в interval секунд сворачивает время работы и заряд батарей в метрики."""
+        self.__start_loop("analytics", interval, lambda: self.metrics.sample(self.__device_list.snapshot()))
+
+    def stop_analytics(self):
+        self.__stop_loop("analytics")
+
+    def analytics_report(self, metric, period="day", top=10, **filters):
+        """Топ устройств по метрике за период, filters — room/floor/type."""
+        units = {"energy": "Wh", "runtime": "h", "motion": "events"}
+        if period not in PERIODS:
+            echo(f"Unknown period: {period}. Periods: {', '.join(PERIODS)}")
+            return False
+        ranking = self.metrics.top(metric, PERIODS[period], self.__select_devices(filters), top)
+        filters = ", ".join(f"{key} {value}" for key, value in filters.items())
+        echo(f"Top {top} by {metric} for the last {period}" + (f" ({filters})" if filters else "") + ":")
+        if not ranking:
+            echo("No data yet.")
+        for place, (device, value) in enumerate(ranking, 1):
+            value = value / 3600 if metric == "runtime" else value
+            echo(f"{place:>3}. {device.device_name}: {value:.2f} {units[metric]}")
+
+    def find_devices(self, **selectors):
+        """Устройства по тем же селекторам, что и у групповых команд, в порядке добавления."""
+        selected = self.__select_devices(selectors)
+        return [device for device in self.__device_list.snapshot() if selected is None or device in selected]
+
+    def find_pending(self, classes=TYPES, **selectors):
+        """Номера ещё не созданных устройств инвентаря по селекторам, в порядке манифеста."""
+        if not len(self.inventory):
+            return []
+        battery = self.__battery_filter(selectors["battery"]) if "battery" in selectors else None
+        return self.inventory.select(selectors.get("type"), selectors.get("room"), selectors.get("floor"),
+                                     selectors.get("status"), battery, selectors.get("name"), classes)
+
+    def __select_devices(self, options):
+        """Пересечение вторичных индексов реестра по --room/--floor/--type/--status, None — все устройства.
+
+        --battery (<20, >=80; просто 20 — не больше 20%) и --name (шаблон вида "Hue*") проверяются
+        уже на выбранных индексами устройствах.
+        """
+        selected = None
+        if "room" in options:
+            selected = set(self.__device_list.by_location(options["room"]))
+        if "floor" in options:
+            on_floor = set(self.__device_list.by_floor(options["floor"]))
+            selected = on_floor if selected is None else selected & on_floor
+        if "type" in options:
+            of_type = set(self.__device_list.by_type(options["type"]))
+            selected = of_type if selected is None else selected & of_type
+        if "status" in options:
+            with_status = set(self.__device_list.by_status(options["status"]))
+            selected = with_status if selected is None else selected & with_status
+        if "battery" in options or "name" in options:
+            matches = self.__battery_filter(options["battery"]) if "battery" in options else lambda level: True
+            pattern = options.get("name", "*").lower()
+            candidates = self.__device_list.snapshot() if selected is None else selected
+            selected = {device for device in candidates
+                        if matches(device._battery_level) and fnmatch.fnmatchcase(device.device_name.lower(), pattern)}
+        return selected
+
+    @staticmethod
+    def __battery_filter(threshold):
+        for sign, compare in (("<=", operator.le), (">=", operator.ge), ("<", operator.lt), (">", operator.gt)):
+            if threshold.startswith(sign):
+                threshold, matches = threshold[len(sign):], compare
+                break
+        else:
+            matches = operator.le
+        try:
+            threshold = float(threshold)
+        except ValueError:
+            raise ValueError("Battery threshold must be a number, e.g. --battery <20") from None
+        return lambda level: matches(level, threshold)
+
+    def __power_overload(self, circuit):
+        """Вызывается PowerMeter в момент, когда включение устройства превысило лимит цепи."""
+        if circuit is self.power.main:
+            echo("Power overload! The house's circuits have tripped.")
+        else:
+            echo(f"Power overload on circuit {circuit}.")
+        self.log_event("Power overload occurred on circuit %s.", circuit.name)
+        if self.notification_center:
+            self.notification_center.send_notification(f"Power overload on circuit {circuit}.", severity="critical")
+        if circuit.shed_load:
+            self.__shed_load(circuit)
+
+    def __shed_load(self, circuit):
+        # Выключаем наименее важные (а среди них — самые прожорливые) устройства, пока цепь не разгрузится
+        candidates = sorted(self.power.devices_on(circuit),
+                            key=lambda device: (device_priority(device), -device.power_consumption))
+        for device in candidates:
+            if not circuit.overloaded:
+                break
+            device.turn_off()
+            self.log_event("%s turned off to shed load on circuit %s.", device.device_name, circuit.name)
+
+    def status_report(self, page=1, per_page=50, format="line", **selectors):
+        """Страница отчёта из StatusCache: строка на устройство, полный вид (full) или JSON.
+
+        Устройства инвентаря идут после созданных, их строки собираются из столбцов без создания объектов.
+        """
+        try:
+            devices = self.find_devices(**selectors)
+            pending = self.find_pending(**selectors)
+        except ValueError as e:
+            echo(f"Error: {e}")
+            return False
+        if page < 1 or per_page < 1:
+            echo("Error: Page and per_page must be positive.")
+            return False
+        start = (page - 1) * per_page
+        shown = devices[start:start + per_page]
+        pending_shown = pending[max(0, start - len(devices)):][:per_page - len(shown)]
+        if format == "full":
+            for device in shown + [self.inventory.build(position) for position in pending_shown]:
+                echo(device)
+        elif format == "json":
+            echo(json.dumps(self.status.report(devices, page, per_page, pending)[0]))
+        else:
+            for device in shown:
+                echo(self.status.line(device))
+            for position in pending_shown:
+                echo(format_line(self.inventory.status(position)))
+        total = len(devices) + len(pending)
+        pages = max(1, -(-total // per_page))
+        echo(f"Page {page} of {pages} ({total} device(s)), version {self.status.version}")
+
+    def status_summary(self, **selectors):
+        try:
+            summary = self.status.summary(self.find_devices(**selectors), self.find_pending(**selectors))
+        except ValueError as e:
+            echo(f"Error: {e}")
+            return False
+        echo(f"Devices: {summary['total']}")
+        for title in ("by_status", "by_type"):
+            echo(f"  {title.replace('_', ' ')}: "
+                  + ", ".join(f"{key} {count}" for key, count in sorted(summary[title].items())))
+        for floor, battery in summary["battery_by_floor"].items():
+            echo(f"  average battery on {format_floor(floor) if floor is not None else 'Not Set'} floor: {battery}%")
+
+    def status_diff(self, since=0):
+        """Изменения после версии since в JSON — для опрашивающих панелей."""
+        echo(json.dumps(self.status.diff(since)))
 
     def set_notification_center(self, notification_center):
+        self.notification_center = notification_center
+        self.profiler.watch_center(notification_center)
         for device in self.__device_list:
             device.attach_notification_center(notification_center)
+        # В async-режиме истёкшие окна политики закрывает поток центра, в sync — таймер дома
+        self.__stop_loop("notifications")
+        if notification_center.policy is not None and notification_center.mode == "sync":
+            self.__start_loop("notifications", notification_center.policy.window / 2,
+                              lambda: notification_center.flush(force=False))
 
     def check_schedules(self):
-        current_time = datetime.now().strftime("%H:%M")
-        for device in self.__device_list:
-            device.check_schedule(current_time)
+        fired = self.scheduler.run_pending()
+        echo(f"{len(fired)} scheduled task(s) executed.")
+
+    def notification_stats(self):
+        if self.notification_center is None:
+            echo("Notification center is not set.")
+            return
+        for name, value in self.notification_center.metrics().items():
+            echo(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+
+    def stats(self, action="show"):
+        """Профилирование горячих путей: on/off включает замеры, reset обнуляет, show печатает сводку."""
+        if action == "on":
+            self.profiler.install()
+            echo("Profiling is on.")
+        elif action == "off":
+            self.profiler.uninstall()
+            echo("Profiling is off.")
+        elif action == "reset":
+            self.profiler.reset()
+            echo("Profiling stats reset.")
+        elif not self.profiler.installed:
+            echo("Profiling is off. Turn it on with: stats --on")
+        else:
+            echo("\n".join(self.profiler.stats()))
+
+    def export_stats(self, filename="SmartHome.prom"):
+        if not self.profiler.installed:
+            echo("Profiling is off. Turn it on with: stats --on")
+            return
+        self.profiler.export(filename)
+        echo(f"Stats exported to {filename}")
 
     def save_log(self):
-        """Сохраняет лог событий в файл."""
-        filename = f"SmartHome.log"
-        try:
-            with open(filename, "a") as log_file:
-                for entry in self.log:
-                    log_file.write(entry + "\n")
-            print(f"Log saved to {filename}")
-        except Exception as e:
-            print(f"Error saving log: {e}")
+        """Дописывает в файл оставшиеся записи лога и останавливает фоновую запись."""
+        self.event_log.close()
+        echo(f"Log saved to {self.event_log.filename}")
 
     def start_battery_drain(self):
-        """Запускает фоновый процесс обновления батареи устройств."""
-        def drain_battery():
-            while self.running_battery:
-                for device in self.__device_list:
-                    device.update_battery()
-                time.sleep(1)  
-
-        # Запуск отдельного потока для обновления батарей
-        threading.Thread(target=drain_battery, daemon=True).start()
+        """Запускает фоновое обновление батарей устройств."""
+        self.__start_loop("battery", self.tick_interval, lambda: self.update_batteries())
+
+    def update_batteries(self):
+        """Один тик батарей для всех устройств."""
+        if self.__battery is None:
+            update = operator.methodcaller("update_battery")
+            if self.profiler.installed:
+                update = self.profiler.timed("update_battery", update)
+            for device in self.__device_list:
+                update(device)
+            return
+
+        events = self.__battery.tick()
+        for device in events.fully_charged:
+            device.battery_full()
+        for device in events.low_battery:
+            device.battery_low()
+        for device in events.turned_off:
+            device.battery_empty()
 
     def stop_battery_drain(self):
-        self.running_battery = False
+        self.__stop_loop("battery")
 
     def start_motion_detection(self):
-        """Запускает  detect_motion для камер с _is_recording == True с шансом 5%"""
-        def detect_motion_for_cameras():
-            while self.running_camera:
-                for device in self.__device_list:
-                    if isinstance(device, Camera) and device._is_recording: 
-                        if random.randint(1, 100) <= 5:  # 5% шанс
-                            device.detect_motion()
-                time.sleep(1)  
+        """Каждый тик — движение на записывающих камерах и сегменты записи, время которых наступило."""
+        self.__start_loop("motion", self.tick_interval, self.cameras.tick)
 
-        threading.Thread(target=detect_motion_for_cameras, daemon=True).start()
+    def sample_motion(self):
+        return self.cameras.sample_motion()
+
+    def record_segments(self):
+        return self.cameras.record_segments()
 
     def stop_motion_detection(self):
-        self.running_camera = False
+        self.__stop_loop("motion")
+
+    def start_scheduler(self):
+        """Запускает фоновое выполнение расписаний."""
+        self.__start_loop("scheduler", self.tick_interval, self.scheduler.run_pending)
+
+    def stop_scheduler(self):
+        self.__stop_loop("scheduler")
+
+    def run_for(self, seconds):
+        """Прогоняет seconds модельного времени без пауз (нужен SmartHome(simulated=True))."""
+        self.runtime.run_for(seconds)
+
+    def shutdown(self):
+        """Останавливает все фоновые задачи и поток runtime."""
+        for name in list(self.__loops):
+            self.__stop_loop(name)
+        self.runtime.stop()
+        if self.__journal is not None:
+            self.__journal.close()
+            self.__journal = None
+
+    def __start_loop(self, name, interval, callback):
+        if name in self.__loops:
+            return
+        self.__loops[name] = self.runtime.every(interval, callback, name)
+        if not self.runtime.clock.simulated or self.runtime.speed is not None:
+            self.runtime.start()
+
+    def __stop_loop(self, name):
+        timer = self.__loops.pop(name, None)
+        if timer is not None:
+            self.runtime.cancel(timer)
 
     def help(self):
         help_message = '''
@@ -226,9 +878,13 @@ Available commands:
    Change the brightness (for lights only).
    Brightness should be between 10 and 100.
    Example: change_brightness Living Room Light 50
+   Also: change_color <device_name> --<color>, change_mode <device_name> --<mode> (for thermostats).
 
-8. status_report
-   Display the status of all devices in the house.
+8. status_report [--type/--room/--floor/--status/--battery/--name] [--page] [--per_page] [--format line/full/json]
+   Display the status of devices in the house, one line per device (50 per page by default).
+   Example: status_report --floor 2 --status On --page 2
+   Also: status_summary [filters] - counts by status and type, average battery per floor;
+         status_diff --since <version> - JSON with devices changed after the version printed by the report.
 
 9. check_schedule
    Check and execute schedules for all devices.
@@ -236,10 +892,11 @@ Available commands:
 10. perform_action <device_name>
     Perform the specific action of the device.
 
-11. set_schedule <device_name> <time>
-    Set a schedule for the device.
-    Time format: HH:MM.
-    Example: set_schedule Living Room Light 18:00
+11. set_schedule <device_name> --<rule> [--<action> --<args>]
+    Add a schedule for the device (turn_on by default).
+    Rule: HH:MM, every 15m, once 2024-01-01 18:00 or cron */5 * * * *.
+    Example: set_schedule Living Room Light --18:00
+    Example: set_schedule Bedroom Thermostat --cron 0 7 * * 1-5 --change_temperature --22
 
 12. show_battery <device_name>
     Update the battery status of the device.
@@ -248,25 +905,71 @@ Available commands:
     Set the location of the device.
     Example: set_location Living Room Light Kitchen,2
 
-14. help
-    Display this help message with all available commands.
+14. show_schedule <device_name>
+    Show all schedules of the device.
 
-15. quit
-    Exit the program.
-'''
-        print(help_message)
+15. cancel_schedule <device_name>
+    Remove all schedules of the device.
+
+16. notification_stats
+    Show notification queue depth, throughput and delivery latency.
+
+17. power_report
+    Show active power by room, floor, device type and circuit.
 
+18. add_circuit <name> <limit> [room/floor/type]
+    Add a circuit with a power limit. On overload, the lowest-priority devices are turned off.
+    Example: add_circuit Kitchen --3000 --room Kitchen
 
-class NotificationCenter:
-    def __init__(self, home):
-        self.home = home
-        self.subscribers = []
+19. set_priority <device_name> <priority>
+    Set the load-shedding priority (higher keeps the device on longer).
+    Example: set_priority Ring Stick Up Cam --5
 
-    def subscribe(self, subscriber):
-        self.subscribers.append(subscriber)
-        print(f"{subscriber} has subscribed to notifications.")
+20. energy_report / runtime_report / motion_report [--room/--floor/--type] [--period] [--top]
+    Show the top devices by energy (Wh), runtime (h) or motion events.
+    Periods: hour, day, week, month, year.
+    Example: energy_report --floor 2 --period week --top 10
+
+21. battery_history <device_name> [--resolution minute/hour/day] [--period]
+    Show how the battery level of the device changed.
+    Example: battery_history Arlo Spotlight Cam --resolution hour --period day
+
+22. set_motion_rate <camera> --<rate> / camera_events <camera> [--limit]
+    Set the motion probability per tick (0-1) for a camera, or show its recent motion, segment and recording events.
+    Example: set_motion_rate Arlo Spotlight Cam --0.2
+
+23. <command> --type/--room/--floor/--status/--battery/--name <value> [--<args>]
+    Run a device command for every matching device at once with a single summary notification.
+    Battery: <20, >=80 (a plain number means "at most"). Name: a pattern such as "Hue*".
+    Example: turn_off --type Light --floor 2
+    Example: charge --battery <20
+
+24. checkpoint
+    Save a snapshot of the whole house (devices, schedules, circuits, rules) to restore it on the next start.
+
+25. stats [--on/--off/--reset] / export_stats [--<file>]
+    Profile commands, notifications, battery updates, background loop lag and lock waits.
+    Export writes the numbers in Prometheus text format (SmartHome.prom by default).
+    Example: stats --on
+
+26. add_rule <name> --<when> --<command> [--<args>] / remove_rule <name> / rules
+    Run a command automatically when a condition becomes true or an event happens.
+    When: motion in <room>, motion on floor <n>, <Type>.<attribute> <op> <value> [in <room>] [on floor <n>],
+          power <op> <watts>; join several with "and". Attributes: status, mode, temperature, brightness,
+          color, recording, charging, priority, location, floor.
+    Example: add_rule Hall lights --motion in Hall --turn_on --type Light --floor 1
+    Example: add_rule Save power --Thermostat.mode == Heating and power > 3000 --change_brightness --type Light --20
+
+27. climate_report [--room/--floor] / set_outdoor <temperature> / set_room_climate <room> [--floor] [--mass] [--loss]
+    Show room temperatures, thermostat targets and actual power draw, or change the simulation:
+    outdoor temperature (°C), thermal mass of a room (kJ/K) and its heat loss (W/K).
+    Example: set_room_climate Kitchen --floor 1 --mass 3000 --loss 150
+
+28. help
+    Display this help message with all available commands.
+
+29. quit
+    Exit the program.
+'''
+        echo(help_message)
 
-    def send_notification(self, message):
-        for subscriber in self.subscribers:
-            print(f"Notification to {subscriber}: {message}")
-            self.home.log_event(f"User '{subscriber}' got message: {message}")
@@ -0,0 +1,268 @@
+"""Снимок состояния SmartHome в компактном двоичном формате и журнал изменений между снимками.
+
+Формат снимка (little-endian):
+    заголовок   HEADER: magic, версия, число устройств, число заданий, смещение таблицы строк, длина meta
+    устройства  RECORD * число устройств — записи фиксированного размера, i-я лежит по смещению
+                HEADER.size + i * RECORD.size, поэтому файл читается через mmap без разбора целиком
+    задания     JOB * число заданий
+    meta        JSON: цепи питания
+    строки      таблица строк: uint32 число строк, затем uint16 длина + utf-8 для каждой строки
+"""
+from datetime import datetime
+import json
+import mmap
+import os
+import struct
+import threading
+
+from smart_device import *
+from scheduler import IntervalRule
+
+MAGIC = b"SHSN"
+VERSION = 2
+HEADER = struct.Struct("<4sHIIQI")
+# тип, имя, мощность, связь, вкл, заряд, зарядка, флаг низкого заряда, этаж, комната, расписание,
+# приоритет, есть ли приоритет, яркость, цвет, температура, режим, запись
+RECORD = struct.Struct("<BIIBBdBBiiiqBBibBB")
+# устройство, действие, аргументы (JSON), правило, начало интервала, следующий запуск
+JOB = struct.Struct("<IIIIdd")
+DEVICE_TYPES = (Light, Thermostat, Camera)
+NONE = -1
+NO_FLOOR = FLOORS.start - 1   # -1 — обычный этаж (подвал), поэтому у этажа своя метка
+
+
+class _Strings:
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def id(self, value):
+        if value is None:
+            return NONE
+        if value not in self.ids:
+            self.ids[value] = len(self.values)
+            self.values.append(value)
+        return self.ids[value]
+
+    def pack(self):
+        parts = [struct.pack("<I", len(self.values))]
+        for value in self.values:
+            data = value.encode("utf-8")
+            parts.append(struct.pack("<H", len(data)) + data)
+        return b"".join(parts)
+
+
+def _unpack_strings(buffer, offset):
+    (count,) = struct.unpack_from("<I", buffer, offset)
+    offset += 4
+    values = []
+    for _ in range(count):
+        (length,) = struct.unpack_from("<H", buffer, offset)
+        offset += 2
+        values.append(bytes(buffer[offset:offset + length]).decode("utf-8"))
+        offset += length
+    return values
+
+
+def pack_device(device, strings):
+    extra = {"brightness": 0, "color": NONE, "temperature": 0, "mode": 0, "recording": 0}
+    if isinstance(device, Light):
+        extra.update(brightness=device.brightness, color=strings.id(device.color))
+    elif isinstance(device, Thermostat):
+        extra.update(temperature=device.temperature, mode=MODES.index(device.mode))
+    elif isinstance(device, Camera):
+        extra.update(recording=device._is_recording)
+    return RECORD.pack(
+        DEVICE_TYPES.index(type(device)), strings.id(device.device_name), device.power_consumption,
+        CONNECTIONS.index(device.network_connection), device._status == "On", float(device._battery_level),
+        device._is_charging, device._low_battery_notified,
+        NO_FLOOR if device._floor_number is None else device._floor_number,
+        strings.id(device._location), strings.id(device._schedule),
+        device._priority or 0, device._priority is not None,
+        extra["brightness"], extra["color"], extra["temperature"], extra["mode"], extra["recording"])
+
+
+def unpack_device(buffer, offset, strings):
+    (type_code, name, power, connection, on, level, charging, low_notified, floor, location, schedule,
+     priority, has_priority, brightness, color, temperature, mode, recording) = RECORD.unpack_from(buffer, offset)
+    device = DEVICE_TYPES[type_code](strings[name], power, CONNECTIONS[connection])
+    device._status = "On" if on else "Off"
+    device._battery_level = level
+    device._is_charging = bool(charging)
+    device._low_battery_notified = bool(low_notified)
+    device._floor = None if floor == NO_FLOOR else floor
+    device._location = None if location == NONE else strings[location]
+    device._schedule = None if schedule == NONE else strings[schedule]
+    device._priority = priority if has_priority else None
+    if isinstance(device, Light):
+        device.brightness = brightness
+        device.color = None if color == NONE else strings[color]
+    elif isinstance(device, Thermostat):
+        device.temperature = temperature
+        device.mode = MODES[mode]
+    elif isinstance(device, Camera):
+        device._is_recording = bool(recording)
+    return device
+
+
+def encode_device(device):
+    """Одно устройство в виде записи RECORD со своей таблицей строк — для журнала."""
+    strings = _Strings()
+    record = pack_device(device, strings)
+    return record + strings.pack()
+
+
+def decode_device(data):
+    try:
+        return unpack_device(data, 0, _unpack_strings(data, RECORD.size))
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"Damaged device record: {e}") from None
+
+
+def write_snapshot(filename, devices, jobs, meta):
+    """Пишет снимок во временный файл и атомарно подменяет им старый."""
+    strings = _Strings()
+    index = {device: number for number, device in enumerate(devices)}
+    records = b"".join(pack_device(device, strings) for device in devices)
+    job_records = []
+    for job in jobs:
+        if job.device not in index:
+            continue
+        start = job.rule.start.timestamp() if isinstance(job.rule, IntervalRule) else 0.0
+        job_records.append(JOB.pack(index[job.device], strings.id(job.action), strings.id(json.dumps(job.args)),
+                                    strings.id(str(job.rule)), start, job.when.timestamp()))
+    meta = json.dumps(meta).encode("utf-8")
+    strings_offset = HEADER.size + len(records) + len(job_records) * JOB.size + len(meta)
+
+    temporary = f"{filename}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(devices), len(job_records), strings_offset, len(meta)))
+        file.write(records)
+        file.write(b"".join(job_records))
+        file.write(meta)
+        file.write(strings.pack())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, filename)
+
+
+def read_snapshot(filename):
+    """Читает снимок через mmap. Возвращает (устройства, задания, meta) или None, если файла нет.
+
+    Чужой, старый или повреждённый файл — ValueError.
+    """
+    if not os.path.exists(filename) or os.path.getsize(filename) < HEADER.size:
+        return None
+    try:
+        return _read_snapshot(filename)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"{filename} is damaged: {e}") from None
+
+
+def _read_snapshot(filename):
+    with open(filename, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        magic, version, device_count, job_count, strings_offset, meta_length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a SmartHome snapshot")
+        if version != VERSION:
+            raise ValueError(f"{filename} is a version {version} snapshot, this build reads version {VERSION}")
+        strings = _unpack_strings(buffer, strings_offset)
+        devices = [unpack_device(buffer, HEADER.size + number * RECORD.size, strings)
+                   for number in range(device_count)]
+
+        jobs = []
+        offset = HEADER.size + device_count * RECORD.size
+        for _ in range(job_count):
+            device, action, args, rule, start, when = JOB.unpack_from(buffer, offset)
+            offset += JOB.size
+            jobs.append((devices[device], strings[action], json.loads(strings[args]), strings[rule],
+                         datetime.fromtimestamp(start) if start else None, datetime.fromtimestamp(when)))
+        meta = json.loads(bytes(buffer[offset:offset + meta_length]).decode("utf-8"))
+    return devices, jobs, meta
+
+
+class Journal:
+    """Журнал изменений после последнего снимка: записи фиксированного вида, только дописываются в конец.
+
+    Запись: uint32 длина, затем код операции и значения в виде "тег + данные".
+    """
+
+    SET, ADD, REMOVE, SCHEDULE, UNSCHEDULE, CIRCUIT, RULE, UNRULE, MANIFEST, CLIMATE = range(10)
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.__file = open(filename, "ab")
+        self.__lock = threading.Lock()
+
+    def append(self, operation, *values):
+        payload = bytes([operation]) + b"".join(_pack_value(value) for value in values)
+        with self.__lock:
+            self.__file.write(struct.pack("<I", len(payload)) + payload)
+            self.__file.flush()
+
+    def truncate(self):
+        with self.__lock:
+            self.__file.truncate(0)
+            self.__file.seek(0)
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+    @staticmethod
+    def read(filename):
+        """Возвращает записи журнала [(операция, значения)], оборванную последнюю запись пропускает."""
+        if not os.path.exists(filename):
+            return []
+        with open(filename, "rb") as file:
+            data = file.read()
+        entries = []
+        offset = 0
+        while offset + 4 <= len(data):
+            (length,) = struct.unpack_from("<I", data, offset)
+            payload = data[offset + 4:offset + 4 + length]
+            if len(payload) < length:
+                break
+            offset += 4 + length
+            values = []
+            position = 1
+            try:
+                while position < len(payload):
+                    value, position = _unpack_value(payload, position)
+                    values.append(value)
+            except (struct.error, UnicodeDecodeError) as e:
+                raise ValueError(f"{filename} is damaged: {e}") from None
+            entries.append((payload[0], values))
+        return entries
+
+
+def _pack_value(value):
+    if value is None:
+        return b"N"
+    if value is True or value is False:
+        return b"T" if value else b"F"
+    if isinstance(value, int):
+        return b"i" + struct.pack("<q", value)
+    if isinstance(value, float):
+        return b"d" + struct.pack("<d", value)
+    if isinstance(value, bytes):
+        return b"b" + struct.pack("<I", len(value)) + value
+    data = str(value).encode("utf-8")
+    return b"s" + struct.pack("<I", len(data)) + data
+
+
+def _unpack_value(payload, position):
+    tag = payload[position:position + 1]
+    position += 1
+    if tag == b"N":
+        return None, position
+    if tag in (b"T", b"F"):
+        return tag == b"T", position
+    if tag == b"i":
+        return struct.unpack_from("<q", payload, position)[0], position + 8
+    if tag == b"d":
+        return struct.unpack_from("<d", payload, position)[0], position + 8
+    (length,) = struct.unpack_from("<I", payload, position)
+    position += 4
+    data = payload[position:position + length]
+    return (bytes(data) if tag == b"b" else data.decode("utf-8")), position + length
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+import itertools
+import threading
+
+from smart_device import format_floor
+
+
+class _Entry:
+    __slots__ = ("version", "battery", "data", "line")
+
+    def __init__(self, version, battery, data, line):
+        self.version = version
+        self.battery = battery
+        self.data = data
+        self.line = line
+
+
+class StatusCache:
+    """Кэш состояния устройств для status_report и status-запросов сервера.
+
+    Запись устройства (dict и строка отчёта) собирается один раз и сбрасывается только при его
+    изменении. Каждое изменение получает номер версии, поэтому diff(since) отдаёт лишь то, что
+    изменилось после указанной версии. Заряд батареи меняется каждый тик без событий, поэтому он
+    сверяется при чтении и обновляет запись, только если ушёл от сохранённого на battery_step процентов.
+    """
+
+    def __init__(self, registry, battery_step=1.0, max_removed=10000, inventory=None):
+        self.registry = registry
+        self.inventory = inventory
+        self.battery_step = battery_step
+        self.max_removed = max_removed
+        self.__entries = {}
+        self.__changed = OrderedDict()   # устройство -> версия последнего изменения, по возрастанию версий
+        self.__removed = OrderedDict()   # имя -> версия удаления
+        self.__horizon = 0               # изменения до этой версии уже забыты — diff от неё отдаёт всё
+        self.__versions = itertools.count(1)
+        self.__version = 0
+        self.__lock = threading.RLock()
+
+    @property
+    def version(self):
+        return self.__version
+
+    def invalidate(self, device):
+        with self.__lock:
+            self.__entries.pop(device, None)
+            self.__touch(device)
+
+    def forget(self, device):
+        with self.__lock:
+            self.__entries.pop(device, None)
+            self.__changed.pop(device, None)
+            self.forget_name(device.device_name)
+
+    def forget_name(self, device_name):
+        """Удаление устройства, у которого нет объекта (из инвентаря) — попадает только в diff."""
+        with self.__lock:
+            self.__version = next(self.__versions)
+            self.__removed[device_name] = self.__version
+            self.__removed.move_to_end(device_name)
+            while len(self.__removed) > self.max_removed:
+                _, version = self.__removed.popitem(last=False)
+                self.__horizon = version
+
+    def status(self, device):
+        return self.__entry(device).data
+
+    def line(self, device):
+        return self.__entry(device).line
+
+    def report(self, devices=None, page=1, per_page=50, pending=()):
+        """Страница отчёта: (записи dict, всего устройств, число страниц).
+
+        pending — номера ещё не созданных устройств инвентаря, они идут после devices.
+        """
+        devices = self.registry.snapshot() if devices is None else devices
+        total = len(devices) + len(pending)
+        pages = max(1, -(-total // per_page))
+        start = (page - 1) * per_page
+        rows = [self.status(device) for device in devices[start:start + per_page]]
+        start = max(0, start - len(devices))
+        rows += [self.inventory.status(position) for position in pending[start:start + per_page - len(rows)]]
+        return rows, total, pages
+
+    def summary(self, devices=None, pending=()):
+        """Число устройств по статусу и типу, средний заряд по этажам."""
+        devices = self.registry.snapshot() if devices is None else devices
+        by_status, by_type, battery = {}, {}, {}
+        rows = itertools.chain(map(self.status, devices), map(self.inventory.status, pending) if pending else ())
+        for data in rows:
+            by_status[data["status"]] = by_status.get(data["status"], 0) + 1
+            by_type[data["type"]] = by_type.get(data["type"], 0) + 1
+            total, count = battery.get(data["floor"], (0, 0))
+            battery[data["floor"]] = (total + data["battery"], count + 1)
+        return {"version": self.__version, "total": len(devices) + len(pending), "by_status": by_status, "by_type": by_type,
+                "battery_by_floor": {floor: round(total / count, 1)
+                                     for floor, (total, count) in sorted(battery.items(), key=_floor_order)}}
+
+    def diff(self, since):
+        """Что изменилось после версии since: {"version", "full", "changed", "removed"}.
+
+        full=True — since старше хранимой истории удалений, и в changed лежат все устройства.
+        """
+        for device in self.registry.snapshot():
+            self.__entry(device)  # подтягиваем заряд батарей, ушедший дальше battery_step
+        with self.__lock:
+            if since < self.__horizon:
+                changed, removed, full = list(self.registry.snapshot()), [], True
+            else:
+                changed = []
+                for device, version in reversed(self.__changed.items()):
+                    if version <= since:
+                        break
+                    changed.append(device)
+                changed.reverse()
+                removed = [name for name, version in self.__removed.items() if version > since]
+                full = False
+            version = self.__version
+        changed = [self.status(device) for device in changed]
+        if (full or since == 0) and self.inventory is not None:
+            # Устройства инвентаря не менялись, но клиент без прошлой версии должен их увидеть
+            changed += [self.inventory.status(position) for position in self.inventory.select()]
+        return {"version": version, "full": full, "changed": changed, "removed": removed}
+
+    def __entry(self, device):
+        entry = self.__entries.get(device)
+        level = device._battery_level
+        if entry is not None and abs(entry.battery - level) < self.battery_step:
+            return entry
+        with self.__lock:
+            data = device.to_dict()
+            line = format_line(data)
+            if entry is not None or device not in self.__changed:
+                self.__touch(device)
+            entry = _Entry(self.__version, level, data, line)
+            if self.registry.get(device.device_name) is device:
+                self.__entries[device] = entry
+        return entry
+
+    def __touch(self, device):
+        self.__version = next(self.__versions)
+        self.__changed[device] = self.__version
+        self.__changed.move_to_end(device)
+
+
+def format_line(data):
+    """Строка status_report по записи статуса устройства."""
+    location = data["location"] or "Not Set"
+    floor = format_floor(data["floor"]) if data["floor"] is not None else "Not Set"
+    return (f"{data['name']} | {data['type']} | {data['status']} | {data['battery']:.0f}% | "
+            f"{location}, {floor}" + (" | charging" if data["charging"] else ""))
+
+
+def _floor_order(item):
+    return (item[0] is None, item[0] or 0)
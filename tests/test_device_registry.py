@@ -0,0 +1,31 @@
+from device_registry import DeviceRegistry
+from smart_device import Camera, Light
+
+
+def make_registry(*names):
+    registry = DeviceRegistry()
+    for name in names:
+        registry.add(Camera(name, 10, "WiFi"))
+    return registry
+
+
+def test_find_prefers_earliest_added_substring_match():
+    registry = make_registry("Camera", "Ambiance")
+    # "am" — середина слова у Camera и начало у Ambiance: выигрывает раньше добавленное
+    assert registry.find("am").device_name == "Camera"
+
+
+def test_find_keeps_order_after_remove_and_add():
+    registry = make_registry("Camera", "Ambiance")
+    registry.find("am")
+    registry.remove("Camera")
+    registry.add(Light("Camera", 5, "WiFi"))
+    assert registry.find("am").device_name == "Ambiance"
+    assert registry.find("mera").device_name == "Camera"
+
+
+def test_find_exact_name_and_misses():
+    registry = make_registry("Hall Camera", "Camera")
+    assert registry.find("CAMERA").device_name == "Camera"
+    assert registry.find("hall cam").device_name == "Hall Camera"
+    assert registry.find("garage") is None